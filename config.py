@@ -7,12 +7,49 @@ from flask import Flask
 
 WEB_ADDRESS = 'localhost'
 WEB_PORT = 5000
+# Utiliza o servidor assíncrono (asyncio) em vez do servidor threaded do Flask.
+ASYNC_SERVER = False
 PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
 TEMPLATES = os.path.join(PROJECT_ROOT, 'drone_app/templates')
 STATIC_FOLDER = os.path.join(PROJECT_ROOT, 'drone_app/static')
 SNAPSHOT_IMAGE_FOLDER = os.path.join(STATIC_FOLDER, 'img/snapshots')
+SNAPSHOT_TIMEOUT = 3
+# Assets compilados (python -m tools.build_assets): nomes com hash, pré-comprimidos e servidos em /assets/.
+ASSET_BUILD_FOLDER = os.path.join(STATIC_FOLDER, 'build')
+# Gravador de voo: comandos, respostas, patrulhamento e rastreamento em arquivo binário.
+FLIGHT_RECORDER = True
+FLIGHT_RECORDER_FOLDER = os.path.join(PROJECT_ROOT, 'data/flights')
+# Durações observadas dos comandos (modelo usado para prever tempos e timeouts).
+DURATION_MODEL_FILE = os.path.join(PROJECT_ROOT, 'data/command_durations.json')
+# Retransmissões de comandos idempotentes (consultas, "command", "speed"...) após o timeout adaptativo.
+COMMAND_RETRIES = 3
 DEBUG = True
 LOG_FILE = 'pytello.log'
+# Grava o log em LOG_FILE em vez da saída padrão.
+LOG_IN_FILE = False
+# Quantidade de processos para detecção de faces (0 executa na thread de vídeo).
+VISION_WORKERS = 0
+# Taxa de frames que o pipeline de vídeo deve sustentar; o governador reduz detecção, escala e qualidade do
+# JPEG para cumpri-la. None desativa a adaptação (o tempo por frame continua medido em /api/governor/).
+VIDEO_TARGET_FPS = 30
+# Tempo máximo (s) sem resultado da detecção durante o rastreamento; ao expirar envia "rc 0 0 0 0" (0 desativa).
+TRACKING_WATCHDOG_TIMEOUT = 1.0
+# Diferença média mínima (0 a 1) entre frames para executar a detecção (0 desativa).
+MOTION_GATE_THRESHOLD = 0.02
+# Endereço do processo broker do drone (ex: ('127.0.0.1', 6000)). None usa o drone no próprio processo.
+BROKER_ADDRESS = None
+# Aceita BROKER_ADDRESS TCP fora do loopback (as mensagens usam pickle: somente em rede confiável).
+BROKER_ALLOW_REMOTE = False
+# Chave do broker (variável de ambiente PYTELLO_BROKER_AUTHKEY). Sem ela, o broker gera uma chave a cada execução
+# em BROKER_AUTHKEY_FILE (permissão 0600), lida pelos workers.
+BROKER_AUTHKEY = os.environ.get('PYTELLO_BROKER_AUTHKEY', '').encode('utf-8') or None
+BROKER_AUTHKEY_FILE = os.path.join(PROJECT_ROOT, 'data/broker.key')
+# Nome da memória compartilhada com os frames JPEG publicados pelo broker.
+BROKER_FRAME_RING = 'pytello_frames'
+# Endereços autorizados a usar o profiler sob demanda (/admin/profile). None libera para todos.
+ADMIN_ADDRESSES = ('127.0.0.1', '::1')
+# Duração máxima de uma coleta do profiler (s).
+PROFILER_MAX_SECONDS = 60
 
 app = Flask(__name__, template_folder=TEMPLATES, static_folder=STATIC_FOLDER)
 app.debug = DEBUG
@@ -2,9 +2,11 @@
 """
 Módulo dos decorators de comandos do drone.
 """
-import time
+from drone_app.core.abstract_decorator import AbstractDecorator
+from drone_app.models.drone_manager import DEFAULT_DISTANCE
 
-from core.abstract_decorator import AbstractDecorator
+# Distância padrão dos movimentos em centímetros (comando SDK).
+DISTANCE = int(round(DEFAULT_DISTANCE * 100))
 
 
 class TestClockwiseDecorator(AbstractDecorator):
@@ -18,10 +20,10 @@ class TestClockwiseDecorator(AbstractDecorator):
         :return: self
         """
         self._drone_manager.clockwise(90).clockwise(90).clockwise(90).clockwise(90)
-        time.sleep(3)
+        self._wait(*['cw 90'] * 4)
         self._drone_manager.count_clockwise(90).count_clockwise(90).count_clockwise(90).count_clockwise(90)
-        time.sleep(3)
-        super().execute(args, kwargs)
+        self._wait(*['ccw 90'] * 4)
+        super().execute(*args, **kwargs)
         return self
 
 
@@ -36,14 +38,14 @@ class TestSidesDecorator(AbstractDecorator):
         :return: self
         """
         self._drone_manager.forward()
-        time.sleep(5)
+        self._wait(f'forward {DISTANCE}')
         self._drone_manager.right()
-        time.sleep(5)
+        self._wait(f'right {DISTANCE}')
         self._drone_manager.back()
-        time.sleep(5)
+        self._wait(f'back {DISTANCE}')
         self._drone_manager.left()
-        time.sleep(5)
-        super().execute(args, kwargs)
+        self._wait(f'left {DISTANCE}')
+        super().execute(*args, **kwargs)
         return self
 
 
@@ -57,13 +59,13 @@ class TestUpDownDecorator(AbstractDecorator):
         :param kwargs:
         :return: self
         """
-        self._drone_manager.set_speed(10)
-        time.sleep(1)
+        # Aguarda a resposta do speed: a previsão dos movimentos seguintes usa a velocidade corrente.
+        self._drone_manager.request('speed 10')
         self._drone_manager.up()
-        time.sleep(5)
+        self._wait(f'up {DISTANCE}')
         self._drone_manager.down()
-        time.sleep(5)
-        super().execute(args, kwargs)
+        self._wait(f'down {DISTANCE}')
+        super().execute(*args, **kwargs)
         return self
 
 
@@ -78,14 +80,14 @@ class TestFlipDecorator(AbstractDecorator):
         :return: self
         """
         self._drone_manager.flip_left()
-        time.sleep(3)
+        self._wait('flip l')
         self._drone_manager.flip_right()
-        time.sleep(3)
+        self._wait('flip r')
         self._drone_manager.flip_forward()
-        time.sleep(3)
+        self._wait('flip f')
         self._drone_manager.flip_back()
-        time.sleep(3)
-        super().execute(args, kwargs)
+        self._wait('flip b')
+        super().execute(*args, **kwargs)
         return self
 
 
@@ -100,7 +102,7 @@ class TestPatrolDecorator(AbstractDecorator):
         :return: self
         """
         self._drone_manager.patrol()
-        time.sleep(45)
+        self._sleep(45)
         self._drone_manager.stop_patrol()
-        super().execute(args, kwargs)
+        super().execute(*args, **kwargs)
         return self
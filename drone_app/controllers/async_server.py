@@ -0,0 +1,321 @@
+# coding=utf-8
+"""
+Módulo do Servidor Assíncrono.
+
+Serve as rotas mais acessadas do servidor Flask (``/``, ``/controller/``,
+``/api/command/``, ``/assets/`` e ``/video/streaming``) em um único event loop asyncio,
+além do canal de controle WebSocket (``/ws/control``). As demais rotas do Flask
+(snapshots, galeria, estatísticas, profiler...) são atendidas pela aplicação
+WSGI em uma thread do executor, de modo que os dois modos expõem a mesma API.
+Cada espectador de vídeo é uma corrotina (e não uma thread), os frames
+multipart são enviados com escrita vetorizada (``writelines``) sem concatenar
+o JPEG e a desconexão do cliente encerra o envio imediatamente.
+"""
+import asyncio
+import io
+import json
+import logging
+import mimetypes
+import os
+import sys
+from collections import namedtuple
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs, urlencode, unquote_to_bytes
+
+from flask import render_template
+
+import config
+from drone_app.controllers.control_channel import ControlChannel
+from drone_app.controllers.server import execute_command, execute_command_batch, get_broadcaster, FRAME_HEADER, \
+    FRAME_TRAILER
+from drone_app.core.assets import AssetManifest, ASSETS_PATH, not_modified
+from drone_app.core.telemetry import TelemetryHub
+from drone_app.core.websocket import handshake_response
+
+logger = logging.getLogger(__name__)
+app = config.app
+
+Request = namedtuple('Request', 'method path query headers body')
+Request.__doc__ = """ Requisição HTTP recebida pelo servidor assíncrono. """
+
+MAX_HEADERS = 100
+
+
+class AsyncDroneServer:
+    """ Classe do servidor HTTP assíncrono. """
+
+    def __init__(self, host=config.WEB_ADDRESS, port=config.WEB_PORT):
+        self._host = host
+        self._port = port
+        self._server = None
+        self._routes = {
+            ('GET', '/'): self.index,
+            ('GET', '/controller/'): self.controller,
+            ('POST', '/api/command/'): self.command,
+            ('POST', '/api/commands/'): self.command_batch,
+            ('GET', '/video/streaming'): self.video_streaming,
+            ('GET', '/ws/control'): self.control,
+            ('GET', '/api/telemetry/'): self.telemetry,
+            ('GET', '/api/telemetry/stream'): self.telemetry_stream,
+        }
+
+    def route(self, method, path, handler):
+        """ Registra uma rota: handler(request, reader, writer) -> bool (manter conexão). """
+        self._routes[(method, path)] = handler
+        return self
+
+    # Protocolo HTTP
+
+    @staticmethod
+    async def _read_request(reader):
+        """ Lê uma requisição HTTP/1.1 (None quando o cliente fecha a conexão). """
+        line = await reader.readline()
+        if not line:
+            return None
+        method, target, _ = line.decode('latin-1').split(' ', 2)
+        headers = {}
+        for _ in range(MAX_HEADERS):
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length', 0) or 0)
+        body = await reader.readexactly(length) if length else b''
+        url = urlsplit(target)
+        return Request(method.upper(), url.path, parse_qs(url.query), headers, body)
+
+    @staticmethod
+    def _head(status, content_type=None, length=None, extra=None, keep_alive=True):
+        """ Monta o cabeçalho da resposta. """
+        status = HTTPStatus(status)
+        lines = [f'HTTP/1.1 {status.value} {status.phrase}']
+        if content_type:
+            lines.append(f'Content-Type: {content_type}')
+        if length is not None:
+            lines.append(f'Content-Length: {length}')
+        lines.extend(f'{k}: {v}' for k, v in (extra or {}).items())
+        lines.append(f'Connection: {"keep-alive" if keep_alive else "close"}')
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    async def _respond(self, writer, status, body=b'', content_type='text/plain; charset=utf-8', extra=None):
+        writer.writelines((self._head(status, content_type, len(body), extra), body))
+        await writer.drain()
+        return True
+
+    async def _json(self, writer, payload, status=200):
+        return await self._respond(writer, status, json.dumps(payload).encode('utf-8'), 'application/json')
+
+    async def _handle(self, reader, writer):
+        """ Atende uma conexão (keep-alive) até o cliente desconectar. """
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                handler = self._routes.get((request.method, request.path))
+                if handler is None and request.method == 'GET' and request.path.startswith('/static/'):
+                    handler = self.static
+                if handler is None and request.method == 'GET' and request.path.startswith(ASSETS_PATH):
+                    handler = self.asset
+                if handler is None:
+                    handler = self.wsgi
+                keep_alive = await handler(request, reader, writer)
+                if not keep_alive or request.headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError) as ex:
+            logger.debug({'action': 'async_server', 'ex': ex})
+        finally:
+            writer.close()
+
+    # Rotas
+
+    async def _render(self, writer, template):
+        with app.app_context():
+            html = render_template(template)
+        return await self._respond(writer, 200, html.encode('utf-8'), 'text/html; charset=utf-8')
+
+    async def index(self, request, reader, writer):
+        """ View para o index. """
+        return await self._render(writer, 'index.html')
+
+    async def controller(self, request, reader, writer):
+        """ View para retornar a página de controles do Drone. """
+        return await self._render(writer, 'controller.html')
+
+    async def command(self, request, reader, writer):
+        """ View para executar comando do Drone (em uma thread do executor). """
+        form = {k: v[0] for k, v in parse_qs(request.body.decode('utf-8')).items()}
+        loop = asyncio.get_running_loop()
+        payload, status = await loop.run_in_executor(None, execute_command, form.get('command'), form)
+        return await self._json(writer, payload, status)
+
+    async def command_batch(self, request, reader, writer):
+        """ View para executar uma lista de comandos em uma única requisição. """
+        try:
+            data = json.loads(request.body.decode('utf-8'))
+        except ValueError:
+            data = None
+        loop = asyncio.get_running_loop()
+        payload, status = await loop.run_in_executor(None, execute_command_batch, data)
+        return await self._json(writer, payload, status)
+
+    async def control(self, request, reader, writer):
+        """ Canal de controle via WebSocket (baixa latência para o manche). """
+        key = request.headers.get('sec-websocket-key')
+        if request.headers.get('upgrade', '').lower() != 'websocket' or not key:
+            return await self._respond(writer, 400, b'WebSocket upgrade required')
+        writer.write(handshake_response(key))
+        await writer.drain()
+        await ControlChannel(reader, writer).run()
+        return False
+
+    async def telemetry(self, request, reader, writer):
+        """ View para retornar o último estado conhecido do drone. """
+        return await self._json(writer, TelemetryHub().snapshot())
+
+    async def telemetry_stream(self, request, reader, writer):
+        """ View de Server-Sent Events com os campos alterados, na taxa pedida (?rate=eventos/s). """
+        try:
+            rate = float(request.query.get('rate', ['1'])[0])
+        except ValueError:
+            rate = 1.0
+        subscription = TelemetryHub().subscribe(rate)
+        writer.write(self._head(200, 'text/event-stream', extra={'Cache-Control': 'no-cache'}, keep_alive=False))
+        disconnected = asyncio.ensure_future(reader.read())
+        try:
+            while not disconnected.done():
+                event = subscription.next_event()
+                if event:
+                    writer.write(event)
+                    await writer.drain()
+                await asyncio.wait({disconnected}, timeout=subscription.interval)
+        finally:
+            disconnected.cancel()
+        return False
+
+    async def static(self, request, reader, writer):
+        """ Arquivos estáticos enviados com sendfile. """
+        root = os.path.realpath(config.STATIC_FOLDER)
+        file_path = os.path.realpath(os.path.join(root, request.path[len('/static/'):]))
+        if not file_path.startswith(root + os.sep) or not os.path.isfile(file_path):
+            return await self._respond(writer, 404, b'Not Found')
+        content_type = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+        with open(file_path, 'rb') as f:
+            writer.write(self._head(200, content_type, os.fstat(f.fileno()).st_size))
+            await writer.drain()
+            await asyncio.get_running_loop().sendfile(writer.transport, f)
+        return True
+
+    async def asset(self, request, reader, writer):
+        """ Assets compilados: pré-comprimidos, cache imutável, ETag/304 e sendfile. """
+        manifest = AssetManifest()
+        entry = manifest.lookup(request.path[len(ASSETS_PATH):])
+        if entry is None:
+            return await self._respond(writer, 404, b'Not Found')
+        path, encoding, etag = manifest.select(entry, request.headers.get('accept-encoding'))
+        headers = manifest.headers(entry, encoding, etag)
+        if not_modified(request.headers.get('if-none-match'), etag):
+            writer.write(self._head(304, extra=headers))
+            await writer.drain()
+            return True
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            return await self._respond(writer, 404, b'Not Found')
+        with f:
+            writer.write(self._head(200, entry.mimetype, os.fstat(f.fileno()).st_size, headers))
+            await writer.drain()
+            await asyncio.get_running_loop().sendfile(writer.transport, f)
+        return True
+
+    def _environ(self, request, writer):
+        """ Ambiente WSGI da requisição. """
+        peer = writer.get_extra_info('peername') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': request.method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote_to_bytes(request.path).decode('latin-1'),
+            'QUERY_STRING': urlencode(request.query, doseq=True),
+            'SERVER_NAME': str(self._host),
+            'SERVER_PORT': str(self._port),
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': peer[0],
+            'CONTENT_TYPE': request.headers.get('content-type', ''),
+            'CONTENT_LENGTH': str(len(request.body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(request.body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in request.headers.items():
+            if name not in ('content-type', 'content-length'):
+                environ['HTTP_' + name.upper().replace('-', '_')] = value
+        return environ
+
+    @staticmethod
+    def _call_wsgi(environ):
+        """ Executa a aplicação Flask (no executor) e retorna (status, cabeçalhos, corpo). """
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'], response['headers'] = status, headers
+
+        result = app(environ, start_response)
+        try:
+            body = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return response['status'], response['headers'], body
+
+    async def wsgi(self, request, reader, writer):
+        """ Demais rotas do Flask, executadas em uma thread do executor. """
+        loop = asyncio.get_running_loop()
+        status, headers, body = await loop.run_in_executor(None, self._call_wsgi, self._environ(request, writer))
+        headers = [(k, v) for k, v in headers if k.lower() != 'connection']
+        if not any(k.lower() == 'content-length' for k, _ in headers):
+            headers.append(('Content-Length', str(len(body))))
+        lines = [f'HTTP/1.1 {status}'] + [f'{k}: {v}' for k, v in headers] + ['Connection: keep-alive']
+        writer.writelines((('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'), body))
+        await writer.drain()
+        return True
+
+    async def video_streaming(self, request, reader, writer):
+        """ View para retornar a imagem recuperada do Drone. """
+        loop = asyncio.get_running_loop()
+        broadcaster = get_broadcaster()
+        writer.write(self._head(200, 'multipart/x-mixed-replace; boundary=frame', keep_alive=False))
+        # Termina quando o cliente fecha a conexão, mesmo sem frames novos.
+        disconnected = asyncio.ensure_future(reader.read())
+        seq = 0
+        try:
+            while True:
+                frame = asyncio.ensure_future(broadcaster.wait_async(loop, seq))
+                done, _ = await asyncio.wait({frame, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if disconnected in done:
+                    frame.cancel()
+                    break
+                seq, jpeg = frame.result()
+                writer.writelines((FRAME_HEADER, jpeg, FRAME_TRAILER))
+                await writer.drain()
+        finally:
+            disconnected.cancel()
+        return False
+
+    # Execução
+
+    async def serve(self):
+        """ Inicia o servidor e atende até ser cancelado. """
+        self._server = await asyncio.start_server(self._handle, self._host, self._port)
+        logger.info({'action': 'async_server', 'address': f'{self._host}:{self._port}'})
+        async with self._server:
+            await self._server.serve_forever()
+
+
+def run_async():
+    """ Método para inicializar a aplicação no servidor assíncrono. """
+    asyncio.run(AsyncDroneServer().serve())
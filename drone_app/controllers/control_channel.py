@@ -0,0 +1,135 @@
+# coding=utf-8
+"""
+Módulo do Canal de Controle via WebSocket.
+
+Mensagens compactas em JSON, sempre com o número de sequência ``s``:
+    {"s": 10, "rc": [esquerda/direita, frente/trás, cima/baixo, guinada]}
+    {"s": 11, "c": "takeOff"}
+    {"s": 12, "c": "speed", "speed": 50}
+Cada mensagem recebe a confirmação {"a": s}. Mensagens com sequência antiga
+são descartadas ({"a": s, "d": 1}) e valores de manche acumulados entre dois
+envios são substituídos pelos mais recentes.
+"""
+import asyncio
+import json
+import logging
+import time
+
+from drone_app.controllers.server import execute_command, get_drone
+from drone_app.core.websocket import read_message, encode_frame, WebSocketClosed, OP_TEXT
+
+logger = logging.getLogger(__name__)
+
+RC_LIMIT = 100
+
+
+class ControlChannel:
+    """ Classe para uma conexão do canal de controle. """
+
+    def __init__(self, reader, writer, rc_interval=0.02, drone_factory=None):
+        self._reader = reader
+        self._writer = writer
+        self._rc_interval = rc_interval
+        self._drone_factory = drone_factory or (lambda: get_drone(video=True))
+        self._last_seq = 0
+        self._rc_pending = None
+        self._rc_event = asyncio.Event()
+        self._rc_last_sent = 0.0
+        self._stats = {'received': 0, 'dropped': 0, 'rc_sent': 0, 'rc_coalesced': 0}
+
+    @property
+    def stats(self):
+        """ Expõe as estatísticas do canal. """
+        return dict(self._stats)
+
+    def _send(self, payload):
+        self._writer.write(encode_frame(OP_TEXT, json.dumps(payload, separators=(',', ':')).encode('utf-8')))
+
+    @staticmethod
+    def _rc_values(values):
+        """ Valida os valores do manche. """
+        if not isinstance(values, list) or len(values) != 4:
+            raise ValueError('rc espera 4 valores.')
+        return tuple(max(-RC_LIMIT, min(RC_LIMIT, int(v))) for v in values)
+
+    def _rc(self, values):
+        """ Envia o manche ao drone (bloqueante: com o broker é uma ida e volta de IPC). """
+        self._drone_factory().rc(*values)
+
+    async def _rc_sender(self):
+        """
+        Envia ao drone somente o valor mais recente do manche, respeitando o intervalo mínimo.
+        O envio roda no executor para não bloquear o event loop.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._rc_event.wait()
+            wait = self._rc_interval - (time.monotonic() - self._rc_last_sent)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._rc_event.clear()
+            values, self._rc_pending = self._rc_pending, None
+            if values is None:
+                continue
+            await loop.run_in_executor(None, self._rc, values)
+            self._rc_last_sent = time.monotonic()
+            self._stats['rc_sent'] += 1
+
+    async def _command(self, seq, message):
+        """ Executa um comando discreto sem bloquear o canal. """
+        loop = asyncio.get_running_loop()
+        try:
+            payload, status = await loop.run_in_executor(None, execute_command, message['c'], message)
+            self._send({'a': seq, 'r': payload.get('status'), 'x': status})
+        except Exception as ex:
+            logger.error({'action': 'control_channel', 'seq': seq, 'ex': ex})
+            self._send({'a': seq, 'e': str(ex)})
+
+    def _dispatch(self, message):
+        """ Trata uma mensagem recebida. """
+        seq = int(message.get('s', 0))
+        self._stats['received'] += 1
+        if seq <= self._last_seq:
+            # Entrada antiga: uma mais nova já foi aplicada.
+            self._stats['dropped'] += 1
+            self._send({'a': seq, 'd': 1})
+            return None
+        self._last_seq = seq
+        if 'rc' in message:
+            if self._rc_pending is not None:
+                self._stats['rc_coalesced'] += 1
+            self._rc_pending = self._rc_values(message['rc'])
+            self._rc_event.set()
+            self._send({'a': seq})
+            return None
+        if 'c' in message:
+            return asyncio.ensure_future(self._command(seq, message))
+        self._send({'a': seq, 'e': 'mensagem desconhecida'})
+        return None
+
+    async def run(self):
+        """ Atende o canal até o cliente desconectar. """
+        sender = asyncio.ensure_future(self._rc_sender())
+        tasks = set()
+        try:
+            while True:
+                try:
+                    _, payload = await read_message(self._reader, self._writer)
+                    message = json.loads(payload.decode('utf-8'))
+                    if not isinstance(message, dict):
+                        raise ValueError('mensagem deve ser um objeto')
+                    task = self._dispatch(message)
+                    if task:
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+                except (ValueError, TypeError, KeyError) as ex:
+                    self._send({'e': str(ex)})
+                await self._writer.drain()
+        except (WebSocketClosed, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            sender.cancel()
+            # Ao desconectar o drone não continua com o último valor do manche.
+            if self._rc_last_sent:
+                await asyncio.get_running_loop().run_in_executor(None, self._rc, (0, 0, 0, 0))
+            logger.info({'action': 'control_channel', 'stats': self._stats})
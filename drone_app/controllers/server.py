@@ -3,10 +3,21 @@
 Server Módulo
 """
 import logging
+import os
+import time
 
 from flask import render_template, request, jsonify, Response
+from werkzeug.wsgi import wrap_file
 
 import config
+from drone_app.core.assets import AssetManifest, not_modified
+from drone_app.core.broadcaster import FrameBroadcaster
+from drone_app.core.profiler import SamplingProfiler, ProfilerBusyError
+from drone_app.core.sigleton import Singleton
+from drone_app.core.snapshot_store import SnapshotStore
+from drone_app.core.telemetry import TelemetryHub
+from drone_app.models.broker import BrokerClient
+from drone_app.models.commands import validate_batch, execute_batch
 from drone_app.models.drone_manager import TelloDrone, BasicPatrolMiddleware, StreamTelloDrone
 
 logger = logging.getLogger(__name__)
@@ -14,12 +25,42 @@ app = config.app
 
 
 def get_drone(video=False):
-    """ Recupera o Drone Manager. """
+    """ Recupera o Drone Manager (ou o cliente do broker, quando configurado). """
+    if config.BROKER_ADDRESS:
+        return BrokerClient()
     if video:
         return StreamTelloDrone(patrol_middleware=BasicPatrolMiddleware())
     return TelloDrone(patrol_middleware=BasicPatrolMiddleware())
 
 
+@app.template_global()
+def asset_url(name):
+    """ URL do asset para os templates (versão compilada quando existir). """
+    return AssetManifest().url(name)
+
+
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    """ View dos assets compilados: pré-comprimidos, cache imutável, ETag/304 e envio pelo file_wrapper. """
+    manifest = AssetManifest()
+    entry = manifest.lookup(filename)
+    if entry is None:
+        return Response('', status=404)
+    path, encoding, etag = manifest.select(entry, request.headers.get('Accept-Encoding'))
+    headers = manifest.headers(entry, encoding, etag)
+    if not_modified(request.headers.get('If-None-Match'), etag):
+        return Response(status=304, headers=headers)
+    try:
+        f = open(path, 'rb')
+    except OSError:
+        return Response('', status=404)
+    # wsgi.file_wrapper: o servidor WSGI (ex: gunicorn) envia o arquivo com sendfile, sem copiar para o Python.
+    response = Response(wrap_file(request.environ, f), mimetype=entry.mimetype, headers=headers,
+                        direct_passthrough=True)
+    response.content_length = os.fstat(f.fileno()).st_size
+    return response
+
+
 @app.route('/')
 def index():
     """ View para o index. """
@@ -32,57 +73,245 @@ def controller():
     return render_template('controller.html')
 
 
-@app.route('/api/command/', methods=['POST'])
-def command():
-    """ View para executar comando do Drone. """
-    cmd = request.form.get('command')
+COMMAND_METHODS = {
+    'takeOff': 'takeoff',
+    'land': 'land',
+    'up': 'up',
+    'down': 'down',
+    'forward': 'forward',
+    'back': 'back',
+    'clockwise': 'clockwise',
+    'counterClockwise': 'count_clockwise',
+    'left': 'left',
+    'right': 'right',
+    'flipFront': 'flip_forward',
+    'flipBack': 'flip_back',
+    'flipLeft': 'flip_left',
+    'flipRight': 'flip_right',
+    'patrol': 'patrol',
+    'stopPatrol': 'stop_patrol',
+    'faceDetectAndTrack': 'enable_face_detect',
+    'stopFaceDetectAndTrack': 'disable_face_detect',
+}
+
+
+def execute_command(cmd, params):
+    """
+    Executa um comando do Drone.
+    :param cmd: nome do comando.
+    :param params: dict com os parâmetros do formulário.
+    :return: tupla (dict da resposta, status HTTP).
+    """
     logger.info({'action': 'command', 'cmd': cmd})
     drone = get_drone(video=True)
-    drone_command = {
-        'takeOff': drone.takeoff,
-        'land': drone.land,
-        'up': drone.up,
-        'down': drone.down,
-        'forward': drone.forward,
-        'back': drone.back,
-        'clockwise': drone.clockwise,
-        'counterClockwise': drone.count_clockwise,
-        'left': drone.left,
-        'right': drone.right,
-        'flipFront': drone.flip_forward,
-        'flipBack': drone.flip_back,
-        'flipLeft': drone.flip_left,
-        'flipRight': drone.flip_right,
-        'patrol': drone.patrol,
-        'stopPatrol': drone.stop_patrol,
-        'faceDetectAndTrack': drone.enable_face_detect,
-        'stopFaceDetectAndTrack': drone.disable_face_detect,
-    }.get(cmd)
+    method = COMMAND_METHODS.get(cmd)
+    drone_command = getattr(drone, method) if method else None
     if cmd == 'speed':
-        speed = request.form.get('speed')
+        speed = params.get('speed')
         logger.info({'action': 'command', 'cmd': cmd, 'speed': speed})
         if speed:
             drone.set_speed(int(speed))
     elif cmd == 'snapshot':
-        if not drone.snapshot():
-            return jsonify(status='fail'), 400
+        # Aguarda apenas a requisição HTTP; a thread de vídeo não é bloqueada.
+        try:
+            result = drone.snapshot().result(timeout=config.SNAPSHOT_TIMEOUT)
+        except Exception as e:
+            logger.error({'action': 'command', 'cmd': cmd, 'exception': str(e)})
+            return {'status': 'fail'}, 400
+        return {'status': 'success', 'file': os.path.basename(result.path), 'digest': result.digest}, 200
     else:
         if drone_command:
             drone_command()
 
-    return jsonify(status='success'), 200
+    return {'status': 'success'}, 200
+
+
+@app.route('/api/command/', methods=['POST'])
+def command():
+    """ View para executar comando do Drone. """
+    payload, status = execute_command(request.form.get('command'), request.form)
+    return jsonify(**payload), status
+
+
+def execute_command_batch(data):
+    """
+    Valida e executa um lote de comandos do Tello SDK.
+    :param data: dict {'commands': [{'command': str, 'args': list|dict}], 'stop_on_error': bool}.
+    :return: tupla (dict da resposta, status HTTP).
+    """
+    if not isinstance(data, dict):
+        return {'status': 'fail', 'errors': [{'index': None, 'error': 'JSON inválido.'}]}, 400
+    sdk_commands, errors = validate_batch(data.get('commands'))
+    if errors:
+        # Nada é enviado ao drone se algum comando for inválido.
+        return {'status': 'fail', 'errors': errors}, 400
+    logger.info({'action': 'command_batch', 'commands': sdk_commands})
+    results = execute_batch(get_drone(video=True), sdk_commands, bool(data.get('stop_on_error')))
+    status = 'success' if all(r.status in ('ok', 'sent') for r in results) else 'fail'
+    return {'status': status, 'results': [r._asdict() for r in results]}, 200
+
+
+@app.route('/api/commands/', methods=['POST'])
+def command_batch():
+    """ View para executar uma lista de comandos em uma única requisição. """
+    payload, status = execute_command_batch(request.get_json(silent=True))
+    return jsonify(**payload), status
+
+
+@app.route('/api/telemetry/')
+def telemetry():
+    """ View para retornar o último estado conhecido do drone. """
+    return jsonify(**TelemetryHub().snapshot())
+
+
+@app.route('/api/video/stats/')
+def video_stats():
+    """ View para retornar as estatísticas do fluxo de vídeo (perdas e ressincronizações). """
+    return jsonify(**get_drone(video=True).video_stats())
+
+
+@app.route('/api/governor/')
+def governor():
+    """ View para retornar o ponto de operação do pipeline de vídeo e o tempo medido por frame. """
+    return jsonify(**get_drone(video=True).governor_stats())
+
+
+@app.route('/api/telemetry/stream')
+def telemetry_stream():
+    """ View de Server-Sent Events com os campos alterados, na taxa pedida (?rate=eventos/s). """
+    subscription = TelemetryHub().subscribe(request.args.get('rate', 1.0, type=float))
+    response = Response(subscription.events(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def get_snapshot_store():
+    """ Recupera o armazenamento de snapshots. """
+    return SnapshotStore(config.SNAPSHOT_IMAGE_FOLDER)
+
+
+def jpeg_response(data, digest, immutable=False):
+    """ Monta a resposta JPEG com ETag, respondendo 304 quando o cliente já possui a imagem. """
+    response = Response(data, mimetype='image/jpeg')
+    response.set_etag(digest)
+    response.cache_control.public = True
+    if immutable:
+        response.cache_control.max_age = 31536000
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@app.route('/snapshots/latest.jpg')
+def snapshot_latest():
+    """ View para retornar o último snapshot (servido da memória). """
+    record, data = get_snapshot_store().latest()
+    if record is None:
+        return Response('', status=404)
+    return jpeg_response(data, record.digest)
+
+
+@app.route('/snapshots/<digest>.jpg')
+def snapshot_image(digest):
+    """ View para retornar um snapshot pelo hash. """
+    data = get_snapshot_store().get(digest)
+    if data is None:
+        return Response('', status=404)
+    return jpeg_response(data, digest, immutable=True)
+
+
+@app.route('/snapshots/<digest>/thumb.jpg')
+def snapshot_thumbnail(digest):
+    """ View para retornar a miniatura de um snapshot. """
+    data = get_snapshot_store().thumbnail(digest)
+    if data is None:
+        return Response('', status=404)
+    return jpeg_response(data, f'{digest}-thumb', immutable=True)
+
+
+@app.route('/api/snapshots/')
+def snapshot_list():
+    """ View para listar os snapshots de forma paginada. """
+    page = request.args.get('page', 1, type=int)
+    per_page = min(request.args.get('per_page', 50, type=int), 500)
+    store = get_snapshot_store()
+    return jsonify(
+        total=len(store),
+        page=page,
+        snapshots=[record._asdict() for record in store.page(page, per_page)],
+    )
+
+
+@app.route('/snapshots/')
+def gallery():
+    """ View para a galeria de snapshots. """
+    page = request.args.get('page', 1, type=int)
+    store = get_snapshot_store()
+    return render_template('gallery.html', snapshots=store.page(page, 48), page=page,
+                           has_next=page * 48 < len(store))
+
+
+def video_frame_counter():
+    """ Contador de frames decodificados do drone com vídeo já em execução (None sem vídeo). """
+    if not config.BROKER_ADDRESS and StreamTelloDrone not in Singleton._instances:
+        # O profiler não deve iniciar o drone.
+        return None
+    return lambda: get_drone(video=True).video_stats().get('decoded_frames')
+
+
+@app.route('/admin/profile')
+def admin_profile():
+    """
+    View do profiler sob demanda.
+    ?mode=cpu (padrão): pilhas colapsadas de todas as threads (?seconds=, ?interval=).
+    ?mode=memory: locais com maior alocação no intervalo, também por frame de vídeo decodificado
+    (?seconds=, ?limit=, ?depth= profundidade da pilha).
+    """
+    if config.ADMIN_ADDRESSES is not None and request.remote_addr not in config.ADMIN_ADDRESSES:
+        return Response('', status=403)
+    seconds = min(max(request.args.get('seconds', 10.0, type=float), 0.1), config.PROFILER_MAX_SECONDS)
+    mode = request.args.get('mode', 'cpu')
+    logger.info({'action': 'admin_profile', 'mode': mode, 'seconds': seconds})
+    profiler = SamplingProfiler()
+    try:
+        if mode == 'memory':
+            return jsonify(**profiler.allocations(seconds, request.args.get('limit', 25, type=int),
+                                                  request.args.get('depth', 1, type=int), video_frame_counter()))
+        if mode != 'cpu':
+            return Response('', status=400)
+        data = profiler.collapsed(seconds, request.args.get('interval', 0.005, type=float))
+    except ProfilerBusyError as ex:
+        return jsonify(status='fail', error=str(ex)), 409
+    response = Response(data, mimetype='text/plain')
+    filename = time.strftime('profile-%Y%m%d-%H%M%S.folded')
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+
+_broadcaster = None
+
+
+def get_broadcaster():
+    """ Recupera o difusor de frames compartilhado por todos os clientes de vídeo. """
+    global _broadcaster
+    if _broadcaster is None:
+        _broadcaster = FrameBroadcaster(lambda: get_drone(video=True).video_jpeg_generator())
+    return _broadcaster
+
+
+FRAME_HEADER = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+FRAME_TRAILER = b'\r\n\r\n'
 
 
 def video_generator():
     """ Método para disponibilizar imagens recuperadas pelo Drone. """
-    drone = get_drone(video=True)
-    for jpeg in drone.video_jpeg_generator():
-        yield (
-                b'--frame\r\n'
-                b'Content-Type: image/jpeg\r\n\r\n' +
-                jpeg +
-                b'\r\n\r\n'
-        )
+    for jpeg in get_broadcaster().frames():
+        # Partes entregues separadamente ao servidor, sem concatenar o JPEG.
+        yield FRAME_HEADER
+        yield jpeg
+        yield FRAME_TRAILER
 
 
 @app.route('/video/streaming')
@@ -98,4 +327,7 @@ def video_feed():
 
 def run():
     """ Método para inicializar as aplicação. """
+    if config.ASYNC_SERVER:
+        from drone_app.controllers.async_server import run_async
+        return run_async()
     app.run(host=config.WEB_ADDRESS, port=config.WEB_PORT, threaded=True)
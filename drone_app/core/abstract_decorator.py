@@ -2,6 +2,7 @@
 """
 Módulo para Decorator Abstrato
 """
+import time
 from abc import ABCMeta
 
 
@@ -20,5 +21,19 @@ class AbstractDecorator(metaclass=ABCMeta):
         :return: self
         """
         if self._decorator:
-            self._decorator.execute(args, kwargs)
+            self._decorator.execute(*args, **kwargs)
+        return self
+
+    def _wait(self, *commands):
+        """
+        Aguarda a duração prevista dos comandos enviados (modelo de duração), em vez de um tempo fixo.
+        :param commands: comandos SDK (ex: "cw 90", "forward 30").
+        :return: self
+        """
+        time.sleep(sum(self._drone_manager.predict_duration(command) for command in commands))
+        return self
+
+    def _sleep(self, seconds):
+        """ Aguarda um tempo fixo na escala de tempo do drone (simuladores acelerados usam escala menor que 1). """
+        time.sleep(seconds * self._drone_manager.time_scale)
         return self
@@ -5,16 +5,20 @@ Módulo para Drone Abstrato.
 import contextlib
 import logging
 import socket
-import sys
+import time
 from abc import ABCMeta, abstractmethod
-from threading import Event, Thread, Semaphore
+from threading import Event, Lock, Thread, Semaphore
 
+from config import COMMAND_RETRIES, DURATION_MODEL_FILE, FLIGHT_RECORDER, FLIGHT_RECORDER_FOLDER
+from drone_app.core.duration_model import DurationModel
 from drone_app.core.exceptions import DroneManagerNotFound
+from drone_app.core.flight_recorder import FlightRecorder
+from drone_app.core.rtt import MOTION, QUERY, CONTROL, RttEstimator, command_class, is_idempotent
+from drone_app.core.scheduler import PatrolRoutine
 from drone_app.core.sigleton import Singleton
+from drone_app.core.telemetry import TelemetryHub, parse_state
 from drone_app.core.utils import Retry
 
-logging.basicConfig(level=logging.INFO, stream=sys.stdout)
-
 
 class AbstractPatrolMiddleware(metaclass=ABCMeta):
     """ Classe abstrata para implementações de regras de patrulhamento """
@@ -48,9 +52,9 @@ class AbstractPatrolMiddleware(metaclass=ABCMeta):
         if not self._drone_manager:
             raise DroneManagerNotFound()
 
-        process_id = self._process(status, args, kwargs)
+        process_id = self._process(status, *args, **kwargs)
         if self._next_patrol_middleware:
-            process_id = self._next_patrol_middleware.process(status, args, kwargs)
+            process_id = self._next_patrol_middleware.process(status, *args, **kwargs)
         return process_id
 
     def set_drone_manager(self, value):
@@ -65,6 +69,8 @@ class AbstractDroneManager(metaclass=Singleton):
     """ Classe para gerenciamento do drone. ABCMeta """
 
     logger = logging.getLogger('AbstractDroneManager')
+    # Escala das esperas fixas (ex: decorators); simuladores acelerados usam valores menores que 1.
+    time_scale = 1.0
 
     def __init__(self, host_ip, host_port, drone_ip, drone_port, is_imperial, speed, patrol_middleware):
         self.patrol_middleware = patrol_middleware
@@ -77,21 +83,34 @@ class AbstractDroneManager(metaclass=Singleton):
         self.host_port = host_port
         # Conexão
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        logging.info({'action': 'socket_connect', 'response': f'IP: {self.host_ip}:{self.host_port}'})
+        self.logger.info({'action': 'socket_connect', 'response': f'IP: {self.host_ip}:{self.host_port}'})
         self.socket.bind((self.host_ip, self.host_port))
         self.response = None
         # Send Command
         self._command_semaphore = Semaphore()
         self._command_thread = None
+        self._command_count = 0
+        self._reply_listeners = []
+        # Resposta do comando em andamento (sinalizada pela thread receive_response).
+        self._reply_event = Event()
+        self._reply_lock = Lock()
+        self._awaiting_reply = False
+        # Tempo de resposta e duração dos comandos.
+        self.rtt = {QUERY: RttEstimator(), CONTROL: RttEstimator(), MOTION: RttEstimator()}
+        self.durations = DurationModel(DURATION_MODEL_FILE)
+        self.recorder = FlightRecorder(FLIGHT_RECORDER_FOLDER, enabled=FLIGHT_RECORDER)
         # Patrol
-        self.patrol_event = None
-        self.is_patrol = False
-        self._patrol_semaphore = Semaphore()
-        self._thread_patrol = None
+        self._patrol_routine = None
+        # Telemetria
+        self.state_port = 8890
+        self.telemetry = TelemetryHub()
         # Stop
         self.stop_event = Event()
         self._response_thread = Thread(target=self.receive_response, args=(self.stop_event,))
         self._response_thread.start()
+        self._state_thread = Thread(
+            target=self.receive_state, args=(self.stop_event, self.host_ip, self.state_port,), daemon=True)
+        self._state_thread.start()
         self._init_commands()
 
     @abstractmethod
@@ -106,85 +125,200 @@ class AbstractDroneManager(metaclass=Singleton):
         Retry(check_method, iter_number).go()
         return self
 
-    def _is_none_response(self):
-        """ Verifica se existe uma response. """
-        return self.response is None
-
     def receive_response(self, stop_event):
         """ Info """
         while not stop_event.is_set():
             try:
-                self.response, ip = self.socket.recvfrom(3000)
-                self.logger.info({'action': 'receive_response', 'response': self.response})
+                response, ip = self.socket.recvfrom(3000)
             except socket.error as e:
                 self.logger.error({'action': 'receive_response', 'error': e})
                 break
+            self.logger.info({'action': 'receive_response', 'response': response})
+            self.recorder.reply(response)
+            with self._reply_lock:
+                if not self._awaiting_reply:
+                    # Resposta atrasada de um comando que já expirou: não é atribuída ao próximo.
+                    self.logger.warning({'action': 'receive_response', 'response': response, 'status': 'stale'})
+                    continue
+                self.response = response
+                self._reply_event.set()
+
+    def predict_duration(self, command):
+        """ Duração prevista (s) de um comando SDK na velocidade corrente. """
+        return self.durations.predict(command, self.speed)
+
+    def command_timeout(self, command, attempt=0):
+        """
+        Timeout (s) de um comando SDK na velocidade corrente.
+        Consultas e controle usam o RTO da classe; movimentos somam a duração prevista.
+        :param attempt: tentativa (0 é o envio original; cada retransmissão dobra o RTO).
+        """
+        kind = command_class(command)
+        rto = self.rtt[kind].backoff(attempt)
+        if kind != MOTION:
+            return rto
+        return max(self.durations.timeout(command, self.speed), self.predict_duration(command) + rto)
+
+    def rtt_stats(self):
+        """ Estado dos estimadores de tempo de resposta por classe de comando. """
+        return {kind: estimator.stats()._asdict() for kind, estimator in self.rtt.items()}
+
+    def receive_state(self, stop_event, host_ip, state_port):
+        """
+        Recebe o estado enviado pelo drone (bateria, altura, velocidades...) e publica na telemetria.
+        :param stop_event:
+        :param host_ip:
+        :param state_port:
+        :return:
+        """
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock_state:
+            sock_state.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock_state.settimeout(.5)
+            try:
+                sock_state.bind((host_ip, state_port))
+            except socket.error as ex:
+                self.logger.error({'action': 'receive_state', 'ex': ex})
+                return
+            while not stop_event.is_set():
+                try:
+                    data, address = sock_state.recvfrom(1024)
+                except socket.timeout:
+                    continue
+                except socket.error as ex:
+                    self.logger.error({'action': 'receive_state', 'ex': ex})
+                    break
+                self.telemetry.update(parse_state(data))
 
     def stop(self):
         """ Fecha a conexão """
         self.stop_event.set()
+        self.durations.save()
+        self.recorder.close()
         self._retry(self._response_thread.is_alive, 30)
         self.socket.close()
 
+    @property
+    def command_count(self):
+        """ Quantidade de comandos enviados com send_command. """
+        return self._command_count
+
+    def add_reply_listener(self, listener):
+        """ Registra um callback(command, response) chamado ao final de cada comando. """
+        self._reply_listeners.append(listener)
+        return self
+
+    def remove_reply_listener(self, listener):
+        """ Remove o callback de resposta. """
+        if listener in self._reply_listeners:
+            self._reply_listeners.remove(listener)
+        return self
+
+    def _notify_reply(self, command, response):
+        for listener in list(self._reply_listeners):
+            listener(command, response)
+
     def send_command(self, command, blocking=True):
         """ Prepara thread para comando. """
+        self._command_count += 1
         self._command_thread = Thread(target=self._send_command, args=(command, blocking,))
         self._command_thread.start()
 
+    def send_datagram(self, command):
+        """
+        Envia o comando sem aguardar resposta, sem thread e sem semáforo.
+        Usado para comandos contínuos e sem resposta, como o ``rc``.
+        """
+        self.recorder.datagram(command)
+        self.socket.sendto(command.encode('utf-8'), self.drone_address)
+        return self
+
+    def request(self, command):
+        """
+        Envia o comando e aguarda a resposta do drone na thread corrente.
+        :return: str com a resposta ou None.
+        """
+        return self._send_command(command, blocking=True)
+
     def _send_command(self, command, blocking=True):
         """ Registrar o envio de um comando. """
+        if not command.strip():
+            # Comando vazio não é enviado (não há classe, duração prevista nem resposta a aguardar).
+            self.logger.warning({'action': 'send_command', 'command': command, 'status': 'empty'})
+            self._notify_reply(command, None)
+            return None
         is_acquire = self._command_semaphore.acquire(blocking=blocking)
         if is_acquire:
             with contextlib.ExitStack() as stack:
                 stack.callback(self._command_semaphore.release)
                 self.logger.info({'action': 'send_command', 'command': command})
-                self.socket.sendto(command.encode('utf-8'), self.drone_address)
-
-                self._retry(self._is_none_response, 3)
-
-                response = None
-                if not self._is_none_response():
-                    response = self.response.decode('utf-8')
-
-                self.response = None
+                response = self._transmit(command)
+                if command.startswith('speed ') and response == 'ok':
+                    self.speed = int(command.split()[1])
+                self.telemetry.update({'last_command': command, 'last_reply': response})
+                self._notify_reply(command, response)
                 return response
         else:
             self.logger.warning({'action': 'send_command', 'command': command, 'status': 'not_acquire'})
+            self._notify_reply(command, None)
+
+    def _transmit(self, command):
+        """
+        Envia o comando e aguarda a resposta pelo timeout adaptativo.
+        Somente comandos idempotentes (consultas, "command", "speed"...) são retransmitidos, com backoff;
+        movimentos nunca são reenviados às cegas.
+        :return: str com a resposta ou None.
+        """
+        kind = command_class(command)
+        estimator = self.rtt[kind]
+        retries = COMMAND_RETRIES if is_idempotent(command) else 0
+        predicted = self.predict_duration(command) if kind == MOTION else 0.0
+        speed = self.speed
+        for attempt in range(retries + 1):
+            timeout = self.command_timeout(command, attempt)
+            with self._reply_lock:
+                self.response = None
+                self._reply_event.clear()
+                self._awaiting_reply = True
+            sent_at = time.monotonic()
+            self.recorder.command(command)
+            self.socket.sendto(command.encode('utf-8'), self.drone_address)
+            replied = self._reply_event.wait(timeout)
+            with self._reply_lock:
+                self._awaiting_reply = False
+                response, self.response = self.response, None
+            if replied and response is not None:
+                elapsed = time.monotonic() - sent_at
+                if attempt == 0:
+                    # Algoritmo de Karn: a resposta de uma retransmissão é ambígua e não gera amostra.
+                    estimator.sample(elapsed - predicted)
+                    if response.strip().lower() == b'ok':
+                        self.durations.record(command, elapsed, speed)
+                return response.decode('utf-8', 'replace')
+            estimator.timeout(retransmit=attempt < retries)
+            self.logger.warning({'action': 'send_command', 'command': command, 'status': 'timeout',
+                                 'attempt': attempt, 'timeout': round(timeout, 3)})
+        return None
+
+    @property
+    def is_patrol(self):
+        """ Indica se o patrulhamento está em execução. """
+        return self._patrol_routine is not None and self._patrol_routine.active
 
     def patrol(self):
-        """ Inicializa as condições para fazer o patrulhamento. """
+        """ Inicia o patrulhamento no agendador compartilhado. """
         if not self.is_patrol:
-            self.patrol_event = Event()
-            self._thread_patrol = Thread(
-                target=self._patrol,
-                args=(self._patrol_semaphore, self.patrol_event, self.patrol_middleware, self.logger,)
-            )
-            self.is_patrol = True
-            self._thread_patrol.start()
+            if not self.patrol_middleware:
+                self.logger.warning({'action': 'patrol', 'status': 'no_patrol_middleware'})
+                return self
+            self._patrol_routine = PatrolRoutine(self, self.patrol_middleware, on_status=self.recorder.patrol).start()
+            self.recorder.event(patrol='start')
+            self.logger.info({'action': 'patrol', 'status': 'start'})
         return self
 
     def stop_patrol(self):
-        """ Método para parar o patrulhamento. """
+        """ Interrompe o patrulhamento imediatamente. """
         if self.is_patrol:
-            try:
-                self.patrol_event.set()
-                self._retry(self._thread_patrol.is_alive, 300)
-            finally:
-                self.is_patrol = False
+            self._patrol_routine.cancel()
+            self.recorder.event(patrol='stop', step=self._patrol_routine.status)
+            self.logger.info({'action': 'patrol', 'status': 'stop', 'step': self._patrol_routine.status})
         return self
-
-    @staticmethod
-    def _patrol(semaphore, stop_event, patrol_middleware, logger):
-        """ Método para executar o patrulhamento. """
-        is_acquire = semaphore.acquire(blocking=False)
-        if is_acquire:
-            logger.info({'action': '_patrol', 'status': 'acquire'})
-            with contextlib.ExitStack() as stack:
-                stack.callback(semaphore.release)
-                status = 0
-                while not stop_event.is_set():
-                    status += 1
-                    if patrol_middleware:
-                        status = patrol_middleware.process(status)
-        else:
-            logger.warning({'action': '_patrol', 'status': 'not_acquire'})
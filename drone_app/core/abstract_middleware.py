@@ -2,43 +2,122 @@
 """
 Módulo de Middleware Básico.
 """
-import os.path
+import time
 from abc import ABCMeta, abstractmethod
 
-import cv2 as cv
-
-from config import PROJECT_ROOT
+from drone_app.core.classifiers import ClassifierRegistry
 
 
 class BaseMiddleware(metaclass=ABCMeta):
     """ Classe base para middleware. """
+    # Parâmetros do detectMultiScale usados pelos middlewares de detecção.
+    scale_factor = 1.3
+    min_neighbors = 5
+
     def __init__(self, next_middleware=None):
         self._next = next_middleware
+        self._timings = None
+
+    def chain(self):
+        """ Itera sobre este middleware e os seguintes. """
+        middleware = self
+        while middleware:
+            yield middleware
+            middleware = middleware._next
+
+    def enable_timings(self):
+        """ Ativa a medição do custo de _process para toda a cadeia. """
+        for middleware in self.chain():
+            middleware._timings = []
+        return self
+
+    @property
+    def timings(self):
+        """ Expõe as durações (segundos) de _process medidas. """
+        return self._timings
+
+    def set_detection_params(self, scale_factor, min_neighbors):
+        """ Altera os parâmetros do detectMultiScale de toda a cadeia (aplicados na próxima detecção). """
+        for middleware in self.chain():
+            middleware.scale_factor = scale_factor
+            middleware.min_neighbors = min_neighbors
+        return self
+
+    def stop_tracking(self):
+        """ Para o rastreamento de toda a cadeia (o drone recebe a parada se estava em movimento). """
+        for middleware in self.chain():
+            middleware._stop_tracking()
+        return self
+
+    def _stop_tracking(self):
+        """ Middlewares que movimentam o drone devem sobrescrever este método. """
+        pass
+
+    @staticmethod
+    def get_cascade_path(file_name):
+        """
+        Recupera o caminho do arquivo XML do cascade.
+        :param file_name: nome do cascade
+        :return: str
+        """
+        return ClassifierRegistry().path(file_name)
 
     @staticmethod
     def get_cascade(file_name):
         """
-        Carrega o cascade do arquivo XML do opencv.
+        Recupera o cascade do registro (XML interpretado uma vez por processo).
+        A instância é exclusiva da thread corrente: obtenha-a na thread que executa a detecção.
         :param file_name: nome do cascade
         :return: obj
         """
-        file = os.path.normpath(os.path.join(PROJECT_ROOT, f'data/{file_name}'))
-        if not os.path.isfile(file):
-            raise FileNotFoundError()
-        return cv.CascadeClassifier(file)
+        return ClassifierRegistry().get(file_name)
+
+    @staticmethod
+    def preload_cascades(*file_names):
+        """ Carrega os cascades no registro sem criar instâncias (falha cedo se o arquivo não existir). """
+        ClassifierRegistry().preload(*file_names)
 
     @abstractmethod
     def _process(self, frame):
         pass
 
+    def _replay(self, frame):
+        """
+        Reaplica o último resultado no frame sem executar o processamento completo.
+        Middlewares de detecção devem sobrescrever este método; os demais
+        continuam executando _process.
+        """
+        return self._process(frame)
+
+    def _forward(self, frame):
+        """ Encaminha o frame para o próximo middleware. """
+        return self._next.process(frame)
+
     def process(self, frame):
         """
         Método para processamento do middleware.
         :param frame:
         :return:
         """
-        result = self._process(frame)
+        if self._timings is None:
+            result = self._process(frame)
+        else:
+            start = time.perf_counter()
+            result = self._process(frame)
+            self._timings.append(time.perf_counter() - start)
+        if self._next:
+            result = self._forward(result)
+
+        return result
+
+    def replay(self, frame):
+        """
+        Reaplica os últimos resultados de toda a cadeia (frame sem alterações relevantes).
+        :param frame:
+        :return:
+        """
+        result = self._replay(frame)
         if self._next:
-            result = self._next.process(result)
+            result = self._next.replay(result)
 
         return result
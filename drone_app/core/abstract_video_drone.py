@@ -12,24 +12,43 @@ from threading import Thread
 import cv2 as cv
 import numpy as np
 
+from config import VIDEO_TARGET_FPS
 from drone_app.core.abstract_drone import AbstractDroneManager
+from drone_app.core.governor import FrameBudgetGovernor, DEFAULT_LADDER
+from drone_app.core.h264 import H264Parser
+from drone_app.core.renditions import DEFAULT_RENDITIONS, DETECTION, PREVIEW, RenditionSet
+from drone_app.core.tracking import DEFAULT_TRACKING_GAINS
 
 
 class AbstractVideoSetup(metaclass=ABCMeta):
-    """ Classe para configurações de vídeo """
+    """
+    Classe para configurações de vídeo.
+    O vídeo é decodificado uma única vez em resolução cheia (frame_x x frame_y do drone); as renditions
+    (nome -> divisor) definem os tamanhos entregues aos consumidores. ``divider`` é o divisor da rendition
+    de detecção, cuja geometria (frame_x, frame_y, centro e área) é usada pelo rastreamento.
+    """
 
-    def __init__(self, default_distance=0.30, default_speed=10, default_degree=10, frame_x=960, frame_y=720, divider=3):
-        self._divider = divider
-        self._frame_y = int(frame_y / self._divider)
-        self._frame_x = int(frame_x / self._divider)
+    def __init__(self, default_distance=0.30, default_speed=10, default_degree=10, frame_x=960, frame_y=720,
+                 divider=DEFAULT_RENDITIONS[DETECTION], tracking_gains=None, renditions=None):
+        self._tracking_gains = tracking_gains if tracking_gains else DEFAULT_TRACKING_GAINS
+        self._renditions = dict(DEFAULT_RENDITIONS, **{DETECTION: divider}) if renditions is None else renditions
+        self._decode_x = frame_x
+        self._decode_y = frame_y
         self._default_degree = default_degree
         self._default_speed = default_speed
         self._default_distance = default_distance
+        self._frame_size = int(self._decode_x * self._decode_y * 3)
+        self._set_detection_geometry()
+        self._command = None
+
+    def _set_detection_geometry(self):
+        """ Geometria da rendition de detecção usada pelo rastreamento. """
+        self._divider = self._renditions[DETECTION]
+        self._frame_y = int(self._decode_y / self._divider)
+        self._frame_x = int(self._decode_x / self._divider)
         self._frame_area = self._frame_x * self._frame_y
-        self._frame_size = int(self._frame_area * 3)
         self._frame_center_x = self._frame_x / 2
         self._frame_center_y = self._frame_y / 2
-        self._command = None
 
     @property
     def divider(self):
@@ -38,9 +57,40 @@ class AbstractVideoSetup(metaclass=ABCMeta):
 
     @property
     def frame_size(self):
-        """ Expõe o valor de _frame_size. """
+        """ Expõe o valor de _frame_size (bytes de um frame decodificado). """
         return self._frame_size
 
+    @property
+    def decode_x(self):
+        """ Largura do frame decodificado. """
+        return self._decode_x
+
+    @property
+    def decode_y(self):
+        """ Altura do frame decodificado. """
+        return self._decode_y
+
+    @property
+    def dividers(self):
+        """ Divisor de cada rendition. """
+        return dict(self._renditions)
+
+    def set_divider(self, name, divider):
+        """
+        Altera o divisor de uma rendition em execução (o decodificador continua em resolução cheia).
+        :return: novo tamanho (largura, altura) da rendition.
+        """
+        self._renditions[name] = int(divider) if float(divider).is_integer() else divider
+        if name == DETECTION:
+            self._set_detection_geometry()
+        return self.rendition_sizes[name]
+
+    @property
+    def rendition_sizes(self):
+        """ Tamanho (largura, altura) de cada rendition. """
+        return {name: (int(self._decode_x / divider), int(self._decode_y / divider))
+                for name, divider in self._renditions.items()}
+
     @property
     def frame_y(self):
         """ Expõe o valor de _frame_y. """
@@ -66,6 +116,11 @@ class AbstractVideoSetup(metaclass=ABCMeta):
         """ Expõe o valor de _frame_center_y. """
         return self._frame_center_y
 
+    @property
+    def tracking_gains(self):
+        """ Expõe os ganhos do controlador de rastreamento. """
+        return self._tracking_gains
+
     @abstractmethod
     def _command_mount(self):
         pass
@@ -80,10 +135,15 @@ class AbstractVideoSetup(metaclass=ABCMeta):
 class VideoSetupFFmpeg(AbstractVideoSetup):
     """ Classe para configurar o streamer de FFmpeg. """
 
+    def __init__(self, *args, executable='ffmpeg.exe', hwaccel=True, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._executable = executable
+        self._hwaccel = hwaccel
+
     def _command_mount(self):
-        ffmpeg = 'ffmpeg.exe'
-        self._command = f'{ffmpeg} -hwaccel auto -hwaccel_device opencl -i pipe:0 ' \
-                        f'-pix_fmt bgr24 -s {self._frame_x}x{self._frame_y} -f rawvideo pipe:1'
+        hwaccel = '-hwaccel auto -hwaccel_device opencl ' if self._hwaccel else ''
+        self._command = f'{self._executable} {hwaccel}-i pipe:0 ' \
+                        f'-pix_fmt bgr24 -s {self._decode_x}x{self._decode_y} -f rawvideo pipe:1'
         return self
 
 
@@ -94,14 +154,20 @@ class AbstractDroneVideoManager(AbstractDroneManager):
         pass
 
     def __init__(self, host_ip, host_port, drone_ip, drone_port, is_imperial, speed, patrol_middleware, video_setup,
-                 face_detect_middleware):
+                 face_detect_middleware, snapshot_middleware=None, governor=None):
         super().__init__(host_ip, host_port, drone_ip, drone_port, is_imperial, speed, patrol_middleware)
         self.video_setup = video_setup
+        self.renditions = RenditionSet(self.video_setup.rendition_sizes)
+        # Os pontos de operação do governador escalam os divisores configurados.
+        self._base_dividers = self.video_setup.dividers
         cmd = self.video_setup.command.split(' ')
         self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
         self.proc_std_in = self.proc.stdin
         self.proc_std_out = self.proc.stdout
         self.video_port = 11111
+        # Acompanha o fluxo H.264: descarta frames corrompidos até o próximo IDR.
+        self.h264 = H264Parser()
+        self.decoded_frames = 0
         # Thread
         self._receive_video_thread = Thread(
             target=self.receive_video,
@@ -111,6 +177,40 @@ class AbstractDroneVideoManager(AbstractDroneManager):
         # Face Detect
         self._is_enable_face_detect = False
         self._face_detect_middleware = face_detect_middleware
+        # Snapshot (recebe todos os frames processados)
+        self._snapshot_middleware = snapshot_middleware
+        # Governador do tempo por frame (sem VIDEO_TARGET_FPS, apenas mede no primeiro ponto de operação).
+        if governor is None:
+            governor = FrameBudgetGovernor(VIDEO_TARGET_FPS) if VIDEO_TARGET_FPS else \
+                FrameBudgetGovernor(ladder=DEFAULT_LADDER[:1])
+        self.governor = governor
+        self._jpeg_params = None
+        self.governor.add_listener(self._apply_operating_point)
+        self._apply_operating_point(self.governor.point)
+
+    @property
+    def face_detect_middleware(self):
+        """ Expõe a cadeia de middlewares de detecção de faces. """
+        return self._face_detect_middleware
+
+    def video_stats(self):
+        """ Estatísticas do fluxo de vídeo (perdas, ressincronizações, resolução e frames decodificados). """
+        return dict(self.h264.stats(), decoded_frames=self.decoded_frames)
+
+    def governor_stats(self):
+        """ Ponto de operação corrente do pipeline de vídeo e tempo medido por frame. """
+        stats = self.governor.stats()
+        stats['renditions'] = {name: list(size) for name, size in self.renditions.sizes.items()}
+        return stats
+
+    def _apply_operating_point(self, point):
+        """ Aplica o ponto de operação (chamado na thread de vídeo, entre dois frames). """
+        for name, scale in ((DETECTION, point.detection_scale), (PREVIEW, point.preview_scale)):
+            self.renditions.set_size(name, self.video_setup.set_divider(name, self._base_dividers[name] * scale))
+        if self._face_detect_middleware:
+            self._face_detect_middleware.set_detection_params(point.scale_factor, point.min_neighbors)
+        self._jpeg_params = (cv.IMWRITE_JPEG_QUALITY, int(point.jpeg_quality))
+        return self
 
     def enable_face_detect(self):
         """ Ativa a detecção de faces """
@@ -120,6 +220,9 @@ class AbstractDroneVideoManager(AbstractDroneManager):
     def disable_face_detect(self):
         """ Desativa a detecção de faces """
         self._is_enable_face_detect = False
+        if self._face_detect_middleware:
+            # O último rc continua em vigor no drone: envia a parada e reinicia o rastreamento.
+            self._face_detect_middleware.stop_tracking()
         return self
 
     def stop(self):
@@ -148,7 +251,7 @@ class AbstractDroneVideoManager(AbstractDroneManager):
             while not stop_event.is_set():
                 try:
                     size, address = sock_video.recvfrom_into(data)
-                    self.logger.info({'action': 'receive_video', 'data': data})
+                    self.logger.info({'action': 'receive_video', 'size': size})
                 except socket.timeout as ex:
                     self.logger.warning({'action': 'receive_video', 'ex': ex})
                     time.sleep(0.5)
@@ -157,39 +260,66 @@ class AbstractDroneVideoManager(AbstractDroneManager):
                     self.logger.error({'action': 'receive_video', 'ex': ex})
                     break
 
+                payload = self.h264.feed(data[:size])
+                if not payload:
+                    continue
                 try:
-                    pipe_in.write(data[:size])
+                    pipe_in.write(payload)
                     pipe_in.flush()
                 except Exception as ex:
                     self.logger.error({'action': 'receive_video', 'ex': ex})
                     break
 
     def video_binary_generator(self):
-        """ Gerador de vídeo """
-
+        """
+        Gerador de vídeo em resolução cheia.
+        O frame é lido em um buffer pré-alocado e reaproveitado: copie-o para guardá-lo após a iteração.
+        """
+        buffer = bytearray(self.video_setup.frame_size)
+        # bgr24: três canais.
+        frame = np.frombuffer(buffer, np.uint8).reshape(self.video_setup.decode_y, self.video_setup.decode_x, 3)
         while True:
             try:
-                frame = self.proc_std_out.read(self.video_setup.frame_size)
+                size = self.proc_std_out.readinto(buffer)
             except Exception as ex:
                 self.logger.error({'action': 'video_binary_generator', 'ex': ex})
                 continue
             else:
-                if not frame:
+                if size != len(buffer):
                     continue
-
-                frame = np.fromstring(frame, np.uint8).reshape(
-                    self.video_setup.frame_y, self.video_setup.frame_x, self.video_setup.divider)
+                self.decoded_frames += 1
                 yield frame
 
     def video_jpeg_generator(self):
-        """ Gerador de vídeo Jpeg. """
+        """
+        Gerador de vídeo Jpeg (rendition de preview).
+        A detecção usa a rendition de detecção, o snapshot recebe a resolução cheia e o preview é
+        gerado a partir da detecção anotada (quando ativa), mantendo as marcações das faces.
+        O governador mede o tempo de cada frame e ajusta o ponto de operação para sustentar a taxa alvo.
+        """
+        governor = self.governor
         for frame in self.video_binary_generator():
+            if governor.skip():
+                continue
+            start = time.perf_counter()
+            renditions = self.renditions.frame(frame)
+            annotated = None
             if self._is_enable_face_detect:
                 if self.is_patrol:
                     self.stop_patrol()
-                # Aplica a detecção de faces
-                frame = self._face_detect_middleware.process(frame)
+                # Aplica a detecção de faces (nos demais frames do intervalo, reaplica o último resultado)
+                detection = renditions.get(DETECTION)
+                if governor.should_detect():
+                    annotated = self._face_detect_middleware.process(detection)
+                else:
+                    annotated = self._face_detect_middleware.replay(detection)
+                renditions.put(DETECTION, annotated)
+            if self._snapshot_middleware:
+                self._snapshot_middleware.process(renditions.full)
+            preview = renditions.get(PREVIEW, annotated)
+            self.renditions.publish(renditions)
 
-            _, jpeg = cv.imencode('.jpg', frame)
+            _, jpeg = cv.imencode('.jpg', preview, self._jpeg_params)
             jpeg_binary = jpeg.tobytes()
+            governor.record(time.perf_counter() - start)
             yield jpeg_binary
@@ -0,0 +1,133 @@
+# coding=utf-8
+"""
+Módulo dos Assets Compilados.
+
+A ferramenta ``tools/build_assets.py`` copia os arquivos de ``static/`` para
+``static/build/`` com o hash do conteúdo no nome, versões pré-comprimidas
+(``.gz`` e, com a biblioteca brotli instalada, ``.br``) e um manifesto
+(``manifest.json``). Como o nome muda a cada alteração, os arquivos são
+servidos com cache imutável de um ano; o ETag permite responder 304 sem
+reenviar o conteúdo.
+
+Sem build, ``url`` devolve o caminho original em ``/static/``.
+"""
+import json
+import logging
+import os
+from collections import namedtuple
+from threading import Lock
+
+import config
+from drone_app.core.sigleton import Singleton
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+ASSETS_PATH = '/assets/'
+# Extensões das versões pré-comprimidas, em ordem de preferência.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+AssetEntry = namedtuple('AssetEntry', 'name file etag size mimetype encodings')
+AssetEntry.__doc__ = """ Asset compilado: nome original, arquivo com hash, ETag e codificações disponíveis. """
+
+
+def accepted_encodings(header):
+    """ Codificações aceitas pelo cliente (cabeçalho Accept-Encoding, ignorando q=0). """
+    accepted = set()
+    for item in (header or '').split(','):
+        name, _, params = item.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def not_modified(if_none_match, etag):
+    """ Indica se o cliente já possui a representação (cabeçalho If-None-Match). """
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or f'"{etag}"' in tags or f'W/"{etag}"' in tags
+
+
+class AssetManifest(metaclass=Singleton):
+    """ Classe para consultar o manifesto dos assets compilados. """
+
+    def __init__(self, folder=None):
+        self._folder = folder or config.ASSET_BUILD_FOLDER
+        self._file = os.path.join(self._folder, MANIFEST)
+        self._lock = Lock()
+        self._stat = None
+        self._names = {}
+        self._files = {}
+
+    @property
+    def folder(self):
+        return self._folder
+
+    def _load(self):
+        """ Relê o manifesto quando ele muda no disco (nova build sem reiniciar o servidor). """
+        try:
+            stat = os.stat(self._file)
+            stat = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            stat = None
+        if stat == self._stat:
+            return
+        with self._lock:
+            if stat == self._stat:
+                return
+            names = {}
+            if stat is not None:
+                try:
+                    with open(self._file, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                    names = {name: AssetEntry(name=name, **item) for name, item in data['assets'].items()}
+                except (OSError, ValueError, KeyError, TypeError) as ex:
+                    logger.error({'action': 'asset_manifest', 'file': self._file, 'ex': ex})
+            self._names = names
+            self._files = {entry.file: entry for entry in names.values()}
+            self._stat = stat
+
+    def url(self, name):
+        """ URL do asset (versão com hash quando compilado, senão o arquivo original em /static/). """
+        self._load()
+        entry = self._names.get(name)
+        if entry is None:
+            return f'{config.app.static_url_path}/{name}'
+        return f'{ASSETS_PATH}{entry.file}'
+
+    def lookup(self, file):
+        """ Asset pelo nome com hash (None se não existir). """
+        self._load()
+        return self._files.get(file)
+
+    def select(self, entry, accept_encoding):
+        """
+        Escolhe a representação do asset para o cliente.
+        :return: tupla (caminho do arquivo, codificação ou None, ETag).
+        """
+        accepted = accepted_encodings(accept_encoding)
+        for encoding, suffix in ENCODINGS:
+            if encoding in entry.encodings and encoding in accepted:
+                return os.path.join(self._folder, entry.file + suffix), encoding, f'{entry.etag}-{suffix[1:]}'
+        return os.path.join(self._folder, entry.file), None, entry.etag
+
+    @staticmethod
+    def headers(entry, encoding, etag):
+        """ Cabeçalhos de cache comuns às respostas 200 e 304. """
+        headers = {
+            'ETag': f'"{etag}"',
+            'Cache-Control': 'public, max-age=31536000, immutable',
+        }
+        if entry.encodings:
+            headers['Vary'] = 'Accept-Encoding'
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        return headers
@@ -0,0 +1,101 @@
+# coding=utf-8
+"""
+Módulo de Difusão de Frames.
+
+Um único produtor consome o gerador de JPEG do drone e publica o frame mais
+recente para qualquer quantidade de clientes, sejam threads (servidor WSGI) ou
+corrotinas (servidor assíncrono). Clientes lentos apenas pulam frames.
+"""
+import logging
+from threading import Condition, Lock, Thread
+
+logger = logging.getLogger(__name__)
+
+
+class FrameBroadcaster:
+    """ Classe para distribuir o último frame JPEG para vários clientes. """
+
+    def __init__(self, source_factory):
+        self._source_factory = source_factory
+        self._condition = Condition()
+        self._frame = None
+        self._seq = 0
+        self._thread = None
+        self._thread_lock = Lock()
+        self._async_waiters = set()
+
+    @property
+    def seq(self):
+        """ Expõe a sequência do último frame publicado. """
+        return self._seq
+
+    def start(self):
+        """ Inicia o produtor (uma única vez). """
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return self
+
+    def _run(self):
+        """ Laço do produtor. """
+        try:
+            for frame in self._source_factory():
+                self.publish(frame)
+        except Exception as ex:
+            logger.error({'action': 'frame_broadcaster', 'ex': ex})
+
+    def publish(self, frame):
+        """ Publica um frame e acorda os clientes. """
+        with self._condition:
+            self._frame = frame
+            self._seq += 1
+            seq = self._seq
+            waiters, self._async_waiters = self._async_waiters, set()
+            self._condition.notify_all()
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(self._resolve, future, seq, frame)
+        return self
+
+    @staticmethod
+    def _resolve(future, seq, frame):
+        if not future.done():
+            future.set_result((seq, frame))
+
+    def wait(self, last_seq=0, timeout=None):
+        """
+        Aguarda (thread) um frame mais novo que last_seq.
+        :return: tupla (seq, frame) ou (last_seq, None) no timeout.
+        """
+        self.start()
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._seq > last_seq, timeout):
+                return last_seq, None
+            return self._seq, self._frame
+
+    def frames(self):
+        """ Gerador (thread) dos frames publicados. """
+        seq = 0
+        while True:
+            seq, frame = self.wait(seq)
+            if frame is not None:
+                yield frame
+
+    async def wait_async(self, loop, last_seq=0):
+        """
+        Aguarda (corrotina) um frame mais novo que last_seq.
+        :return: tupla (seq, frame).
+        """
+        self.start()
+        with self._condition:
+            if self._seq > last_seq:
+                return self._seq, self._frame
+            future = loop.create_future()
+            waiter = (loop, future)
+            self._async_waiters.add(waiter)
+        try:
+            return await future
+        finally:
+            # Cliente desconectado: o future cancelado não fica pendurado.
+            with self._condition:
+                self._async_waiters.discard(waiter)
@@ -0,0 +1,124 @@
+# coding=utf-8
+"""
+Módulo do Registro de Classificadores.
+
+Os arquivos XML dos cascades (data/) são lidos e interpretados uma única vez
+por processo: o registro guarda a árvore já interpretada (``cv.FileStorage``
+em memória) e cada thread recebe a sua própria instância de
+``cv.CascadeClassifier`` montada a partir dela, pois o classificador não pode
+ser compartilhado entre threads. Criar novos pipelines ou workers não lê nem
+interpreta o XML novamente.
+"""
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+import cv2 as cv
+
+from config import PROJECT_ROOT
+from drone_app.core.sigleton import Singleton
+from drone_app.core.utils import rss_kb
+
+logger = logging.getLogger(__name__)
+
+FACE_CASCADE = 'haarcascade_frontalface_default.xml'
+EYE_CASCADE = 'haarcascade_eye.xml'
+
+ClassifierStats = namedtuple('ClassifierStats', 'name path xml_kb read_ms parse_ms rss_kb instances fallbacks')
+ClassifierStats.__doc__ = """ Custo de carga de um cascade e quantidade de instâncias criadas. """
+
+
+class _CascadeModel:
+    """ Cascade interpretado, compartilhado pelas threads do processo. """
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.lock = threading.Lock()
+        rss = rss_kb()
+        start = time.perf_counter()
+        with open(path, 'r', encoding='utf-8') as f:
+            xml = f.read()
+        self.read_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        self.storage = cv.FileStorage(xml, cv.FILE_STORAGE_READ | cv.FILE_STORAGE_MEMORY)
+        self.node = self.storage.getFirstTopLevelNode()
+        self.parse_ms = (time.perf_counter() - start) * 1000
+        self.xml_kb = len(xml) / 1024
+        after = rss_kb()
+        self.rss_kb = None if rss is None or after is None else after - rss
+        self.instances = 0
+        self.fallbacks = 0
+
+    def create(self):
+        """ Nova instância do classificador a partir da árvore já interpretada. """
+        classifier = cv.CascadeClassifier()
+        with self.lock:
+            self.instances += 1
+            try:
+                loaded = classifier.read(self.node)
+            except cv.error:
+                loaded = False
+            if loaded:
+                return classifier
+            # Formato antigo de cascade: somente a carga pelo arquivo é suportada.
+            self.fallbacks += 1
+        return cv.CascadeClassifier(self.path)
+
+    def stats(self):
+        return ClassifierStats(self.name, self.path, round(self.xml_kb, 1), round(self.read_ms, 2),
+                               round(self.parse_ms, 2), self.rss_kb, self.instances, self.fallbacks)
+
+
+class ClassifierRegistry(metaclass=Singleton):
+    """ Classe para carregar os cascades uma vez e fornecer uma instância por thread. """
+
+    def __init__(self, folder=None):
+        self._folder = folder or os.path.join(PROJECT_ROOT, 'data')
+        self._models = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def path(self, name):
+        """
+        Caminho do arquivo XML do cascade.
+        :param name: nome do arquivo em data/ ou caminho absoluto.
+        """
+        path = name if os.path.isabs(name) else os.path.normpath(os.path.join(self._folder, name))
+        if not os.path.isfile(path):
+            raise FileNotFoundError(path)
+        return path
+
+    def _model(self, name):
+        model = self._models.get(name)
+        if model is None:
+            with self._lock:
+                model = self._models.get(name)
+                if model is None:
+                    model = self._models[name] = _CascadeModel(name, self.path(name))
+                    logger.info({'action': 'classifier_load', **model.stats()._asdict()})
+        return model
+
+    def preload(self, *names):
+        """ Carrega os cascades informados (ex: na inicialização), sem criar instâncias. """
+        for name in names:
+            self._model(name)
+        return self
+
+    def get(self, name):
+        """ Instância do cascade exclusiva da thread corrente. """
+        classifiers = getattr(self._local, 'classifiers', None)
+        if classifiers is None:
+            classifiers = self._local.classifiers = {}
+        classifier = classifiers.get(name)
+        if classifier is None:
+            classifier = classifiers[name] = self._model(name).create()
+        return classifier
+
+    def stats(self):
+        """ Custo de carga e instâncias de cada cascade carregado. """
+        with self._lock:
+            models = list(self._models.values())
+        return [model.stats()._asdict() for model in models]
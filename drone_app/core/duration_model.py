@@ -0,0 +1,192 @@
+# coding=utf-8
+"""
+Módulo do Modelo de Duração dos Comandos.
+
+Registra o tempo observado entre o envio de cada comando e o "ok" do drone,
+junto com os argumentos e a velocidade corrente, e ajusta por mínimos
+quadrados um modelo linear por comando:
+
+    movimentos (up, forward, go, curve...):  t = a + b * distância / velocidade
+    giros (cw, ccw):                          t = a + b * graus
+    demais (takeoff, land, flip...):          t = a
+
+Enquanto não há amostras suficientes são usados valores iniciais
+conservadores. O modelo é persistido em JSON para ser reaproveitado entre voos.
+"""
+import json
+import logging
+import math
+import os
+from collections import deque
+from threading import RLock
+
+import numpy as np
+
+from drone_app.core.sigleton import Singleton
+
+logger = logging.getLogger(__name__)
+
+MOVE_COMMANDS = ('up', 'down', 'left', 'right', 'forward', 'back', 'go', 'curve')
+ROTATE_COMMANDS = ('cw', 'ccw')
+
+# Coeficientes iniciais (a, b) usados antes do ajuste.
+PRIORS = {
+    'move': (1.0, 1.0),
+    'rotate': (0.5, 1.0 / 60.0),
+    'takeoff': (6.0,),
+    'land': (5.0,),
+    'flip': (3.0,),
+    'other': (0.5,),
+}
+MAX_SAMPLES = 200
+SAVE_EVERY = 10
+MIN_MARGIN = 1.0
+
+
+def command_kind(name):
+    """ Classifica o comando para a escolha das variáveis do modelo. """
+    if name in MOVE_COMMANDS:
+        return 'move'
+    if name in ROTATE_COMMANDS:
+        return 'rotate'
+    if name in PRIORS:
+        return name
+    return 'other'
+
+
+def features(command, speed):
+    """
+    Variáveis explicativas do comando.
+    :param command: comando SDK (ex: "forward 30", "cw 90", "go 100 0 50 60").
+    :param speed: velocidade corrente (cm/s), usada quando o comando não informa.
+    :return: tupla (nome, lista de variáveis).
+    """
+    parts = command.split()
+    name = parts[0]
+    kind = command_kind(name)
+    args = []
+    for part in parts[1:]:
+        try:
+            args.append(float(part))
+        except ValueError:
+            # Identificadores de mission pad (m1, m2...).
+            pass
+    if kind == 'move':
+        if name == 'go' and len(args) >= 4:
+            distance, speed = math.sqrt(sum(a * a for a in args[:3])), args[3]
+        elif name == 'curve' and len(args) >= 7:
+            first = math.sqrt(sum(a * a for a in args[:3]))
+            second = math.sqrt(sum((args[i + 3] - args[i]) ** 2 for i in range(3)))
+            distance, speed = first + second, args[6]
+        else:
+            distance = args[0] if args else 0.0
+        return name, [1.0, distance / max(float(speed or 1), 1.0)]
+    if kind == 'rotate':
+        return name, [1.0, args[0] if args else 0.0]
+    return name, [1.0]
+
+
+class DurationModel(metaclass=Singleton):
+    """ Classe para registrar e prever a duração dos comandos do drone. """
+
+    def __init__(self, file_path=None):
+        self._file_path = file_path
+        self._samples = {}
+        self._coefficients = {}
+        self._lock = RLock()
+        self._unsaved = 0
+        self.load()
+
+    def record(self, command, duration, speed=None):
+        """ Registra a duração observada (s) de um comando. """
+        if command.endswith('?') or duration <= 0:
+            return self
+        name, x = features(command, speed)
+        with self._lock:
+            self._samples.setdefault(name, deque(maxlen=MAX_SAMPLES)).append((x, duration))
+            self._coefficients.pop(name, None)
+            self._unsaved += 1
+            save = self._unsaved >= SAVE_EVERY
+        if save:
+            self.save()
+        return self
+
+    def fit(self, name):
+        """
+        Ajusta o modelo do comando.
+        :return: tupla (coeficientes, desvio padrão do resíduo, amostras).
+        """
+        with self._lock:
+            if name in self._coefficients:
+                return self._coefficients[name]
+            samples = list(self._samples.get(name, ()))
+        prior = PRIORS[command_kind(name)]
+        if len(samples) <= len(prior):
+            result = (prior, None, len(samples))
+        else:
+            x = np.array([s[0] for s in samples], dtype=np.float64)
+            y = np.array([s[1] for s in samples], dtype=np.float64)
+            coefficients, _, rank, _ = np.linalg.lstsq(x, y, rcond=None)
+            if rank < len(prior):
+                # Amostras sem variação (ex: sempre a mesma distância): mantém a inclinação inicial
+                # e ajusta somente o termo constante.
+                slope = np.array(prior[1:], dtype=np.float64)
+                coefficients = np.concatenate(([(y - x[:, 1:] @ slope).mean()], slope))
+            residual = y - x @ coefficients
+            result = (tuple(float(c) for c in coefficients), float(residual.std()), len(samples))
+        with self._lock:
+            self._coefficients[name] = result
+        return result
+
+    def predict(self, command, speed=None):
+        """ Duração prevista (s) do comando. """
+        if command.endswith('?'):
+            return PRIORS['other'][0]
+        name, x = features(command, speed)
+        coefficients, _, _ = self.fit(name)
+        return max(0.0, sum(c * v for c, v in zip(coefficients, x)))
+
+    def timeout(self, command, speed=None, deviations=3.0):
+        """ Timeout seguro: duração prevista mais a margem do erro observado. """
+        name, _ = features(command, speed)
+        _, std, _ = self.fit(name)
+        margin = MIN_MARGIN if std is None else max(MIN_MARGIN, deviations * std)
+        return self.predict(command, speed) + margin
+
+    def stats(self):
+        """ Coeficientes, erro e quantidade de amostras por comando. """
+        with self._lock:
+            names = list(self._samples)
+        return {name: dict(zip(('coefficients', 'std', 'samples'), self.fit(name))) for name in names}
+
+    def load(self):
+        """ Carrega as amostras persistidas. """
+        if not self._file_path or not os.path.isfile(self._file_path):
+            return self
+        try:
+            with open(self._file_path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as ex:
+            logger.error({'action': 'duration_model_load', 'ex': ex})
+            return self
+        with self._lock:
+            for name, samples in data.get('samples', {}).items():
+                self._samples[name] = deque(((list(x), y) for x, y in samples), maxlen=MAX_SAMPLES)
+            self._coefficients.clear()
+        return self
+
+    def save(self):
+        """ Persiste as amostras em JSON (gravação atômica). """
+        if not self._file_path:
+            return self
+        with self._lock:
+            data = {'samples': {name: list(samples) for name, samples in self._samples.items()}}
+            self._unsaved = 0
+        tmp = f'{self._file_path}.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp, self._file_path)
+        except OSError as ex:
+            logger.error({'action': 'duration_model_save', 'ex': ex})
+        return self
@@ -0,0 +1,306 @@
+# coding=utf-8
+"""
+Módulo do Gravador de Voo.
+
+Cada voo é gravado em um arquivo binário compacto, somente com anexação:
+
+    cabeçalho:  b'PTFR' | versão (uint16) | início do voo (double, epoch)
+    registro:   tamanho do conteúdo (uint32) | tipo (uint8) | t (double, s desde o início) | conteúdo
+
+Tipos: comando enviado, comando sem resposta (rc), resposta do drone, status
+do patrulhamento, decisão do rastreamento de faces e eventos (JSON). A cada
+``index_every`` registros é gravado um bloco de índice (primeiro e último t,
+posição do primeiro registro, quantidade e posição do bloco anterior); ao
+fechar, um rodapé aponta para o último bloco. Uma consulta por intervalo de
+tempo percorre apenas os índices e lê somente os blocos necessários; sem o
+rodapé (voo interrompido) os cabeçalhos são percorridos pulando o conteúdo.
+
+Durabilidade: comandos, respostas, status do patrulhamento e eventos são
+enviados ao sistema operacional (flush) assim que gravados; os registros
+frequentes (rc e rastreamento) no máximo a cada ``flush_interval`` segundos.
+Um crash ou kill do processo perde no máximo esse intervalo de rc/rastreamento;
+não há fsync, portanto uma queda de energia pode perder o que o sistema ainda
+não gravou no disco.
+"""
+import itertools
+import json
+import logging
+import os
+import struct
+import time
+from collections import namedtuple
+from threading import Lock
+
+from drone_app.core.sigleton import Singleton
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'PTFR'
+FOOTER_MAGIC = b'PTFE'
+VERSION = 1
+
+_FILE_HEADER = struct.Struct('<4sHd')
+_RECORD_HEADER = struct.Struct('<IBd')
+_INDEX = struct.Struct('<qddQI')
+_FOOTER = struct.Struct('<Q4s')
+_PATROL = struct.Struct('<i')
+_TRACK = struct.Struct('<fff4h')
+
+COMMAND = 1
+DATAGRAM = 2
+REPLY = 3
+PATROL = 4
+TRACK = 5
+EVENT = 6
+INDEX = 255
+
+# Registros frequentes: o flush é feito no máximo a cada flush_interval segundos.
+BUFFERED = frozenset((DATAGRAM, TRACK))
+
+RECORD_NAMES = {COMMAND: 'command', DATAGRAM: 'datagram', REPLY: 'reply', PATROL: 'patrol', TRACK: 'track',
+                EVENT: 'event', INDEX: 'index'}
+
+FlightRecord = namedtuple('FlightRecord', 't kind data')
+FlightRecord.__doc__ = """ Registro do voo: instante (s desde o início), tipo e conteúdo decodificado. """
+
+IndexBlock = namedtuple('IndexBlock', 'previous first_t last_t offset count')
+IndexBlock.__doc__ = """ Bloco de índice: intervalo de tempo e posição dos registros. """
+
+
+def _encode(kind, data):
+    if kind in (COMMAND, DATAGRAM):
+        return data.encode('utf-8')
+    if kind == REPLY:
+        return bytes(data)
+    if kind == PATROL:
+        return _PATROL.pack(data)
+    if kind == TRACK:
+        diff_x, diff_y, percent_face, velocities = data
+        return _TRACK.pack(diff_x, diff_y, percent_face, *(velocities or (0, 0, 0, 0)))
+    return json.dumps(data, separators=(',', ':'), default=str).encode('utf-8')
+
+
+def _decode(kind, payload):
+    if kind in (COMMAND, DATAGRAM):
+        return payload.decode('utf-8', 'replace')
+    if kind == REPLY:
+        return payload
+    if kind == PATROL:
+        return _PATROL.unpack(payload)[0]
+    if kind == TRACK:
+        diff_x, diff_y, percent_face, *velocities = _TRACK.unpack(payload)
+        return diff_x, diff_y, percent_face, tuple(velocities)
+    if kind == INDEX:
+        return IndexBlock(*_INDEX.unpack(payload))
+    return json.loads(payload.decode('utf-8'))
+
+
+class FlightRecorder(metaclass=Singleton):
+    """ Classe para gravar os eventos do voo. """
+
+    def __init__(self, folder=None, index_every=256, enabled=True, flush_interval=0.5):
+        self._folder = folder
+        self._index_every = index_every
+        self._flush_interval = flush_interval
+        self._flushed = 0.0
+        self._enabled = enabled and bool(folder)
+        self._lock = Lock()
+        self._file = None
+        self._path = None
+        self._start = None
+        self._last_index = -1
+        self._block_offset = None
+        self._block_first_t = None
+        self._block_last_t = None
+        self._block_count = 0
+
+    @property
+    def path(self):
+        """ Caminho do arquivo do voo corrente. """
+        return self._path
+
+    def _open(self):
+        os.makedirs(self._folder, exist_ok=True)
+        now = time.time()
+        name = time.strftime('flight-%Y%m%d-%H%M%S', time.localtime(now)) + f'-{int(now * 1000) % 1000:03d}'
+        # Um novo voo nunca é anexado a um arquivo existente (o cabeçalho ficaria no meio do arquivo).
+        for attempt in itertools.count():
+            self._path = os.path.join(self._folder, f'{name}-{attempt}.bin' if attempt else f'{name}.bin')
+            try:
+                self._file = open(self._path, 'xb')
+                break
+            except FileExistsError:
+                continue
+        self._file.write(_FILE_HEADER.pack(MAGIC, VERSION, now))
+        self._file.flush()
+        self._start = time.monotonic()
+        self._flushed = 0.0
+        logger.info({'action': 'flight_recorder', 'path': self._path})
+
+    def record(self, kind, data):
+        """ Anexa um registro ao voo corrente. """
+        if not self._enabled:
+            return self
+        try:
+            payload = _encode(kind, data)
+            with self._lock:
+                if self._file is None:
+                    self._open()
+                t = time.monotonic() - self._start
+                offset = self._file.tell()
+                self._file.write(_RECORD_HEADER.pack(len(payload), kind, t) + payload)
+                if self._block_count == 0:
+                    self._block_offset, self._block_first_t = offset, t
+                self._block_last_t = t
+                self._block_count += 1
+                if self._block_count >= self._index_every:
+                    self._write_index()
+                elif kind not in BUFFERED or t - self._flushed >= self._flush_interval:
+                    self._file.flush()
+                    self._flushed = t
+        except (OSError, ValueError, struct.error) as ex:
+            logger.error({'action': 'flight_recorder', 'kind': kind, 'ex': ex})
+        return self
+
+    def _write_index(self):
+        if not self._block_count:
+            return
+        offset = self._file.tell()
+        payload = _INDEX.pack(self._last_index, self._block_first_t, self._block_last_t, self._block_offset,
+                              self._block_count)
+        self._file.write(_RECORD_HEADER.pack(len(payload), INDEX, self._block_last_t) + payload)
+        self._file.flush()
+        self._flushed = self._block_last_t
+        self._last_index = offset
+        self._block_count = 0
+
+    def command(self, command):
+        """ Comando enviado aguardando resposta. """
+        return self.record(COMMAND, command)
+
+    def datagram(self, command):
+        """ Comando enviado sem resposta (ex: rc). """
+        return self.record(DATAGRAM, command)
+
+    def reply(self, response):
+        """ Resposta recebida do drone. """
+        return self.record(REPLY, response)
+
+    def patrol(self, status):
+        """ Status do passo do patrulhamento. """
+        return self.record(PATROL, status)
+
+    def track(self, diff_x, diff_y, percent_face, velocities):
+        """ Decisão do rastreamento de faces (velocidades enviadas ou None). """
+        return self.record(TRACK, (diff_x, diff_y, percent_face, velocities))
+
+    def event(self, **fields):
+        """ Evento genérico (JSON). """
+        return self.record(EVENT, fields)
+
+    def close(self):
+        """ Grava o último índice e o rodapé e fecha o voo. """
+        with self._lock:
+            if self._file is None:
+                return self
+            self._write_index()
+            self._file.write(_FOOTER.pack(self._last_index, FOOTER_MAGIC))
+            self._file.close()
+            self._file = None
+            self._last_index = -1
+        return self
+
+
+class FlightLog:
+    """ Classe para ler um arquivo de voo. """
+
+    def __init__(self, path):
+        self._path = path
+        with open(path, 'rb') as f:
+            magic, version, self.started = _FILE_HEADER.unpack(f.read(_FILE_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f'{path}: não é um arquivo de voo.')
+        self.version = version
+
+    def _footer_index(self, f):
+        """ Posição do último bloco de índice, segundo o rodapé (ou None). """
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size < _FILE_HEADER.size + _FOOTER.size:
+            return None
+        f.seek(size - _FOOTER.size)
+        last_index, magic = _FOOTER.unpack(f.read(_FOOTER.size))
+        return last_index if magic == FOOTER_MAGIC else None
+
+    @staticmethod
+    def _read_record(f):
+        header = f.read(_RECORD_HEADER.size)
+        if len(header) < _RECORD_HEADER.size:
+            return None
+        length, kind, t = _RECORD_HEADER.unpack(header)
+        payload = f.read(length)
+        if len(payload) < length:
+            return None
+        return kind, t, payload
+
+    def index(self):
+        """
+        Blocos de índice do voo, em ordem.
+        Usa o encadeamento a partir do rodapé; sem rodapé percorre os cabeçalhos pulando o conteúdo.
+        """
+        blocks = []
+        with open(self._path, 'rb') as f:
+            offset = self._footer_index(f)
+            if offset is not None:
+                while offset >= 0:
+                    f.seek(offset)
+                    kind, _, payload = self._read_record(f)
+                    block = IndexBlock(*_INDEX.unpack(payload))
+                    blocks.append(block)
+                    offset = block.previous
+                return blocks[::-1]
+            f.seek(_FILE_HEADER.size)
+            first = None
+            while True:
+                offset = f.tell()
+                header = f.read(_RECORD_HEADER.size)
+                if len(header) < _RECORD_HEADER.size:
+                    break
+                length, kind, t = _RECORD_HEADER.unpack(header)
+                if kind == INDEX:
+                    blocks.append(IndexBlock(*_INDEX.unpack(f.read(length))))
+                    first = None
+                    continue
+                f.seek(length, os.SEEK_CUR)
+                if first is None:
+                    first = [t, t, offset, 0]
+                first[1], first[3] = t, first[3] + 1
+            if first:
+                # Registros após o último índice (voo interrompido).
+                blocks.append(IndexBlock(-1, first[0], first[1], first[2], first[3]))
+        return blocks
+
+    def records(self, start=None, end=None, kinds=None):
+        """
+        Registros no intervalo de tempo [start, end] (s desde o início do voo).
+        Somente os blocos que cruzam o intervalo são lidos e decodificados.
+        """
+        with open(self._path, 'rb') as f:
+            for block in self.index():
+                if (start is not None and block.last_t < start) or (end is not None and block.first_t > end):
+                    continue
+                f.seek(block.offset)
+                read = 0
+                while read < block.count:
+                    item = self._read_record(f)
+                    if item is None:
+                        return
+                    kind, t, payload = item
+                    if kind == INDEX:
+                        continue
+                    read += 1
+                    if (start is not None and t < start) or (end is not None and t > end):
+                        continue
+                    if kinds and kind not in kinds:
+                        continue
+                    yield FlightRecord(t, kind, _decode(kind, payload))
@@ -0,0 +1,208 @@
+# coding=utf-8
+"""
+Módulo do Governador do Orçamento de Tempo por Frame.
+
+O pipeline de vídeo é síncrono: quando processar um frame (detecção, snapshot,
+redimensionamentos e JPEG) leva mais que o intervalo entre frames da fonte, o
+pipe do decodificador enche e o vídeo passa a chegar com segundos de atraso.
+O governador mede o tempo de processamento de cada frame (média móvel
+exponencial) contra o orçamento ``1 / target_fps`` e percorre uma escada de
+pontos de operação, do mais caro (melhor qualidade) ao mais barato:
+intervalo de detecção, escala da detecção, parâmetros do ``detectMultiScale``,
+qualidade do JPEG, tamanho do preview e, no último degrau, descarte de frames.
+
+Histerese: desce um degrau quando o tempo passa do orçamento por
+``degrade_frames`` frames seguidos e sobe somente após ``upgrade_frames``
+frames com folga (abaixo de ``upgrade_ratio`` do orçamento). Subir para um
+degrau que logo estourou o orçamento bloqueia novas tentativas nele por um
+período que dobra a cada falha.
+"""
+import logging
+import time
+from collections import namedtuple
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+OperatingPoint = namedtuple('OperatingPoint', 'detect_every detection_scale scale_factor min_neighbors '
+                                              'jpeg_quality preview_scale frame_skip')
+OperatingPoint.__doc__ = """
+Ponto de operação do pipeline de vídeo.
+detect_every: executa a detecção a cada N frames (os demais reaplicam o último resultado).
+detection_scale / preview_scale: multiplicam o divisor configurado das renditions (1.0 mantém o tamanho).
+scale_factor / min_neighbors: parâmetros do detectMultiScale.
+jpeg_quality: qualidade do JPEG do preview (0 a 100).
+frame_skip: frames decodificados descartados entre dois processados.
+"""
+
+# Do mais caro ao mais barato; o primeiro degrau é o comportamento sem governador.
+DEFAULT_LADDER = (
+    OperatingPoint(1, 1.0, 1.3, 5, 95, 1.0, 0),
+    OperatingPoint(2, 1.0, 1.3, 5, 85, 1.0, 0),
+    OperatingPoint(2, 1.5, 1.3, 4, 80, 1.0, 0),
+    OperatingPoint(3, 1.5, 1.4, 4, 75, 1.25, 0),
+    OperatingPoint(4, 2.0, 1.5, 3, 70, 1.25, 0),
+    OperatingPoint(6, 2.0, 1.6, 3, 60, 1.5, 1),
+)
+
+
+class FrameBudgetGovernor:
+    """ Classe para adaptar o pipeline de vídeo ao orçamento de tempo por frame. """
+
+    def __init__(self, target_fps=30.0, ladder=DEFAULT_LADDER, level=0, alpha=0.1, degrade_frames=10,
+                 upgrade_frames=90, upgrade_ratio=0.6, retry_interval=5.0, max_retry_interval=120.0):
+        """
+        :param target_fps: taxa de frames a sustentar (a da fonte, para não acumular atraso).
+        :param ladder: pontos de operação, do mais caro ao mais barato.
+        :param level: degrau inicial.
+        :param alpha: peso da amostra na média móvel exponencial.
+        :param degrade_frames: frames seguidos acima do orçamento para descer um degrau.
+        :param upgrade_frames: frames seguidos com folga para subir um degrau.
+        :param upgrade_ratio: fração do orçamento abaixo da qual há folga.
+        :param retry_interval: bloqueio inicial de um degrau que estourou o orçamento logo após a subida.
+        :param max_retry_interval: bloqueio máximo (s).
+        """
+        self._ladder = tuple(ladder)
+        self._alpha = alpha
+        self._degrade_frames = degrade_frames
+        self._upgrade_frames = upgrade_frames
+        self._upgrade_ratio = upgrade_ratio
+        self._retry_interval = retry_interval
+        self._max_retry_interval = max_retry_interval
+        self._lock = Lock()
+        self._listeners = []
+        self._level = min(max(level, 0), len(self._ladder) - 1)
+        self._budget = 1.0 / target_fps
+        self._frame_time = None
+        self._over = 0
+        self._under = 0
+        self._frame = 0
+        # Frames processados desde a última mudança de ponto (agenda da detecção).
+        self._processed = 0
+        # Frames ignorados pelas decisões após uma mudança, enquanto a média converge para o novo custo.
+        self._settle = 0
+        self._upgraded_at = None
+        self._blocked = {}
+        self._stats = {'frames': 0, 'detections': 0, 'skipped': 0, 'degrades': 0, 'upgrades': 0}
+
+    @property
+    def point(self):
+        """ Ponto de operação corrente. """
+        return self._ladder[self._level]
+
+    @property
+    def level(self):
+        """ Degrau corrente (0 é o mais caro). """
+        return self._level
+
+    @property
+    def target_fps(self):
+        """ Taxa de frames alvo. """
+        return 1.0 / self._budget
+
+    def set_target_fps(self, target_fps):
+        """ Altera a taxa alvo (as medições seguem valendo). """
+        with self._lock:
+            self._budget = 1.0 / target_fps
+            self._over = self._under = 0
+        return self
+
+    def add_listener(self, callback):
+        """ Registra um callback(point) chamado quando o ponto de operação muda. """
+        self._listeners.append(callback)
+        return self
+
+    def skip(self):
+        """ Indica se o frame decodificado deve ser descartado sem processamento. """
+        self._frame += 1
+        if self._frame % (self.point.frame_skip + 1):
+            self._stats['skipped'] += 1
+            return True
+        return False
+
+    def should_detect(self):
+        """ Indica se a detecção roda neste frame (os demais reaplicam o último resultado). """
+        detect = self._processed % self.point.detect_every == 0
+        if detect:
+            self._stats['detections'] += 1
+        return detect
+
+    def record(self, elapsed):
+        """
+        Registra o tempo de processamento de um frame e ajusta o ponto de operação.
+        Chamado pela thread de vídeo, entre dois frames: os listeners aplicam o novo ponto antes do próximo.
+        :param elapsed: segundos gastos no frame.
+        :return: o ponto de operação (novo, se alterado).
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._processed += 1
+            self._stats['frames'] += 1
+            self._frame_time = elapsed if self._frame_time is None else \
+                self._alpha * elapsed + (1 - self._alpha) * self._frame_time
+            # Frames descartados aumentam o tempo disponível para os processados.
+            budget = self._budget * (self.point.frame_skip + 1)
+            if self._settle:
+                self._settle -= 1
+            elif self._frame_time > budget:
+                self._over += 1
+                self._under = 0
+            elif self._frame_time < budget * self._upgrade_ratio:
+                self._under += 1
+                self._over = 0
+            else:
+                self._over = self._under = 0
+            level = self._level
+            if self._over >= self._degrade_frames and level < len(self._ladder) - 1:
+                self._degrade(now)
+            elif self._under >= self._upgrade_frames and level > 0 and self._blocked.get(level - 1, (0, 0))[0] <= now:
+                self._upgrade(now)
+            changed = level != self._level
+            point = self.point
+        if changed:
+            for callback in self._listeners:
+                try:
+                    callback(point)
+                except Exception as ex:
+                    logger.error({'action': 'frame_governor', 'listener': callback, 'ex': ex})
+        return point
+
+    def _degrade(self, now):
+        level = self._level
+        if self._upgraded_at is not None and now - self._upgraded_at < self._retry_interval:
+            # A subida não se sustentou: o degrau fica bloqueado por mais tempo a cada falha.
+            _, interval = self._blocked.get(level, (0, self._retry_interval / 2))
+            interval = min(interval * 2, self._max_retry_interval)
+            self._blocked[level] = (now + interval, interval)
+        self._change(level + 1)
+        self._upgraded_at = None
+        self._stats['degrades'] += 1
+
+    def _upgrade(self, now):
+        self._change(self._level - 1)
+        self._upgraded_at = now
+        self._stats['upgrades'] += 1
+
+    def _change(self, level):
+        logger.info({'action': 'frame_governor', 'from': self._level, 'to': level,
+                     'frame_ms': round(self._frame_time * 1000, 2), 'budget_ms': round(self._budget * 1000, 2)})
+        self._level = level
+        self._over = self._under = 0
+        self._settle = int(2 / self._alpha)
+        # A detecção roda no primeiro frame do novo ponto (as marcações anteriores estão em outra escala).
+        self._processed = 0
+
+    def stats(self):
+        """ Ponto de operação corrente e medições. """
+        with self._lock:
+            now = time.monotonic()
+            return {
+                'level': self._level,
+                'levels': len(self._ladder),
+                'point': self.point._asdict(),
+                'target_fps': round(1.0 / self._budget, 2),
+                'budget_ms': round(self._budget * 1000, 2),
+                'frame_ms': round(self._frame_time * 1000, 2) if self._frame_time is not None else None,
+                'blocked': {level: round(until - now, 1) for level, (until, _) in self._blocked.items() if until > now},
+                **self._stats,
+            }
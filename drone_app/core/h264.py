@@ -0,0 +1,348 @@
+# coding=utf-8
+"""
+Módulo do Parser H.264 (Annex-B).
+
+Fica entre o socket de vídeo e o decodificador. Os bytes recebidos em pacotes
+de até 1460 bytes são repassados à medida que chegam, mas cada NAL unit é
+identificada pelo código de início (00 00 01 / 00 00 00 01), mesmo quando ele
+é dividido entre pacotes. Com o cabeçalho de cada NAL o parser:
+
+- guarda o SPS e o PPS mais recentes (com largura, altura e tamanho do frame_num);
+- acompanha o frame_num das fatias e detecta frames perdidos (salto na sequência);
+- após a perda descarta as fatias até o próximo IDR, em vez de entregar ao
+  decodificador dados que só produziriam imagens borradas;
+- no IDR que encerra a perda, reenvia o SPS/PPS guardados se eles não vieram
+  junto, o que também permite reiniciar um decodificador sem esperar por eles.
+
+A perda de pacotes dentro de um único frame não altera o frame_num; esses
+casos só são percebidos pelo decodificador.
+"""
+from threading import Lock
+
+START_CODE = b'\x00\x00\x01'
+# Bytes do início da NAL suficientes para ler o cabeçalho da fatia.
+HEADER_BYTES = 32
+
+NAL_SLICE = 1
+NAL_PARTITION_A = 2
+NAL_PARTITION_C = 4
+NAL_IDR = 5
+NAL_SPS = 7
+NAL_PPS = 8
+
+HIGH_PROFILES = (100, 110, 122, 244, 44, 83, 86, 118, 128, 138, 139, 134, 135)
+
+
+class BitReader:
+    """ Classe para ler bits e códigos Exp-Golomb de um RBSP. """
+
+    def __init__(self, data):
+        self._data = data
+        self._pos = 0
+
+    def u(self, bits):
+        """ Inteiro sem sinal de ``bits`` bits. """
+        value = 0
+        for _ in range(bits):
+            byte = self._data[self._pos >> 3]
+            value = (value << 1) | ((byte >> (7 - (self._pos & 7))) & 1)
+            self._pos += 1
+        return value
+
+    def ue(self):
+        """ Exp-Golomb sem sinal. """
+        zeros = 0
+        while self.u(1) == 0:
+            zeros += 1
+            if zeros > 31:
+                raise ValueError('Exp-Golomb inválido.')
+        return (1 << zeros) - 1 + self.u(zeros)
+
+    def se(self):
+        """ Exp-Golomb com sinal. """
+        value = self.ue()
+        return (value + 1) // 2 if value & 1 else -(value // 2)
+
+
+def rbsp(payload):
+    """ Remove os bytes de prevenção de emulação (00 00 03) do conteúdo da NAL. """
+    if b'\x00\x00\x03' not in payload:
+        return bytes(payload)
+    out, zeros = bytearray(), 0
+    for byte in payload:
+        if zeros >= 2 and byte == 3:
+            zeros = 0
+            continue
+        out.append(byte)
+        zeros = zeros + 1 if byte == 0 else 0
+    return bytes(out)
+
+
+def parse_sps(nal):
+    """
+    Lê os campos do SPS necessários para acompanhar o fluxo.
+    :param nal: NAL completa, sem o código de início.
+    :return: dict com sps_id, profile, level, width, height, log2_max_frame_num, frame_num_gaps e
+        separate_colour_plane.
+    """
+    reader = BitReader(rbsp(nal[1:]))
+    profile, _, level = reader.u(8), reader.u(8), reader.u(8)
+    sps_id = reader.ue()
+    chroma_format, separate_colour_plane = 1, 0
+    if profile in HIGH_PROFILES:
+        chroma_format = reader.ue()
+        if chroma_format == 3:
+            separate_colour_plane = reader.u(1)
+        reader.ue()
+        reader.ue()
+        reader.u(1)
+        if reader.u(1):
+            for i in range(8 if chroma_format != 3 else 12):
+                if reader.u(1):
+                    last, following = 8, 8
+                    for _ in range(16 if i < 6 else 64):
+                        if following:
+                            following = (last + reader.se() + 256) % 256
+                        last = following or last
+    log2_max_frame_num = reader.ue() + 4
+    poc_type = reader.ue()
+    if poc_type == 0:
+        reader.ue()
+    elif poc_type == 1:
+        reader.u(1)
+        reader.se()
+        reader.se()
+        for _ in range(reader.ue()):
+            reader.se()
+    reader.ue()
+    frame_num_gaps = reader.u(1)
+    width_mbs, height_units = reader.ue() + 1, reader.ue() + 1
+    frame_mbs_only = reader.u(1)
+    if not frame_mbs_only:
+        reader.u(1)
+    reader.u(1)
+    width, height = width_mbs * 16, height_units * 16 * (2 - frame_mbs_only)
+    if reader.u(1):
+        left, right, top, bottom = reader.ue(), reader.ue(), reader.ue(), reader.ue()
+        crop_x = 1 if chroma_format in (0, 3) or separate_colour_plane else 2
+        crop_y = (2 - frame_mbs_only) * (2 if chroma_format == 1 and not separate_colour_plane else 1)
+        width -= (left + right) * crop_x
+        height -= (top + bottom) * crop_y
+    return {'sps_id': sps_id, 'profile': profile, 'level': level, 'width': width, 'height': height,
+            'log2_max_frame_num': log2_max_frame_num, 'frame_num_gaps': frame_num_gaps,
+            'separate_colour_plane': separate_colour_plane}
+
+
+def parse_slice_header(header, sps):
+    """
+    Lê o início do cabeçalho da fatia.
+    :return: tupla (first_mb_in_slice, frame_num).
+    """
+    reader = BitReader(rbsp(header[1:]))
+    first_mb = reader.ue()
+    reader.ue()
+    reader.ue()
+    if sps['separate_colour_plane']:
+        reader.u(2)
+    return first_mb, reader.u(sps['log2_max_frame_num'])
+
+
+class H264Parser:
+    """ Classe para acompanhar o fluxo H.264 entre o socket e o decodificador. """
+
+    def __init__(self):
+        self._lock = Lock()
+        # Bytes ainda não repassados: final do pacote (possível código de início) ou cabeçalho incompleto.
+        self._tail = b''
+        self._in_header = False
+        self._start_code = b''
+        self._forward = True
+        self._collect = None
+        self._collect_type = None
+        self._synced = False
+        self._inject = False
+        self._sps = {}
+        self._sps_nal = {}
+        self._pps_nal = {}
+        self._fresh_parameter_sets = False
+        self._active_sps = None
+        self._prev_ref_frame_num = None
+        self._stats = {'packets': 0, 'bytes': 0, 'nals': 0, 'idr': 0, 'sps': 0, 'pps': 0, 'gaps': 0,
+                       'resyncs': 0, 'corrupt': 0, 'dropped_nals': 0, 'dropped_bytes': 0, 'injected': 0}
+
+    @property
+    def synced(self):
+        """ Indica se as fatias estão sendo repassadas (desde o último IDR, sem perdas). """
+        return self._synced
+
+    def parameter_sets(self):
+        """ SPS e PPS guardados, com códigos de início (prontos para um novo decodificador). """
+        with self._lock:
+            return self._parameter_sets()
+
+    def _parameter_sets(self):
+        nals = list(self._sps_nal.values()) + list(self._pps_nal.values())
+        return b''.join(b'\x00\x00\x00\x01' + nal for nal in nals)
+
+    def reset(self):
+        """ Reinicia a sincronização (ex: novo decodificador): aguarda o próximo IDR e reenvia SPS/PPS. """
+        with self._lock:
+            self._lose()
+        return self
+
+    def stats(self):
+        """ Contadores do fluxo, estado da sincronização e resolução do SPS ativo. """
+        with self._lock:
+            stats = dict(self._stats, synced=self._synced)
+            if self._active_sps:
+                stats.update(width=self._active_sps['width'], height=self._active_sps['height'],
+                             profile=self._active_sps['profile'], level=self._active_sps['level'])
+            return stats
+
+    def feed(self, data):
+        """
+        Processa um pacote recebido.
+        :param data: bytes do pacote.
+        :return: bytes a repassar ao decodificador (pode ser vazio).
+        """
+        with self._lock:
+            self._stats['packets'] += 1
+            self._stats['bytes'] += len(data)
+            buf = self._tail + bytes(data)
+            out = bytearray()
+            pos = 0
+            while True:
+                i = buf.find(START_CODE, pos)
+                if i >= 0 and i > pos and buf[i - 1] == 0:
+                    # Código de início de 4 bytes (o zero extra pertence à próxima NAL).
+                    i -= 1
+                if self._in_header:
+                    if i >= 0:
+                        self._begin(buf[pos:i], True, out)
+                    else:
+                        # Os 3 últimos bytes podem ser o início do próximo código de início.
+                        available = len(buf) - 3 - pos
+                        needed = HEADER_BYTES if available > 0 and buf[pos] & 0x1F == NAL_SLICE else 1
+                        if available >= needed:
+                            self._begin(buf[pos:len(buf) - 3], False, out)
+                            pos = len(buf) - 3
+                        self._tail = buf[pos:]
+                        return bytes(out)
+                else:
+                    end = i if i >= 0 else max(pos, len(buf) - 3)
+                    self._body(buf[pos:end], out)
+                    if i < 0:
+                        self._tail = buf[end:]
+                        return bytes(out)
+                    if self._collect is not None:
+                        self._finish_parameter_set(out)
+                code_length = 4 if buf[i] == 0 and buf[i + 1:i + 4] == START_CODE else 3
+                self._start_code = buf[i:i + code_length]
+                self._in_header = True
+                pos = i + code_length
+
+    def _body(self, chunk, out):
+        if not chunk:
+            return
+        if self._collect is not None:
+            self._collect += chunk
+        elif self._forward:
+            out += chunk
+        else:
+            self._stats['dropped_bytes'] += len(chunk)
+
+    def _begin(self, header, complete, out):
+        """ Decide o destino da NAL a partir do seu cabeçalho (``complete`` indica a NAL inteira). """
+        self._in_header = False
+        if not header:
+            self._forward = False
+            return
+        self._stats['nals'] += 1
+        nal_type = header[0] & 0x1F
+        if header[0] & 0x80:
+            # forbidden_zero_bit: NAL corrompida.
+            self._stats['corrupt'] += 1
+            self._lose()
+            self._drop(header)
+            return
+        if nal_type in (NAL_SPS, NAL_PPS):
+            self._collect = bytearray(header)
+            self._collect_type = nal_type
+            self._forward = True
+            if complete:
+                self._finish_parameter_set(out)
+            return
+        if nal_type == NAL_IDR:
+            self._stats['idr'] += 1
+            if not self._synced:
+                if self._inject:
+                    # Fim de uma perda (ou decodificador reiniciado): garante SPS/PPS antes do IDR.
+                    self._stats['resyncs'] += 1
+                    if not self._fresh_parameter_sets and self._pps_nal:
+                        out += self._parameter_sets()
+                        self._stats['injected'] += 1
+                self._synced, self._inject = True, False
+            self._fresh_parameter_sets = False
+            self._prev_ref_frame_num = 0
+            self._emit(header, out)
+            return
+        if NAL_SLICE <= nal_type <= NAL_PARTITION_C:
+            self._fresh_parameter_sets = False
+            if not self._synced or not self._check_slice(header, nal_type):
+                self._drop(header)
+                return
+        self._emit(header, out)
+
+    def _check_slice(self, header, nal_type):
+        """ Verifica a continuidade do frame_num; retorna False (e perde a sincronização) em um salto. """
+        sps = self._active_sps
+        if nal_type != NAL_SLICE or sps is None or sps['frame_num_gaps']:
+            return True
+        try:
+            first_mb, frame_num = parse_slice_header(header, sps)
+        except (IndexError, ValueError):
+            # Cabeçalho maior que o trecho lido: segue sem verificar.
+            return True
+        if first_mb == 0 and self._prev_ref_frame_num is not None:
+            max_frame_num = 1 << sps['log2_max_frame_num']
+            expected = (self._prev_ref_frame_num + 1) % max_frame_num
+            if frame_num not in (self._prev_ref_frame_num, expected):
+                self._stats['gaps'] += 1
+                self._lose()
+                return False
+        if header[0] & 0x60:
+            self._prev_ref_frame_num = frame_num
+        return True
+
+    def _lose(self):
+        self._synced = False
+        self._inject = True
+        self._prev_ref_frame_num = None
+
+    def _emit(self, header, out):
+        self._forward = True
+        out += self._start_code
+        out += header
+
+    def _drop(self, header):
+        self._forward = False
+        self._stats['dropped_nals'] += 1
+        self._stats['dropped_bytes'] += len(self._start_code) + len(header)
+
+    def _finish_parameter_set(self, out):
+        """ Guarda o SPS/PPS completo e o repassa (parâmetros sempre chegam ao decodificador). """
+        nal, self._collect = bytes(self._collect), None
+        try:
+            if self._collect_type == NAL_SPS:
+                sps = parse_sps(nal)
+                self._sps[sps['sps_id']], self._sps_nal[sps['sps_id']] = sps, nal
+                self._active_sps = sps
+                self._stats['sps'] += 1
+            else:
+                self._pps_nal[BitReader(rbsp(nal[1:])).ue()] = nal
+                self._stats['pps'] += 1
+            self._fresh_parameter_sets = True
+        except (IndexError, ValueError):
+            self._stats['corrupt'] += 1
+        out += self._start_code
+        out += nal
@@ -0,0 +1,140 @@
+# coding=utf-8
+"""
+Módulo de Logs.
+
+As threads da aplicação (recepção de vídeo, comandos, decodificação) apenas
+enfileiram o registro; a formatação (JSON compacto) e a escrita acontecem em
+uma thread própria (QueueListener). Ações de alta frequência são amostradas
+ou limitadas por taxa no momento do log, e o registro que passa leva os
+contadores agregados do que foi descartado. Com a fila cheia o registro é
+descartado: o log nunca bloqueia quem o emite.
+"""
+import atexit
+import json
+import logging
+import queue
+import sys
+import time
+from collections import namedtuple
+from logging.handlers import QueueHandler, QueueListener
+from threading import Lock
+
+SampleRule = namedtuple('SampleRule', 'every rate')
+SampleRule.__new__.__defaults__ = (None, None)
+SampleRule.__doc__ = """ Regra de amostragem: um a cada ``every`` registros e/ou no máximo ``rate`` por segundo. """
+
+DEFAULT_RULES = {
+    'receive_video': SampleRule(every=1000),
+    'receive_response': SampleRule(rate=20),
+    'receive_state': SampleRule(rate=1),
+}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """ Classe para formatar o registro como uma linha JSON compacta. """
+
+    def format(self, record):
+        data = {
+            't': round(record.created, 3),
+            'lvl': record.levelname,
+            'log': record.name,
+        }
+        if isinstance(record.msg, dict):
+            data.update(record.msg)
+        else:
+            data['msg'] = record.getMessage()
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, separators=(',', ':'), default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """ Classe para amostrar ou limitar por taxa os registros de cada ação. """
+
+    def __init__(self, rules=None):
+        super().__init__()
+        self._rules = DEFAULT_RULES if rules is None else rules
+        self._lock = Lock()
+        # Por ação: [total, descartados desde o último registro, início da janela, registros na janela].
+        self._counters = {}
+
+    def counters(self):
+        """ Total de registros e descartes por ação amostrada. """
+        with self._lock:
+            return {action: {'count': c[0], 'suppressed': c[1]} for action, c in self._counters.items()}
+
+    def filter(self, record):
+        msg = record.msg
+        if not isinstance(msg, dict):
+            return True
+        rule = self._rules.get(msg.get('action'))
+        if rule is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            counter = self._counters.setdefault(msg['action'], [0, 0, now, 0])
+            counter[0] += 1
+            accept = rule.every is None or (counter[0] - 1) % rule.every == 0
+            if accept and rule.rate is not None:
+                if now - counter[2] >= 1.0:
+                    counter[2], counter[3] = now, 0
+                accept = counter[3] < rule.rate
+                if accept:
+                    counter[3] += 1
+            if not accept:
+                counter[1] += 1
+                return False
+            count, suppressed, counter[1] = counter[0], counter[1], 0
+        if suppressed:
+            record.msg = dict(msg, count=count, suppressed=suppressed)
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """ Classe para enfileirar o registro sem formatar e sem bloquear. """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # A formatação acontece na thread do QueueListener.
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(handler=None, level=logging.INFO, rules=None, json_format=True, queue_size=10000):
+    """
+    Configura o log da aplicação (idempotente).
+    :param handler: destino final (padrão: stdout).
+    :param level: nível mínimo.
+    :param rules: dict ação -> SampleRule (padrão: DEFAULT_RULES).
+    :param json_format: utiliza o JsonFormatter.
+    :param queue_size: tamanho máximo da fila.
+    :return: QueueListener
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    handler = handler or logging.StreamHandler(sys.stdout)
+    if json_format:
+        handler.setFormatter(JsonFormatter())
+    log_queue = queue.Queue(queue_size)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(rules))
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
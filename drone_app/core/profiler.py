@@ -0,0 +1,156 @@
+# coding=utf-8
+"""
+Módulo do Profiler sob Demanda.
+
+Durante o intervalo pedido, amostra as pilhas de todas as threads do processo
+(``sys._current_frames``) e agrega o resultado no formato de pilhas colapsadas
+(``thread;modulo:funcao:linha;... contagem``), aceito por flamegraph.pl,
+speedscope e similares. O rastreamento de alocações usa ``tracemalloc`` somente
+durante o intervalo e devolve os locais que mais alocaram, também por frame de
+vídeo decodificado no intervalo (quando há vídeo). Fora das coletas
+nada é instrumentado: o custo com o profiler inativo é zero.
+"""
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, namedtuple
+
+from drone_app.core.sigleton import Singleton
+
+MIN_INTERVAL = 0.001
+MAX_STACK_DEPTH = 128
+
+AllocationSite = namedtuple('AllocationSite', 'site size_kb size_diff_kb count count_diff size_per_frame '
+                                              'count_per_frame')
+AllocationSite.__doc__ = """
+Local de alocação: pilha (arquivo:linha), memória total e variação no intervalo, e a variação por frame de
+vídeo (bytes e alocações; None sem frames decodificados no intervalo).
+"""
+
+
+class ProfilerBusyError(RuntimeError):
+    """ Já existe uma coleta em andamento. """
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    module = frame.f_globals.get('__name__') or os.path.basename(code.co_filename)
+    return f'{module}:{code.co_name}:{frame.f_lineno}'
+
+
+def _thread_label(thread):
+    """ Nome da thread; threads sem nome usam a função alvo (ex: receive_video). """
+    target = getattr(thread, '_target', None)
+    name = getattr(target, '__name__', None)
+    if name and name not in thread.name:
+        return f'{thread.name} ({name})'
+    return thread.name
+
+
+class SamplingProfiler(metaclass=Singleton):
+    """ Classe para coletar pilhas e alocações do processo sob demanda. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @property
+    def is_running(self):
+        """ Indica se há uma coleta em andamento. """
+        return self._lock.locked()
+
+    def _acquire(self):
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusyError('Já existe uma coleta em andamento.')
+
+    def sample_stacks(self, duration, interval=0.005):
+        """
+        Amostra as pilhas de todas as threads.
+        :param duration: segundos de coleta.
+        :param interval: intervalo entre amostras (s).
+        :return: tupla (Counter pilha -> amostras, quantidade de amostras).
+        """
+        self._acquire()
+        try:
+            interval = max(MIN_INTERVAL, interval)
+            own = threading.get_ident()
+            stacks = Counter()
+            samples = 0
+            deadline = time.monotonic() + duration
+            while time.monotonic() < deadline:
+                threads = {thread.ident: thread for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own:
+                        continue
+                    stack = []
+                    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                        stack.append(_frame_label(frame))
+                        frame = frame.f_back
+                    thread = threads.get(ident)
+                    stack.append(_thread_label(thread) if thread else f'thread-{ident}')
+                    stacks[tuple(reversed(stack))] += 1
+                samples += 1
+                time.sleep(interval)
+            return stacks, samples
+        finally:
+            self._lock.release()
+
+    def collapsed(self, duration, interval=0.005):
+        """
+        Pilhas amostradas no formato colapsado (uma pilha por linha).
+        :return: str
+        """
+        stacks, _ = self.sample_stacks(duration, interval)
+        lines = [';'.join(part.replace(';', ',').replace(' ', '_') for part in stack) + f' {count}'
+                 for stack, count in stacks.most_common()]
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _count(frame_counter):
+        """ Leitura do contador de frames de vídeo (None quando indisponível). """
+        if frame_counter is None:
+            return None
+        try:
+            return frame_counter()
+        except Exception:
+            return None
+
+    def allocations(self, duration, limit=25, depth=1, frame_counter=None):
+        """
+        Locais com maior alocação de memória durante o intervalo.
+        :param duration: segundos de coleta.
+        :param limit: quantidade de locais retornados.
+        :param depth: profundidade da pilha de cada local (1 agrupa por linha).
+        :param frame_counter: callable com a quantidade de frames de vídeo decodificados até o momento; a
+            variação de cada local é dividida pelos frames decodificados no intervalo.
+        :return: dict com o total rastreado, o pico, os frames de vídeo e a lista de AllocationSite.
+        """
+        self._acquire()
+        started = False
+        try:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(max(1, depth))
+                started = True
+            key = 'lineno' if depth <= 1 else 'traceback'
+            first = self._count(frame_counter)
+            before = tracemalloc.take_snapshot()
+            time.sleep(duration)
+            after = tracemalloc.take_snapshot()
+            last = self._count(frame_counter)
+            current, peak = tracemalloc.get_traced_memory()
+            frames = last - first if first is not None and last is not None and last > first else None
+            ignore = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__))
+            stats = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), key)
+            sites = [AllocationSite(
+                ' <- '.join(f'{frame.filename}:{frame.lineno}' for frame in stat.traceback),
+                round(stat.size / 1024, 1), round(stat.size_diff / 1024, 1), stat.count, stat.count_diff,
+                round(stat.size_diff / frames, 1) if frames else None,
+                round(stat.count_diff / frames, 3) if frames else None,
+            )._asdict() for stat in stats[:limit]]
+            return {'duration': duration, 'traced_kb': round(current / 1024, 1), 'peak_kb': round(peak / 1024, 1),
+                    'video_frames': frames, 'sites': sites}
+        finally:
+            if started:
+                tracemalloc.stop()
+            self._lock.release()
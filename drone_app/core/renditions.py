@@ -0,0 +1,131 @@
+# coding=utf-8
+"""
+Módulo de Renditions do Vídeo.
+
+O decodificador entrega o frame em resolução cheia e cada consumidor usa o
+tamanho de que precisa: resolução cheia para snapshots e gravação, tamanho
+intermediário para a detecção e tamanho reduzido para o preview. As versões
+reduzidas são geradas com ``cv.resize`` em buffers pré-alocados (um por
+rendition), somente quando alguém as utiliza no frame corrente.
+
+Os buffers são reaproveitados a cada frame: quem precisar guardar o conteúdo
+além da chamada deve copiá-lo.
+"""
+import logging
+from threading import Lock
+
+import cv2 as cv
+import numpy as np
+
+FULL = 'full'
+DETECTION = 'detection'
+PREVIEW = 'preview'
+
+# Divisor da resolução decodificada de cada rendition.
+DEFAULT_RENDITIONS = {FULL: 1, DETECTION: 2, PREVIEW: 3}
+
+logger = logging.getLogger(__name__)
+
+
+class RenditionSet:
+    """ Classe para gerar as renditions de cada frame decodificado. """
+
+    def __init__(self, sizes, interpolation=cv.INTER_AREA):
+        """
+        :param sizes: dict nome -> (largura, altura).
+        :param interpolation: interpolação do cv.resize.
+        """
+        self._interpolation = interpolation
+        self._lock = Lock()
+        self._sizes = {}
+        self._buffers = {}
+        self._subscribers = {}
+        for name, size in sizes.items():
+            self.set_size(name, size)
+
+    @property
+    def sizes(self):
+        """ Tamanho (largura, altura) de cada rendition. """
+        return dict(self._sizes)
+
+    def set_size(self, name, size):
+        """ Define (ou altera em execução) o tamanho de uma rendition; o buffer é alocado no primeiro uso. """
+        with self._lock:
+            self._sizes[name] = (int(size[0]), int(size[1]))
+            self._buffers.pop(name, None)
+        return self
+
+    def subscribe(self, name, callback):
+        """
+        Registra um callback(frame) chamado a cada frame com a rendition pedida.
+        O frame é válido apenas durante a chamada.
+        """
+        if name not in self._sizes:
+            raise KeyError(name)
+        with self._lock:
+            self._subscribers.setdefault(name, []).append(callback)
+        return self
+
+    def unsubscribe(self, name, callback):
+        """ Remove o callback. """
+        with self._lock:
+            callbacks = self._subscribers.get(name, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+        return self
+
+    def frame(self, full):
+        """ Inicia as renditions de um frame decodificado. """
+        return RenditionFrame(self, full)
+
+    def resize(self, name, source):
+        """ Redimensiona a fonte para a rendition no seu buffer (a própria fonte se o tamanho coincidir). """
+        with self._lock:
+            width, height = self._sizes[name]
+            if source.shape[1] == width and source.shape[0] == height:
+                return source
+            buffer = self._buffers.get(name)
+            if buffer is None:
+                buffer = self._buffers[name] = np.empty((height, width, 3), np.uint8)
+        return cv.resize(source, (width, height), dst=buffer, interpolation=self._interpolation)
+
+    def publish(self, rendition_frame):
+        """ Entrega as renditions com assinantes (geradas somente se ainda não existirem). """
+        with self._lock:
+            subscribers = [(name, list(callbacks)) for name, callbacks in self._subscribers.items() if callbacks]
+        for name, callbacks in subscribers:
+            frame = rendition_frame.get(name)
+            for callback in callbacks:
+                try:
+                    callback(frame)
+                except Exception as ex:
+                    logger.error({'action': 'rendition_subscriber', 'rendition': name, 'ex': ex})
+        return self
+
+
+class RenditionFrame:
+    """ Classe com as renditions já geradas para um frame. """
+
+    def __init__(self, rendition_set, full):
+        self._set = rendition_set
+        self._views = {FULL: full}
+
+    @property
+    def full(self):
+        """ Frame em resolução cheia. """
+        return self._views[FULL]
+
+    def get(self, name, source=None):
+        """
+        Recupera a rendition, gerando-a na primeira vez.
+        :param source: frame de origem (padrão: resolução cheia). Usar a detecção já anotada como origem do
+            preview mantém as marcações e reduz o custo do redimensionamento.
+        """
+        if name not in self._views:
+            self._views[name] = self._set.resize(name, self._views[FULL] if source is None else source)
+        return self._views[name]
+
+    def put(self, name, frame):
+        """ Substitui a rendition (ex: frame devolvido por um middleware). """
+        self._views[name] = frame
+        return self
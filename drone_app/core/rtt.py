@@ -0,0 +1,102 @@
+# coding=utf-8
+"""
+Módulo de Estimativa do Tempo de Resposta dos Comandos.
+
+Cada classe de comando (consultas, controle e movimentos) tem um estimador no
+estilo do RTO do TCP (Jacobson/Karels):
+
+    srtt   = (1 - 1/8) * srtt + 1/8 * amostra
+    rttvar = (1 - 1/4) * rttvar + 1/4 * |srtt - amostra|
+    rto    = srtt + 4 * rttvar   (limitado a [MIN_RTO, MAX_RTO])
+
+Nos movimentos a amostra é o excedente sobre a duração prevista pelo modelo
+de duração, ou seja, a parcela de rede e variação do drone. Amostras de
+comandos retransmitidos são descartadas (algoritmo de Karn), e cada timeout
+dobra o intervalo da retransmissão seguinte.
+"""
+from collections import namedtuple
+from threading import Lock
+
+QUERY = 'query'
+CONTROL = 'control'
+MOTION = 'motion'
+
+# Comandos que podem ser reenviados sem efeito colateral (além das consultas "?").
+IDEMPOTENT_COMMANDS = ('command', 'streamon', 'streamoff', 'speed', 'mon', 'moff', 'mdirection')
+CONTROL_COMMANDS = IDEMPOTENT_COMMANDS + ('emergency', 'stop', 'wifi', 'ap')
+
+INITIAL_RTO = 1.0
+MIN_RTO = 0.2
+MAX_RTO = 10.0
+ALPHA = 1.0 / 8.0
+BETA = 1.0 / 4.0
+K = 4.0
+
+RttStats = namedtuple('RttStats', 'srtt rttvar rto samples retransmits timeouts')
+RttStats.__doc__ = """ Estado do estimador de uma classe de comandos. """
+
+
+def command_class(command):
+    """ Classe do comando para a estimativa do tempo de resposta (comando vazio é tratado como movimento). """
+    parts = command.split()
+    if not parts:
+        return MOTION
+    if command.endswith('?'):
+        return QUERY
+    if parts[0] in CONTROL_COMMANDS:
+        return CONTROL
+    return MOTION
+
+
+def is_idempotent(command):
+    """ Indica se o comando pode ser retransmitido com segurança (nunca movimentos ou comandos vazios). """
+    parts = command.split()
+    return bool(parts) and (command.endswith('?') or parts[0] in IDEMPOTENT_COMMANDS)
+
+
+class RttEstimator:
+    """ Classe para estimar o tempo de resposta e o timeout de uma classe de comandos. """
+
+    def __init__(self, initial_rto=INITIAL_RTO):
+        self._lock = Lock()
+        self._srtt = None
+        self._rttvar = None
+        self._rto = initial_rto
+        self._samples = 0
+        self._retransmits = 0
+        self._timeouts = 0
+
+    @property
+    def rto(self):
+        """ Timeout corrente (s). """
+        return self._rto
+
+    def sample(self, rtt):
+        """ Registra uma amostra de tempo de resposta (s) de um comando não retransmitido. """
+        rtt = max(0.0, rtt)
+        with self._lock:
+            if self._srtt is None:
+                self._srtt, self._rttvar = rtt, rtt / 2.0
+            else:
+                self._rttvar = (1.0 - BETA) * self._rttvar + BETA * abs(self._srtt - rtt)
+                self._srtt = (1.0 - ALPHA) * self._srtt + ALPHA * rtt
+            self._rto = min(MAX_RTO, max(MIN_RTO, self._srtt + K * self._rttvar))
+            self._samples += 1
+        return self
+
+    def backoff(self, attempt):
+        """ Timeout da tentativa (0 é o envio original): dobra a cada retransmissão. """
+        return min(MAX_RTO, self._rto * 2 ** attempt)
+
+    def timeout(self, retransmit=False):
+        """ Contabiliza um timeout (e a retransmissão que o segue). """
+        with self._lock:
+            self._timeouts += 1
+            if retransmit:
+                self._retransmits += 1
+        return self
+
+    def stats(self):
+        """ Estado do estimador. """
+        with self._lock:
+            return RttStats(self._srtt, self._rttvar, self._rto, self._samples, self._retransmits, self._timeouts)
@@ -0,0 +1,197 @@
+# coding=utf-8
+"""
+Módulo do Agendador de Patrulhamento.
+
+Uma única thread atende todos os patrulhamentos com temporizadores
+interrompíveis (heap + Condition): cada passo termina quando o drone responde
+ao comando enviado (ou no timeout) e o cancelamento tem efeito imediato, sem
+``time.sleep`` nem espera pela thread.
+"""
+import heapq
+import itertools
+import logging
+import time
+from threading import Condition, Lock, Thread
+
+from drone_app.core.sigleton import Singleton
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledTask:
+    """ Classe para uma tarefa agendada. """
+
+    __slots__ = ('deadline', 'callback', 'args', 'cancelled')
+
+    def __init__(self, deadline, callback, args):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        """ Cancela a tarefa (a thread do agendador apenas a descarta). """
+        self.cancelled = True
+
+
+class PatrolScheduler(metaclass=Singleton):
+    """ Classe do agendador compartilhado pelos patrulhamentos. """
+
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = Condition()
+        self._thread = None
+
+    def _start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = Thread(target=self._run, name='PatrolScheduler', daemon=True)
+            self._thread.start()
+
+    def call_later(self, delay, callback, *args):
+        """
+        Agenda a execução do callback.
+        :param delay: segundos até a execução.
+        :return: ScheduledTask
+        """
+        task = ScheduledTask(time.monotonic() + max(0.0, delay), callback, args)
+        with self._condition:
+            self._start()
+            heapq.heappush(self._heap, (task.deadline, next(self._counter), task))
+            # Acorda a thread: a nova tarefa pode vencer antes da atual.
+            self._condition.notify()
+        return task
+
+    def call_soon(self, callback, *args):
+        """ Agenda a execução imediata do callback (thread-safe). """
+        return self.call_later(0, callback, *args)
+
+    def _next_task(self):
+        """ Aguarda a próxima tarefa vencida. """
+        with self._condition:
+            while True:
+                while self._heap and self._heap[0][2].cancelled:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                timeout = self._heap[0][0] - time.monotonic()
+                if timeout <= 0:
+                    return heapq.heappop(self._heap)[2]
+                self._condition.wait(timeout)
+
+    def _run(self):
+        """ Laço da thread do agendador. """
+        while True:
+            task = self._next_task()
+            try:
+                task.callback(*task.args)
+            except Exception as ex:
+                logger.error({'action': 'patrol_scheduler', 'callback': repr(task.callback), 'ex': ex})
+
+    def __len__(self):
+        with self._condition:
+            return sum(1 for _, _, task in self._heap if not task.cancelled)
+
+
+class PatrolRoutine:
+    """
+    Classe de um patrulhamento executado pelo agendador.
+    A cada passo o patrol_middleware é processado; se ele enviou comandos ao
+    drone, o próximo passo aguarda a resposta (ou o timeout).
+    """
+
+    def __init__(self, drone_manager, patrol_middleware, scheduler=None, settle=0.0, timeout=10.0, idle=0.1,
+                 on_status=None):
+        self._drone_manager = drone_manager
+        self._on_status = on_status
+        self._patrol_middleware = patrol_middleware
+        self._scheduler = scheduler or PatrolScheduler()
+        self._settle = settle
+        self._timeout = timeout
+        self._idle = idle
+        self._status = 0
+        self._waiting = False
+        self._replied = False
+        self._task = None
+        self._active = False
+        self._lock = Lock()
+
+    @property
+    def active(self):
+        """ Indica se o patrulhamento está em execução. """
+        return self._active
+
+    @property
+    def status(self):
+        """ Expõe o status do último passo. """
+        return self._status
+
+    def start(self):
+        """ Inicia o patrulhamento. """
+        if not self._active:
+            self._active = True
+            self._status = 0
+            self._drone_manager.add_reply_listener(self._on_reply)
+            self._task = self._scheduler.call_soon(self._step)
+        return self
+
+    def cancel(self):
+        """ Interrompe o patrulhamento imediatamente. """
+        with self._lock:
+            self._active = False
+            self._waiting = False
+            if self._task:
+                self._task.cancel()
+        self._drone_manager.remove_reply_listener(self._on_reply)
+        return self
+
+    def _step(self):
+        """ Executa um passo do patrulhamento; uma falha encerra o patrulhamento (permite reiniciá-lo). """
+        try:
+            self._advance()
+        except Exception as ex:
+            logger.error({'action': 'patrol_routine', 'status': self._status, 'ex': ex})
+            self.cancel()
+
+    def _advance(self):
+        if not self._active:
+            return
+        sent = self._drone_manager.command_count
+        with self._lock:
+            # Em espera antes do envio: a resposta pode chegar antes do retorno do process.
+            self._waiting, self._replied, self._task = True, False, None
+        self._status += 1
+        if self._patrol_middleware:
+            self._status = self._patrol_middleware.process(self._status)
+        if self._on_status:
+            self._on_status(self._status)
+        with self._lock:
+            if not self._active:
+                return
+            if self._drone_manager.command_count == sent or self._replied:
+                # Nenhum comando enviado ou resposta já recebida: segue para o próximo passo.
+                self._waiting = False
+                self._task = self._scheduler.call_later(self._settle if self._replied else self._idle, self._step)
+            else:
+                self._task = self._scheduler.call_later(self._timeout, self._on_timeout)
+
+    def _on_reply(self, command, response):
+        """ Resposta do drone (thread do comando): agenda o próximo passo. """
+        with self._lock:
+            if not (self._active and self._waiting):
+                return
+            self._replied = True
+            # Sem tarefa: o passo ainda está em execução e tratará a resposta.
+            if self._task:
+                self._task.cancel()
+                self._waiting = False
+                self._task = self._scheduler.call_later(self._settle, self._step)
+
+    def _on_timeout(self):
+        with self._lock:
+            if not (self._active and self._waiting):
+                return
+            self._waiting = False
+        logger.warning({'action': 'patrol_routine', 'status': self._status, 'reply': 'timeout'})
+        self._step()
@@ -0,0 +1,139 @@
+# coding=utf-8
+"""
+Módulo de Snapshot Assíncrono.
+
+Mantém um anel com os últimos frames processados e delega a codificação JPEG e
+a gravação em disco para uma thread de segundo plano, para que o pedido de
+snapshot nunca bloqueie a transmissão de vídeo.
+"""
+import logging
+import queue
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+from threading import Lock, Thread
+
+import cv2 as cv
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SnapshotResult = namedtuple('SnapshotResult', 'path data digest')
+SnapshotResult.__doc__ = """ Resultado de um snapshot: caminho do arquivo, bytes JPEG e hash do conteúdo. """
+
+
+class FrameRing:
+    """ Classe para armazenar os últimos N frames em buffers pré-alocados. """
+
+    def __init__(self, size=30):
+        self._size = size
+        self._buffers = None
+        self._times = [0.0] * size
+        self._count = 0
+        self._lock = Lock()
+
+    def __len__(self):
+        return min(self._count, self._size)
+
+    def push(self, frame):
+        """ Copia o frame para a próxima posição do anel. """
+        with self._lock:
+            if self._buffers is None or self._buffers[0].shape != frame.shape:
+                self._buffers = [np.empty_like(frame) for _ in range(self._size)]
+                self._count = 0
+            index = self._count % self._size
+            np.copyto(self._buffers[index], frame)
+            self._times[index] = time.time()
+            self._count += 1
+        return self
+
+    def latest(self, number=1):
+        """
+        Recupera cópias dos últimos frames, do mais antigo para o mais recente.
+        :param number: quantidade de frames.
+        :return: lista de tuplas (timestamp, frame).
+        """
+        with self._lock:
+            number = min(number, len(self))
+            first = self._count - number
+            return [
+                (self._times[i % self._size], self._buffers[i % self._size].copy())
+                for i in range(first, self._count)
+            ]
+
+
+class SnapshotRequest:
+    """ Classe para um pedido de snapshot (simples ou em rajada). """
+
+    def __init__(self, count=1, interval=0.0, frames=None, single=True, drone=''):
+        self.drone = drone
+        self.count = count
+        self.interval = interval
+        self.frames = list(frames or [])
+        self.single = single
+        self.future = Future()
+        self._next_time = 0.0
+
+    @property
+    def is_complete(self):
+        """ Verifica se todos os frames do pedido foram capturados. """
+        return len(self.frames) >= self.count
+
+    def offer(self, frame, now):
+        """
+        Oferece um frame ao vivo para o pedido, respeitando o intervalo da rajada.
+        :return: True quando o frame foi aceito.
+        """
+        if self.is_complete or now < self._next_time:
+            return False
+        self.frames.append((now, frame.copy()))
+        self._next_time = now + self.interval
+        return True
+
+
+class SnapshotWriter:
+    """ Classe que codifica e grava snapshots em uma thread de segundo plano. """
+
+    def __init__(self, store, max_pending=16):
+        self._store = store
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, request):
+        """
+        Agenda a gravação sem bloquear. Se a fila estiver cheia o futuro falha.
+        :param request: SnapshotRequest completo.
+        :return: request.future
+        """
+        try:
+            self._queue.put_nowait(request)
+        except queue.Full:
+            request.future.set_exception(RuntimeError('Fila de snapshots cheia.'))
+        return request.future
+
+    def _write(self, timestamp, frame, drone):
+        """ Codifica o frame e o grava no SnapshotStore. """
+        _, jpeg = cv.imencode('.jpg', frame)
+        jpeg_binary = jpeg.tobytes()
+        record = self._store.put(jpeg_binary, drone, timestamp, frame)
+        return SnapshotResult(self._store.path(record.digest), jpeg_binary, record.digest)
+
+    def _run(self):
+        """ Laço da thread de gravação. """
+        while True:
+            request = self._queue.get()
+            if request is None:
+                break
+            try:
+                results = [self._write(timestamp, frame, request.drone) for timestamp, frame in request.frames]
+                request.future.set_result(results[0] if request.single else results)
+                logger.info({'action': 'snapshot_writer', 'files': [r.path for r in results]})
+            except Exception as ex:
+                logger.error({'action': 'snapshot_writer', 'ex': ex})
+                request.future.set_exception(ex)
+
+    def close(self):
+        """ Encerra a thread de gravação após os pedidos pendentes. """
+        self._queue.put(None)
+        self._thread.join(timeout=5)
@@ -0,0 +1,261 @@
+# coding=utf-8
+"""
+Módulo de Armazenamento de Snapshots.
+
+Os snapshots são endereçados pelo hash do conteúdo (SHA-1). Um índice binário
+compacto (timestamp, drone, tamanho e hash) evita a varredura do diretório,
+miniaturas são geradas no momento da gravação e as imagens mais acessadas são
+servidas a partir da memória. O espaço em disco é limitado por um orçamento
+com descarte LRU.
+"""
+import hashlib
+import logging
+import os
+import struct
+import time
+from collections import OrderedDict, namedtuple
+from threading import RLock
+
+import cv2 as cv
+import numpy as np
+
+from drone_app.core.sigleton import Singleton
+
+logger = logging.getLogger(__name__)
+
+SnapshotRecord = namedtuple('SnapshotRecord', 'timestamp drone size digest')
+SnapshotRecord.__doc__ = """ Registro do índice de snapshots. """
+
+# timestamp (double), drone (16 bytes), tamanho (uint32), sha1 (20 bytes)
+_RECORD = struct.Struct('<d16sI20s')
+
+
+class SnapshotStore(metaclass=Singleton):
+    """ Classe para armazenar snapshots endereçados por conteúdo. """
+
+    def __init__(self, folder, budget=256 * 1024 * 1024, thumb_width=160, cache_size=256):
+        self._folder = folder
+        self._budget = budget
+        self._thumb_width = thumb_width
+        self._cache_size = cache_size
+        self._index_file = os.path.join(folder, 'index.bin')
+        self._lock = RLock()
+        # Ordem LRU: o último item é o acessado mais recentemente.
+        self._records = OrderedDict()
+        # Linha do tempo: ordem de gravação para a paginação da galeria.
+        self._timeline = []
+        self._total_size = 0
+        self._cache = OrderedDict()
+        self._latest = None
+        self._index_stat = (None, 0)
+        self._load()
+
+    def _load(self, offset=0):
+        """ Carrega o índice do disco (a partir do offset, para registros novos). """
+        try:
+            with open(self._index_file, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        usable = len(data) - len(data) % _RECORD.size
+        for values in _RECORD.iter_unpack(data[:usable]):
+            record = self._unpack(values)
+            if record.digest not in self._records:
+                self._records[record.digest] = record
+                self._timeline.append(record.digest)
+                self._total_size += record.size
+        if self._timeline:
+            self._latest = self._records[self._timeline[-1]]
+        self._index_stat = (stat.st_ino, offset + usable)
+        logger.info({'action': 'snapshot_store_load', 'records': len(self._records), 'size': self._total_size})
+
+    def _sync(self):
+        """
+        Acompanha o índice gravado por outro processo (ex: broker do drone).
+        Registros anexados são lidos incrementalmente; um índice compactado é recarregado.
+        """
+        try:
+            stat = os.stat(self._index_file)
+        except FileNotFoundError:
+            return
+        inode, size = self._index_stat
+        if stat.st_ino == inode and stat.st_size == size:
+            return
+        with self._lock:
+            if stat.st_ino == inode and stat.st_size > size:
+                self._load(size)
+            else:
+                self._records.clear()
+                self._timeline = []
+                self._total_size = 0
+                self._latest = None
+                self._load()
+
+    @staticmethod
+    def _unpack(values):
+        timestamp, drone, size, digest = values
+        return SnapshotRecord(timestamp, drone.rstrip(b'\0').decode('utf-8', 'replace'), size, digest.hex())
+
+    @staticmethod
+    def _pack(record):
+        return _RECORD.pack(record.timestamp, record.drone.encode('utf-8')[:16], record.size,
+                            bytes.fromhex(record.digest))
+
+    def _object_path(self, digest, kind='objects'):
+        return os.path.join(self._folder, kind, digest[:2], f'{digest}.jpg')
+
+    def path(self, digest):
+        """ Caminho do arquivo do snapshot. """
+        return self._object_path(digest)
+
+    @staticmethod
+    def _write_file(file_path, data):
+        """ Grava o arquivo de forma atômica. """
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp = f'{file_path}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, file_path)
+
+    def _make_thumbnail(self, data, frame=None):
+        """ Gera a miniatura JPEG a partir do frame (ou dos bytes JPEG). """
+        if frame is None:
+            frame = cv.imdecode(np.frombuffer(data, np.uint8), cv.IMREAD_COLOR)
+        height, width = frame.shape[:2]
+        thumb_height = max(1, int(height * self._thumb_width / width))
+        thumb = cv.resize(frame, (self._thumb_width, thumb_height), interpolation=cv.INTER_AREA)
+        _, jpeg = cv.imencode('.jpg', thumb)
+        return jpeg.tobytes()
+
+    def _cache_put(self, key, data):
+        self._cache[key] = data
+        self._cache.move_to_end(key)
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    def put(self, data, drone='', timestamp=None, frame=None):
+        """
+        Armazena o snapshot.
+        :param data: bytes JPEG.
+        :param drone: identificação do drone.
+        :param timestamp: momento da captura.
+        :param frame: frame original (evita decodificar o JPEG para a miniatura).
+        :return: SnapshotRecord
+        """
+        digest = hashlib.sha1(data).hexdigest()
+        with self._lock:
+            record = self._records.get(digest)
+            if record:
+                self._records.move_to_end(digest)
+                self._latest = record
+                self._cache_put(digest, data)
+                return record
+
+        self._write_file(self._object_path(digest), data)
+        thumbnail = self._make_thumbnail(data, frame)
+        self._write_file(self._object_path(digest, 'thumbs'), thumbnail)
+
+        record = SnapshotRecord(timestamp or time.time(), drone, len(data), digest)
+        with self._lock:
+            self._sync()
+            with open(self._index_file, 'ab') as f:
+                f.write(self._pack(record))
+                self._index_stat = (os.fstat(f.fileno()).st_ino, f.tell())
+            self._records[digest] = record
+            self._timeline.append(digest)
+            self._total_size += record.size
+            self._latest = record
+            self._cache_put(digest, data)
+            self._cache_put(f'{digest}:thumb', thumbnail)
+            self._enforce_budget()
+        return record
+
+    def _enforce_budget(self):
+        """ Remove os snapshots menos acessados até respeitar o orçamento. """
+        evicted = []
+        while self._total_size > self._budget and len(self._records) > 1:
+            digest, record = self._records.popitem(last=False)
+            self._total_size -= record.size
+            evicted.append(digest)
+            for key in (digest, f'{digest}:thumb'):
+                self._cache.pop(key, None)
+            for kind in ('objects', 'thumbs'):
+                try:
+                    os.remove(self._object_path(digest, kind))
+                except FileNotFoundError:
+                    pass
+        if evicted:
+            removed = set(evicted)
+            self._timeline = [d for d in self._timeline if d not in removed]
+            self._compact()
+            logger.info({'action': 'snapshot_store_evict', 'count': len(evicted)})
+
+    def _compact(self):
+        """ Regrava o índice somente com os registros existentes. """
+        tmp = f'{self._index_file}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(b''.join(self._pack(self._records[d]) for d in self._timeline))
+            stat = (os.fstat(f.fileno()).st_ino, f.tell())
+        os.replace(tmp, self._index_file)
+        self._index_stat = stat
+
+    def _read(self, digest, kind='objects'):
+        key = digest if kind == 'objects' else f'{digest}:thumb'
+        self._sync()
+        with self._lock:
+            if digest not in self._records:
+                return None
+            self._records.move_to_end(digest)
+            data = self._cache.get(key)
+            if data is not None:
+                self._cache.move_to_end(key)
+                return data
+        try:
+            with open(self._object_path(digest, kind), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self._cache_put(key, data)
+        return data
+
+    def get(self, digest):
+        """ Recupera os bytes JPEG do snapshot (memória ou disco). """
+        return self._read(digest)
+
+    def thumbnail(self, digest):
+        """ Recupera os bytes JPEG da miniatura. """
+        return self._read(digest, 'thumbs')
+
+    def latest(self):
+        """
+        Recupera o snapshot mais recente.
+        :return: tupla (SnapshotRecord, bytes) ou (None, None).
+        """
+        self._sync()
+        record = self._latest
+        if record is None:
+            return None, None
+        return record, self.get(record.digest)
+
+    def page(self, number=1, per_page=50):
+        """
+        Lista os snapshots do mais recente para o mais antigo, sem acessar o diretório.
+        :return: lista de SnapshotRecord.
+        """
+        self._sync()
+        with self._lock:
+            end = len(self._timeline) - (number - 1) * per_page
+            start = max(0, end - per_page)
+            return [self._records[d] for d in reversed(self._timeline[start:max(0, end)])]
+
+    def __len__(self):
+        self._sync()
+        return len(self._records)
+
+    @property
+    def total_size(self):
+        """ Expõe o espaço ocupado pelos snapshots. """
+        return self._total_size
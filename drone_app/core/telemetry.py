@@ -0,0 +1,124 @@
+# coding=utf-8
+"""
+Módulo de Telemetria.
+
+O estado enviado pelo Tello na porta 8890 e o resultado do último comando são
+mantidos em um único TelemetryHub. Cada cliente (Server-Sent Events) recebe
+apenas os campos alterados desde o seu último evento, na taxa que escolher,
+sem gerar consultas extras no canal de comandos.
+"""
+import json
+import time
+from threading import Lock
+
+from drone_app.core.sigleton import Singleton
+
+MIN_RATE = 0.2
+MAX_RATE = 20.0
+KEEPALIVE = 15.0
+
+
+def parse_state(data):
+    """
+    Converte a mensagem de estado do Tello ("pitch:0;roll:0;...;bat:87;") em dict.
+    :param data: bytes ou str.
+    :return: dict
+    """
+    if isinstance(data, bytes):
+        data = data.decode('utf-8', 'replace')
+    state = {}
+    for item in data.strip().split(';'):
+        key, sep, value = item.partition(':')
+        if not sep:
+            continue
+        try:
+            state[key.strip()] = float(value) if '.' in value else int(value)
+        except ValueError:
+            state[key.strip()] = value.strip()
+    return state
+
+
+class TelemetryHub(metaclass=Singleton):
+    """ Classe que concentra o estado do drone para todos os clientes. """
+
+    def __init__(self):
+        self._state = {}
+        self._version = 0
+        self._lock = Lock()
+
+    @property
+    def version(self):
+        """ Expõe a versão (contador de atualizações) do estado. """
+        return self._version
+
+    def update(self, fields):
+        """ Atualiza os campos do estado. """
+        with self._lock:
+            self._state.update(fields)
+            self._version += 1
+        return self
+
+    def snapshot(self):
+        """ Retorna uma cópia do estado atual. """
+        with self._lock:
+            return dict(self._state)
+
+    def subscribe(self, rate=1.0):
+        """ Cria uma assinatura com a taxa de eventos informada (eventos/s). """
+        return TelemetrySubscription(self, rate)
+
+
+class TelemetrySubscription:
+    """ Classe de um cliente de telemetria com codificação por diferença. """
+
+    def __init__(self, hub, rate=1.0):
+        self._hub = hub
+        self._interval = 1.0 / max(MIN_RATE, min(MAX_RATE, float(rate)))
+        self._last = {}
+        self._version = -1
+        self._event_id = 0
+        self._last_event = time.monotonic()
+
+    @property
+    def interval(self):
+        """ Expõe o intervalo entre eventos (segundos). """
+        return self._interval
+
+    def delta(self):
+        """
+        Calcula os campos alterados desde o último evento enviado.
+        :return: dict (vazio quando nada mudou).
+        """
+        if self._hub.version == self._version:
+            return {}
+        self._version = self._hub.version
+        state = self._hub.snapshot()
+        changed = {k: v for k, v in state.items() if k not in self._last or self._last[k] != v}
+        self._last = state
+        return changed
+
+    def next_event(self):
+        """
+        Monta o próximo evento SSE.
+        :return: bytes do evento, comentário de keepalive ou None.
+        """
+        changed = self.delta()
+        now = time.monotonic()
+        if changed:
+            self._event_id += 1
+            self._last_event = now
+            data = json.dumps(changed, separators=(',', ':'))
+            return f'id: {self._event_id}\ndata: {data}\n\n'.encode('utf-8')
+        if now - self._last_event >= KEEPALIVE:
+            self._last_event = now
+            return b': keepalive\n\n'
+        return None
+
+    def events(self):
+        """ Gerador (thread) dos eventos SSE na taxa do cliente. """
+        yield f'retry: {int(self._interval * 1000) + 1000}\n\n'.encode('utf-8')
+        while True:
+            event = self.next_event()
+            if event:
+                yield event
+            time.sleep(self._interval)
@@ -0,0 +1,171 @@
+# coding=utf-8
+"""
+Módulo de Controle de Rastreamento.
+
+Controlador PID por eixo, com predição opcional de velocidade constante do
+centro da face, zona morta e limitação de taxa, que converte o deslocamento
+da face no frame em velocidades para o comando ``rc`` do Tello.
+"""
+import time
+from collections import namedtuple
+
+PIDGains = namedtuple('PIDGains', 'kp ki kd')
+PIDGains.__doc__ = """ Ganhos de um controlador PID. """
+
+TrackingGains = namedtuple('TrackingGains', 'lateral forward vertical yaw')
+TrackingGains.__doc__ = """ Ganhos por eixo do rastreamento (erros normalizados de -1 a 1). """
+
+DEFAULT_TRACKING_GAINS = TrackingGains(
+    lateral=PIDGains(60.0, 5.0, 10.0),
+    forward=PIDGains(150.0, 10.0, 20.0),
+    vertical=PIDGains(60.0, 5.0, 10.0),
+    yaw=PIDGains(0.0, 0.0, 0.0),
+)
+
+
+class AxisPID:
+    """ Classe para o controlador PID de um eixo. """
+
+    def __init__(self, gains, output_limit=100.0, integral_limit=1.0):
+        self._gains = gains
+        self._output_limit = output_limit
+        self._integral_limit = integral_limit
+        self._integral = 0.0
+        self._last_error = None
+
+    def reset(self):
+        """ Reinicia os estados internos. """
+        self._integral = 0.0
+        self._last_error = None
+        return self
+
+    def update(self, error, dt):
+        """
+        Calcula a saída do controlador.
+        :param error: erro normalizado.
+        :param dt: intervalo desde a última atualização (segundos).
+        :return: float limitado a +/- output_limit.
+        """
+        kp, ki, kd = self._gains
+        derivative = 0.0
+        if dt > 0:
+            self._integral = max(-self._integral_limit, min(self._integral_limit, self._integral + error * dt))
+            if self._last_error is not None:
+                derivative = (error - self._last_error) / dt
+        self._last_error = error
+        output = kp * error + ki * self._integral + kd * derivative
+        return max(-self._output_limit, min(self._output_limit, output))
+
+
+class TrackingController:
+    """
+    Classe para converter a posição da face em velocidades ``rc``.
+    Retorna None quando o comando seria redundante ou excederia a taxa máxima.
+    O ``rc`` permanece em vigor no drone até o próximo: ``watchdog`` gera a parada quando
+    os resultados da detecção deixam de chegar.
+    """
+
+    def __init__(self, gains=DEFAULT_TRACKING_GAINS, target_area=0.10, dead_band=(0.08, 0.08, 0.03),
+                 max_rate=10.0, min_delta=5, keepalive=1.0, prediction=0.0, max_velocity=60, watchdog_timeout=1.0):
+        self._target_area = target_area
+        self._dead_band_x, self._dead_band_y, self._dead_band_area = dead_band
+        self._min_interval = 1.0 / max_rate
+        self._min_delta = min_delta
+        self._keepalive = keepalive
+        self._prediction = prediction
+        self._lateral = AxisPID(gains.lateral, max_velocity)
+        self._forward = AxisPID(gains.forward, max_velocity)
+        self._vertical = AxisPID(gains.vertical, max_velocity)
+        self._yaw = AxisPID(gains.yaw, max_velocity)
+        self._last_time = None
+        self._last_position = None
+        self._last_sent = (0, 0, 0, 0)
+        self._last_sent_time = float('-inf')
+        self._watchdog_timeout = watchdog_timeout
+        self._last_update = None
+
+    def reset(self):
+        """ Reinicia os controladores. """
+        for pid in (self._lateral, self._forward, self._vertical, self._yaw):
+            pid.reset()
+        self._last_time = None
+        self._last_position = None
+        return self
+
+    @staticmethod
+    def _axis(pid, error, band, dt):
+        """ Dentro da zona morta o eixo fica parado e o PID é reiniciado (sem acúmulo). """
+        if abs(error) < band:
+            pid.reset()
+            return 0
+        return int(round(pid.update(error, dt)))
+
+    def _predict(self, error_x, error_y, now):
+        """ Projeta a posição da face considerando velocidade constante. """
+        if self._prediction and self._last_position and self._last_time is not None and now > self._last_time:
+            dt = now - self._last_time
+            velocity_x = (error_x - self._last_position[0]) / dt
+            velocity_y = (error_y - self._last_position[1]) / dt
+            self._last_position = (error_x, error_y)
+            return error_x + velocity_x * self._prediction, error_y + velocity_y * self._prediction
+        self._last_position = (error_x, error_y)
+        return error_x, error_y
+
+    def _emit(self, velocities, now):
+        """ Aplica a limitação de taxa e a supressão de comandos redundantes. """
+        elapsed = now - self._last_sent_time
+        if elapsed < self._min_interval:
+            return None
+        is_redundant = all(abs(a - b) < self._min_delta for a, b in zip(velocities, self._last_sent))
+        if is_redundant and elapsed < self._keepalive:
+            return None
+        self._last_sent = velocities
+        self._last_sent_time = now
+        return velocities
+
+    def update(self, diff_x, diff_y, percent_face, frame_center_x, frame_center_y, now=None):
+        """
+        Atualiza o controlador com a posição da face.
+        :param diff_x: centro do frame menos centro da face (x), em pixels.
+        :param diff_y: centro do frame menos centro da face (y), em pixels.
+        :param percent_face: área da face sobre a área do frame.
+        :return: tupla (esquerda/direita, frente/trás, cima/baixo, guinada) ou None.
+        """
+        now = time.monotonic() if now is None else now
+        dt = now - self._last_time if self._last_time is not None else 0.0
+        self._last_update = now
+        error_x, error_y = self._predict(diff_x / frame_center_x, diff_y / frame_center_y, now)
+        self._last_time = now
+
+        # Face à esquerda (diff_x > 0) movimenta o drone para a esquerda (rc negativo).
+        velocities = (
+            -self._axis(self._lateral, error_x, self._dead_band_x, dt),
+            self._axis(self._forward, self._target_area - percent_face, self._dead_band_area, dt),
+            self._axis(self._vertical, error_y, self._dead_band_y, dt),
+            -self._axis(self._yaw, error_x, self._dead_band_x, dt),
+        )
+        return self._emit(velocities, now)
+
+    def lost(self, now=None):
+        """
+        Informa que a face não foi encontrada.
+        :return: comando de parada (uma única vez) ou None.
+        """
+        now = time.monotonic() if now is None else now
+        self._last_update = now
+        self.reset()
+        if self._last_sent == (0, 0, 0, 0):
+            return None
+        self._last_sent = (0, 0, 0, 0)
+        self._last_sent_time = now
+        return self._last_sent
+
+    def watchdog(self, now=None):
+        """
+        Verifica se os resultados da detecção deixaram de chegar (detecção desativada, vídeo travado).
+        :return: comando de parada (uma única vez) quando o último resultado é mais antigo que o timeout, ou None.
+        """
+        now = time.monotonic() if now is None else now
+        if self._last_update is None or now - self._last_update < self._watchdog_timeout:
+            return None
+        return self.lost(now)
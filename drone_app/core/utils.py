@@ -2,9 +2,19 @@
 """
 Módulo para classes de utilização geral.
 """
+import os
 import time
 
 
+def rss_kb():
+    """ Memória residente do processo (kB), quando disponível (Linux); None nos demais sistemas. """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError, AttributeError, IndexError):
+        return None
+
+
 class Retry:
     """ Classe para Operacionalizar Tentativas. """
 
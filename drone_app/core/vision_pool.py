@@ -0,0 +1,266 @@
+# coding=utf-8
+"""
+Módulo de Pool de Processos para Visão Computacional.
+
+Os frames decodificados são publicados em slots de memória compartilhada
+(``multiprocessing.shared_memory``) e apenas o índice do slot é enviado aos
+processos de detecção. Os resultados retornam identificados pelo número de
+sequência do frame para que resultados atrasados possam ser descartados.
+Frames menores que o formato dos slots (ex: escala da detecção reduzida em
+execução) usam o início do slot; o formato viaja junto com a tarefa.
+"""
+import logging
+import multiprocessing as mp
+import time
+import weakref
+from collections import namedtuple
+from multiprocessing import shared_memory
+from threading import Lock, Thread
+
+import cv2 as cv
+import numpy as np
+
+from drone_app.core.classifiers import ClassifierRegistry
+
+logger = logging.getLogger(__name__)
+
+DetectorSpec = namedtuple('DetectorSpec', 'name cascade_file scale_factor min_neighbors')
+DetectorSpec.__new__.__defaults__ = (1.3, 5)
+DetectorSpec.__doc__ = """ Especificação (serializável) de um detector executado nos workers. """
+
+VisionResult = namedtuple('VisionResult', 'seq boxes hints elapsed')
+VisionResult.__doc__ = """ Resultado de detecção de um frame identificado pela sequência. """
+
+
+class SharedFrameSlots:
+    """ Classe para gerenciar os slots de frames em memória compartilhada. """
+
+    def __init__(self, shape, slots=4, name=None):
+        self._shape = tuple(shape)
+        self._slots = slots
+        self._slot_size = int(np.prod(self._shape))
+        if name:
+            self._shm = shared_memory.SharedMemory(name=name)
+            self._owner = False
+        else:
+            self._shm = shared_memory.SharedMemory(create=True, size=self._slot_size * slots)
+            self._owner = True
+        self._free = list(range(slots))
+        self._lock = Lock()
+
+    @property
+    def name(self):
+        """ Expõe o nome do bloco de memória compartilhada. """
+        return self._shm.name
+
+    @property
+    def shape(self):
+        """ Expõe o formato (capacidade) dos slots. """
+        return self._shape
+
+    def fits(self, shape):
+        """ Indica se um frame com o formato informado cabe em um slot. """
+        return int(np.prod(shape)) <= self._slot_size
+
+    @property
+    def slots(self):
+        """ Expõe a quantidade de slots. """
+        return self._slots
+
+    def view(self, slot, shape=None):
+        """ Retorna um ndarray apontando para o slot informado (sem cópia), no formato informado. """
+        return np.ndarray(shape or self._shape, dtype=np.uint8, buffer=self._shm.buf, offset=slot * self._slot_size)
+
+    def acquire(self):
+        """
+        Reserva um slot livre.
+        :return: índice do slot ou None quando todos estão ocupados.
+        """
+        with self._lock:
+            return self._free.pop() if self._free else None
+
+    def release(self, slot):
+        """ Devolve o slot para uso. """
+        with self._lock:
+            self._free.append(slot)
+
+    def publish(self, frame):
+        """
+        Copia o frame para um slot livre.
+        :param frame: ndarray que cabe no slot (ver fits).
+        :return: índice do slot ou None quando não há slot disponível.
+        """
+        slot = self.acquire()
+        if slot is not None:
+            np.copyto(self.view(slot, frame.shape), frame)
+        return slot
+
+    def close(self):
+        """ Libera a memória compartilhada. """
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+def _detect(gray, classifier, spec, frame_center_x, frame_center_y, frame_area):
+    """
+    Executa um detector e calcula as dicas de controle para a maior detecção.
+    As marcações saem ordenadas por área (maior primeiro): desenho e rastreamento usam ``boxes[0]``.
+    """
+    boxes = sorted((tuple(int(v) for v in box) for box in classifier.detectMultiScale(gray, spec.scale_factor,
+                                                                                     spec.min_neighbors)),
+                   key=lambda b: b[2] * b[3], reverse=True)
+    hints = None
+    if boxes:
+        x, y, w, h = boxes[0]
+        hints = {
+            'diff_x': frame_center_x - (x + w / 2),
+            'diff_y': frame_center_y - (y + h / 2),
+            'percent_face': (w * h) / frame_area,
+        }
+    return boxes, hints
+
+
+def vision_worker(shm_name, shape, slots, specs, tasks, results):
+    """
+    Laço principal de um processo de detecção.
+    :param shm_name: nome do bloco de memória compartilhada.
+    :param shape: formato dos frames.
+    :param slots: quantidade de slots.
+    :param specs: lista de DetectorSpec.
+    :param tasks: fila de tarefas (seq, slot, formato do frame, parâmetros do detectMultiScale ou None).
+    :param results: fila de resultados.
+    """
+    frames = SharedFrameSlots(shape, slots, name=shm_name)
+    classifiers = [(spec, ClassifierRegistry().get(spec.cascade_file)) for spec in specs]
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            seq, slot, frame_shape, params = task
+            frame_y, frame_x = frame_shape[0], frame_shape[1]
+            start = time.perf_counter()
+            gray = cv.cvtColor(frames.view(slot, frame_shape), cv.COLOR_BGR2GRAY)
+            # O slot já pode ser reutilizado pelo produtor.
+            results.put(('release', slot))
+            boxes, hints = {}, {}
+            for spec, classifier in classifiers:
+                if params:
+                    spec = spec._replace(scale_factor=params[0], min_neighbors=params[1])
+                boxes[spec.name], hints[spec.name] = _detect(
+                    gray, classifier, spec, frame_x / 2, frame_y / 2, frame_x * frame_y)
+            results.put(('result', VisionResult(seq, boxes, hints, time.perf_counter() - start)))
+    finally:
+        frames.close()
+
+
+class VisionWorkerPool:
+    """ Classe para distribuir a detecção entre processos de trabalho. """
+
+    def __init__(self, shape, specs, workers=None, slots=None, max_lag=5):
+        self._workers = workers or max(1, mp.cpu_count() - 1)
+        self._frames = SharedFrameSlots(shape, slots or self._workers * 2)
+        self._max_lag = max_lag
+        self._seq = 0
+        self._latest = None
+        self._latest_lock = Lock()
+        self._stats = {'submitted': 0, 'dropped': 0, 'stale': 0, 'completed': 0}
+        ctx = mp.get_context('spawn')
+        self._tasks = ctx.Queue()
+        self._results = ctx.Queue()
+        self._processes = [
+            ctx.Process(
+                target=vision_worker,
+                args=(self._frames.name, self._frames.shape, self._frames.slots, list(specs),
+                      self._tasks, self._results,),
+                daemon=True,
+            )
+            for _ in range(self._workers)
+        ]
+        for process in self._processes:
+            process.start()
+        self._collector = Thread(target=self._collect, daemon=True)
+        self._collector.start()
+        self._finalizer = weakref.finalize(self, self._shutdown, self._tasks, self._results,
+                                           self._processes, self._frames)
+        logger.info({'action': 'vision_pool', 'workers': self._workers, 'slots': self._frames.slots})
+
+    @property
+    def stats(self):
+        """ Expõe as estatísticas do pool. """
+        return dict(self._stats)
+
+    @property
+    def seq(self):
+        """ Expõe a sequência do último frame submetido. """
+        return self._seq
+
+    def fits(self, shape):
+        """ Indica se frames com o formato informado podem ser submetidos a este pool. """
+        return self._frames.fits(shape)
+
+    def submit(self, frame, scale_factor=None, min_neighbors=None):
+        """
+        Publica o frame para detecção sem bloquear.
+        :param frame: ndarray BGR que cabe nos slots (ver fits).
+        :param scale_factor: substitui o scale_factor dos DetectorSpec neste frame.
+        :param min_neighbors: substitui o min_neighbors dos DetectorSpec neste frame.
+        :return: número de sequência ou None se o frame foi descartado.
+        """
+        slot = self._frames.publish(frame)
+        if slot is None:
+            self._stats['dropped'] += 1
+            return None
+        self._seq += 1
+        self._stats['submitted'] += 1
+        params = (scale_factor, min_neighbors) if scale_factor is not None and min_neighbors is not None else None
+        self._tasks.put((self._seq, slot, tuple(frame.shape), params))
+        return self._seq
+
+    def latest(self):
+        """
+        Recupera o resultado mais recente que ainda não está atrasado.
+        :return: VisionResult ou None.
+        """
+        with self._latest_lock:
+            result = self._latest
+        if result is None or self._seq - result.seq > self._max_lag:
+            return None
+        return result
+
+    def _collect(self):
+        """ Recebe os resultados dos workers descartando os atrasados. """
+        while True:
+            try:
+                kind, value = self._results.get()
+            except (EOFError, OSError):
+                break
+            if kind == 'release':
+                self._frames.release(value)
+            elif kind == 'result':
+                with self._latest_lock:
+                    if self._latest is not None and value.seq < self._latest.seq:
+                        self._stats['stale'] += 1
+                        continue
+                    self._latest = value
+                self._stats['completed'] += 1
+            elif kind == 'stop':
+                break
+
+    @staticmethod
+    def _shutdown(tasks, results, processes, frames):
+        """ Encerra os workers e libera a memória compartilhada. """
+        for _ in processes:
+            tasks.put(None)
+        for process in processes:
+            process.join(timeout=2)
+            if process.is_alive():
+                process.terminate()
+        results.put(('stop', None))
+        frames.close()
+
+    def close(self):
+        """ Encerra o pool. """
+        self._finalizer()
+        self._collector.join(timeout=2)
@@ -0,0 +1,96 @@
+# coding=utf-8
+"""
+Módulo do Protocolo WebSocket (RFC 6455).
+
+Implementação mínima sobre asyncio streams, suficiente para o canal de
+controle: handshake, mensagens de texto (com fragmentação), ping/pong e close.
+"""
+import base64
+import hashlib
+import struct
+
+GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+MAX_MESSAGE_SIZE = 64 * 1024
+
+
+class WebSocketClosed(Exception):
+    """ Classe para exceção de WebSocket encerrado. """
+
+
+def accept_key(key):
+    """ Calcula o valor de Sec-WebSocket-Accept para a chave do cliente. """
+    digest = hashlib.sha1((key + GUID).encode('latin-1')).digest()
+    return base64.b64encode(digest).decode('latin-1')
+
+
+def handshake_response(key):
+    """ Monta a resposta HTTP 101 do handshake. """
+    return (
+        'HTTP/1.1 101 Switching Protocols\r\n'
+        'Upgrade: websocket\r\n'
+        'Connection: Upgrade\r\n'
+        f'Sec-WebSocket-Accept: {accept_key(key)}\r\n\r\n'
+    ).encode('latin-1')
+
+
+def encode_frame(opcode, payload=b''):
+    """ Monta um frame do servidor (sem máscara). """
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+async def _read_frame(reader):
+    """ Lê um frame do cliente: tupla (fin, opcode, payload). """
+    first, second = await reader.readexactly(2)
+    fin, opcode = first & 0x80, first & 0x0F
+    length = second & 0x7F
+    if length == 126:
+        length, = struct.unpack('!H', await reader.readexactly(2))
+    elif length == 127:
+        length, = struct.unpack('!Q', await reader.readexactly(8))
+    if length > MAX_MESSAGE_SIZE:
+        raise WebSocketClosed('Mensagem muito grande.')
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return bool(fin), opcode, payload
+
+
+async def read_message(reader, writer):
+    """
+    Lê a próxima mensagem de dados, respondendo ping e close automaticamente.
+    :return: tupla (opcode, payload).
+    """
+    message, message_opcode = b'', None
+    while True:
+        fin, opcode, payload = await _read_frame(reader)
+        if opcode == OP_PING:
+            writer.write(encode_frame(OP_PONG, payload))
+            continue
+        if opcode == OP_PONG:
+            continue
+        if opcode == OP_CLOSE:
+            writer.write(encode_frame(OP_CLOSE, payload[:2]))
+            raise WebSocketClosed()
+        if opcode != OP_CONTINUATION:
+            message_opcode = opcode
+        message += payload
+        if len(message) > MAX_MESSAGE_SIZE:
+            raise WebSocketClosed('Mensagem muito grande.')
+        if fin:
+            return message_opcode, message
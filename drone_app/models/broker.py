@@ -0,0 +1,313 @@
+# coding=utf-8
+"""
+Módulo do Broker do Drone.
+
+Um processo dedicado é o único dono dos sockets UDP (8889, 8890 e 11111), do
+decodificador e dos middlewares. Os workers web conversam com ele por IPC
+local (``multiprocessing.connection``) para os comandos e leem os frames JPEG
+de um anel em memória compartilhada, permitindo servir HTTP com vários
+processos sem disputar a ligação com o drone.
+
+As mensagens usam pickle: somente quem possui a chave (``BROKER_AUTHKEY`` ou
+a chave gerada a cada execução em ``BROKER_AUTHKEY_FILE``) conecta, o broker
+recusa endereços TCP fora do loopback (salvo ``BROKER_ALLOW_REMOTE``) e
+executa apenas os métodos de ``BROKER_METHODS``.
+
+Execução:
+    python -m drone_app.models.broker
+"""
+import ipaddress
+import logging
+import os
+import secrets
+import struct
+import time
+from concurrent.futures import Future
+from multiprocessing import AuthenticationError, shared_memory
+from multiprocessing.connection import Listener, Client
+from threading import Thread, local
+
+import config
+from drone_app.core.logs import setup_logging
+from drone_app.core.sigleton import Singleton
+from drone_app.core.telemetry import TelemetryHub
+
+logger = logging.getLogger(__name__)
+
+# Cabeçalho do anel: sequência do último frame publicado.
+_RING_HEADER = struct.Struct('<Q')
+# Cabeçalho do slot: sequência e tamanho do JPEG.
+_SLOT_HEADER = struct.Struct('<QI')
+# Resposta de métodos encadeáveis (o drone não atravessa o IPC); o cliente devolve a si mesmo.
+SELF = '__self__'
+# Métodos do drone usados pela camada web (COMMAND_METHODS, lotes, controle contínuo e estatísticas).
+BROKER_METHODS = frozenset((
+    'takeoff', 'land', 'up', 'down', 'forward', 'back', 'clockwise', 'count_clockwise', 'left', 'right',
+    'flip_forward', 'flip_back', 'flip_left', 'flip_right', 'patrol', 'stop_patrol',
+    'enable_face_detect', 'disable_face_detect', 'set_speed', 'snapshot', 'request', 'send_datagram', 'rc',
+    'video_stats', 'governor_stats',
+))
+
+
+def load_authkey(create=False):
+    """
+    Chave de autenticação do broker.
+    :param create: gera uma nova chave em BROKER_AUTHKEY_FILE (broker) em vez de lê-la (workers).
+    :return: bytes
+    """
+    if config.BROKER_AUTHKEY:
+        return config.BROKER_AUTHKEY
+    path = config.BROKER_AUTHKEY_FILE
+    if create:
+        key = secrets.token_hex(32).encode('ascii')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = path + '.tmp'
+        fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(key)
+        os.replace(temp, path)
+        return key
+    try:
+        with open(path, 'rb') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        raise BrokerError(f'Chave do broker não encontrada ({path}): inicie o broker ou defina '
+                          'PYTELLO_BROKER_AUTHKEY.')
+
+
+def check_address(address):
+    """ Recusa endereços TCP fora do loopback, salvo BROKER_ALLOW_REMOTE. """
+    if not isinstance(address, tuple) or config.BROKER_ALLOW_REMOTE:
+        return address
+    host = address[0]
+    try:
+        is_loopback = host == 'localhost' or ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        is_loopback = False
+    if not is_loopback:
+        raise BrokerError(f'Endereço do broker fora do loopback: {host} (habilite BROKER_ALLOW_REMOTE).')
+    return address
+
+
+class JpegRing:
+    """
+    Classe para o anel de frames JPEG em memória compartilhada.
+    Um único escritor; leitores validam a sequência do slot antes e depois da
+    cópia e descartam o frame se ele foi sobrescrito durante a leitura.
+    """
+
+    def __init__(self, name, slots=8, slot_size=512 * 1024, create=False):
+        self._slots = slots
+        self._slot_size = slot_size
+        size = _RING_HEADER.size + slots * (_SLOT_HEADER.size + slot_size)
+        if create:
+            try:
+                shared_memory.SharedMemory(name=name).unlink()
+            except FileNotFoundError:
+                pass
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            _RING_HEADER.pack_into(self._shm.buf, 0, 0)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+        self._owner = create
+
+    def _offset(self, seq):
+        return _RING_HEADER.size + (seq % self._slots) * (_SLOT_HEADER.size + self._slot_size)
+
+    @property
+    def seq(self):
+        """ Sequência do último frame publicado. """
+        return _RING_HEADER.unpack_from(self._shm.buf, 0)[0]
+
+    def write(self, jpeg):
+        """ Publica um frame (frames maiores que o slot são descartados). """
+        if len(jpeg) > self._slot_size:
+            logger.warning({'action': 'jpeg_ring', 'size': len(jpeg), 'status': 'too_large'})
+            return None
+        seq = self.seq + 1
+        offset = self._offset(seq)
+        # Sequência zerada durante a escrita: leitores descartam o slot.
+        _SLOT_HEADER.pack_into(self._shm.buf, offset, 0, 0)
+        start = offset + _SLOT_HEADER.size
+        self._shm.buf[start:start + len(jpeg)] = jpeg
+        _SLOT_HEADER.pack_into(self._shm.buf, offset, seq, len(jpeg))
+        _RING_HEADER.pack_into(self._shm.buf, 0, seq)
+        return seq
+
+    def read(self, seq):
+        """
+        Lê o frame da sequência informada.
+        :return: bytes ou None se o slot foi sobrescrito.
+        """
+        offset = self._offset(seq)
+        slot_seq, length = _SLOT_HEADER.unpack_from(self._shm.buf, offset)
+        if slot_seq != seq:
+            return None
+        start = offset + _SLOT_HEADER.size
+        data = bytes(self._shm.buf[start:start + length])
+        if _SLOT_HEADER.unpack_from(self._shm.buf, offset)[0] != seq:
+            return None
+        return data
+
+    def frames(self, poll=0.005):
+        """ Gerador dos frames mais recentes (frames intermediários são pulados). """
+        last = 0
+        while True:
+            seq = self.seq
+            if seq == last:
+                time.sleep(poll)
+                continue
+            data = self.read(seq)
+            last = seq
+            if data is not None:
+                yield data
+
+    def close(self):
+        """ Libera a memória compartilhada. """
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+class DroneBroker:
+    """ Classe do processo dono da conexão com o drone. """
+
+    def __init__(self, drone_factory, address=None, authkey=None, ring_name=None):
+        self._drone_factory = drone_factory
+        self._address = check_address(address or config.BROKER_ADDRESS)
+        self._authkey = authkey or load_authkey(create=True)
+        self._ring_name = ring_name or config.BROKER_FRAME_RING
+        self._drone = None
+        self._ring = None
+
+    def _publish_frames(self):
+        """ Copia os frames JPEG do drone para o anel compartilhado. """
+        for jpeg in self._drone.video_jpeg_generator():
+            self._ring.write(jpeg)
+
+    def _call(self, name, args, kwargs):
+        """ Executa um método do drone permitido para a camada web. """
+        if name not in BROKER_METHODS:
+            raise AttributeError(name)
+        result = getattr(self._drone, name)(*args, **kwargs)
+        if isinstance(result, Future):
+            result = result.result(timeout=config.SNAPSHOT_TIMEOUT)
+        # Métodos encadeáveis retornam o próprio drone, que não atravessa o IPC.
+        return SELF if result is self._drone else result
+
+    def _serve(self, connection):
+        """ Atende um worker até a conexão ser encerrada. """
+        with connection:
+            while True:
+                try:
+                    kind, name, args, kwargs = connection.recv()
+                except (EOFError, OSError):
+                    break
+                try:
+                    if kind == 'telemetry':
+                        result = TelemetryHub().snapshot()
+                    else:
+                        result = self._call(name, args, kwargs)
+                    connection.send(('ok', result))
+                except Exception as ex:
+                    logger.error({'action': 'drone_broker', 'call': name, 'ex': ex})
+                    connection.send(('error', repr(ex)))
+
+    def run(self):
+        """ Inicializa o drone e atende os workers. """
+        self._drone = self._drone_factory()
+        self._ring = JpegRing(self._ring_name, create=True)
+        Thread(target=self._publish_frames, daemon=True).start()
+        with Listener(self._address, authkey=self._authkey) as listener:
+            logger.info({'action': 'drone_broker', 'address': self._address})
+            while True:
+                connection = listener.accept()
+                Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+
+class BrokerError(Exception):
+    """ Classe para exceção retornada pelo broker. """
+
+
+class BrokerClient(metaclass=Singleton):
+    """
+    Classe usada pelos workers web no lugar do gerenciador do drone.
+    Os métodos são encaminhados ao broker; o vídeo é lido do anel compartilhado.
+    """
+
+    def __init__(self, address=None, authkey=None, ring_name=None, telemetry_interval=0.2):
+        self._address = address or config.BROKER_ADDRESS
+        self._authkey = authkey
+        self._ring_name = ring_name or config.BROKER_FRAME_RING
+        self._telemetry_interval = telemetry_interval
+        self._local = local()
+        self._ring = None
+        Thread(target=self._poll_telemetry, daemon=True).start()
+
+    def _connection(self):
+        """ Uma conexão por thread (Connection não é thread-safe). """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # A chave gerada pelo broker muda a cada execução: é lida a cada nova conexão.
+            authkey = self._authkey or load_authkey()
+            connection = self._local.connection = Client(self._address, authkey=authkey)
+        return connection
+
+    def _request(self, kind, name=None, args=(), kwargs=None):
+        connection = self._connection()
+        try:
+            connection.send((kind, name, args, kwargs or {}))
+            status, result = connection.recv()
+        except (EOFError, OSError):
+            self._local.connection = None
+            raise
+        if status == 'error':
+            raise BrokerError(result)
+        return result
+
+    def _poll_telemetry(self):
+        """ Replica a telemetria do broker no TelemetryHub deste processo. """
+        hub = TelemetryHub()
+        while True:
+            try:
+                hub.update(self._request('telemetry'))
+            except (BrokerError, AuthenticationError, EOFError, OSError) as ex:
+                logger.warning({'action': 'broker_client', 'telemetry': str(ex)})
+                time.sleep(1)
+            time.sleep(self._telemetry_interval)
+
+    def __getattr__(self, name):
+        if name not in BROKER_METHODS:
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            result = self._request('call', name, args, kwargs)
+            # Somente o marcador vira o cliente: None (ex: comando sem resposta) é devolvido como está.
+            return self if result == SELF else result
+        return call
+
+    def snapshot(self):
+        """ Snapshot executado no broker (Future já resolvido, como no drone local). """
+        future = Future()
+        try:
+            future.set_result(self._request('call', 'snapshot'))
+        except Exception as ex:
+            future.set_exception(ex)
+        return future
+
+    def video_jpeg_generator(self):
+        """ Gerador de vídeo Jpeg lido do anel em memória compartilhada. """
+        if self._ring is None:
+            self._ring = JpegRing(self._ring_name)
+        return self._ring.frames()
+
+
+def main():
+    """ Ponto de entrada do processo broker. """
+    from drone_app.models.drone_manager import StreamTelloDrone, BasicPatrolMiddleware
+    setup_logging()
+    DroneBroker(lambda: StreamTelloDrone(patrol_middleware=BasicPatrolMiddleware())).run()
+
+
+if __name__ == '__main__':
+    main()
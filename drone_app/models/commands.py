@@ -0,0 +1,177 @@
+# coding=utf-8
+"""
+Módulo de Comandos do Tello SDK.
+
+Descreve os comandos aceitos pelo drone, com seus parâmetros e limites, para
+que uma lista de comandos possa ser validada por completo antes do envio.
+"""
+import time
+from collections import namedtuple
+
+ParamSpec = namedtuple('ParamSpec', 'name minimum maximum choices')
+ParamSpec.__new__.__defaults__ = (None, None, None)
+ParamSpec.__doc__ = """ Parâmetro de um comando (inteiro com limites ou texto com opções). """
+
+CommandSpec = namedtuple('CommandSpec', 'name params')
+CommandSpec.__doc__ = """ Comando do Tello SDK e seus parâmetros, na ordem do protocolo. """
+
+BatchResult = namedtuple('BatchResult', 'index sdk reply status latency')
+BatchResult.__doc__ = """ Resultado da execução de um comando do lote. """
+
+
+class CommandValidationError(ValueError):
+    """ Classe para exceção de comando inválido. """
+
+
+_DISTANCE = (20, 500)
+_COORDINATE = (-500, 500)
+_SPEED = (10, 100)
+_RC = (-100, 100)
+
+
+def _distance(name='distance'):
+    return ParamSpec(name, *_DISTANCE)
+
+
+def _coordinates(*names):
+    return tuple(ParamSpec(name, *_COORDINATE) for name in names)
+
+
+COMMAND_SPECS = {spec.name: spec for spec in (
+    CommandSpec('command', ()),
+    CommandSpec('takeoff', ()),
+    CommandSpec('land', ()),
+    CommandSpec('streamon', ()),
+    CommandSpec('streamoff', ()),
+    CommandSpec('emergency', ()),
+    CommandSpec('stop', ()),
+    CommandSpec('up', (_distance(),)),
+    CommandSpec('down', (_distance(),)),
+    CommandSpec('left', (_distance(),)),
+    CommandSpec('right', (_distance(),)),
+    CommandSpec('forward', (_distance(),)),
+    CommandSpec('back', (_distance(),)),
+    CommandSpec('cw', (ParamSpec('degree', 1, 360),)),
+    CommandSpec('ccw', (ParamSpec('degree', 1, 360),)),
+    CommandSpec('flip', (ParamSpec('position', choices=('l', 'r', 'f', 'b')),)),
+    CommandSpec('go', _coordinates('x', 'y', 'z') + (ParamSpec('speed', *_SPEED),)),
+    CommandSpec('curve', _coordinates('x1', 'y1', 'z1', 'x2', 'y2', 'z2') + (ParamSpec('speed', 10, 60),)),
+    CommandSpec('speed', (ParamSpec('speed', *_SPEED),)),
+    CommandSpec('rc', tuple(ParamSpec(name, *_RC) for name in ('left_right', 'forward_back', 'up_down', 'yaw'))),
+    CommandSpec('speed?', ()),
+    CommandSpec('battery?', ()),
+    CommandSpec('time?', ()),
+    CommandSpec('wifi?', ()),
+    CommandSpec('sdk?', ()),
+    CommandSpec('sn?', ()),
+    CommandSpec('height?', ()),
+    CommandSpec('temp?', ()),
+    CommandSpec('attitude?', ()),
+    CommandSpec('baro?', ()),
+    CommandSpec('tof?', ()),
+    CommandSpec('acceleration?', ()),
+)}
+
+# Comandos que o drone não responde: enviados como datagrama, sem aguardar resposta nem ocupar o semáforo.
+NO_REPLY_COMMANDS = frozenset(('rc',))
+
+
+def _convert(param, value):
+    """ Valida e converte o valor de um parâmetro. """
+    if param.choices:
+        if value not in param.choices:
+            raise CommandValidationError(f'{param.name}: valor deve ser um de {", ".join(param.choices)}.')
+        return value
+    if isinstance(value, bool):
+        # bool é subclasse de int: True/False virariam 1/0.
+        raise CommandValidationError(f'{param.name}: valor inteiro obrigatório.')
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise CommandValidationError(f'{param.name}: valor inteiro obrigatório.')
+    if isinstance(value, float) and number != value:
+        raise CommandValidationError(f'{param.name}: valor inteiro obrigatório.')
+    if not param.minimum <= number <= param.maximum:
+        raise CommandValidationError(f'{param.name}: valor fora da faixa {param.minimum} a {param.maximum}.')
+    return number
+
+
+def build_command(name, args=None):
+    """
+    Valida o comando e monta o texto enviado ao drone.
+    :param name: nome do comando no Tello SDK (ex: 'forward', 'battery?').
+    :param args: lista posicional ou dict com os parâmetros.
+    :return: str
+    """
+    if not isinstance(name, str):
+        raise CommandValidationError('Nome do comando deve ser texto.')
+    spec = COMMAND_SPECS.get(name)
+    if spec is None:
+        raise CommandValidationError(f'Comando desconhecido: {name}.')
+    args = args if args is not None else []
+    if not isinstance(args, (list, dict)):
+        # Texto seria dividido em caracteres por list().
+        raise CommandValidationError('Parâmetros devem ser uma lista ou um objeto.')
+    if isinstance(args, dict):
+        unknown = set(args) - {p.name for p in spec.params}
+        if unknown:
+            raise CommandValidationError(f'Parâmetros desconhecidos: {", ".join(sorted(unknown))}.')
+        missing = [p.name for p in spec.params if p.name not in args]
+        if missing:
+            raise CommandValidationError(f'Parâmetros obrigatórios: {", ".join(missing)}.')
+        values = [args[p.name] for p in spec.params]
+    else:
+        values = list(args)
+        if len(values) != len(spec.params):
+            raise CommandValidationError(f'{name} espera {len(spec.params)} parâmetro(s).')
+    converted = [_convert(param, value) for param, value in zip(spec.params, values)]
+    return ' '.join([name] + [str(value) for value in converted])
+
+
+def validate_batch(commands):
+    """
+    Valida todos os comandos do lote antes de qualquer envio.
+    :param commands: lista de dicts {'command': str, 'args': list|dict}.
+    :return: tupla (lista de textos SDK, lista de erros).
+    """
+    sdk_commands, errors = [], []
+    if not isinstance(commands, list) or not commands:
+        return [], [{'index': None, 'error': 'Informe uma lista de comandos.'}]
+    for index, item in enumerate(commands):
+        try:
+            if not isinstance(item, dict):
+                raise CommandValidationError('Comando deve ser um objeto.')
+            sdk_commands.append(build_command(item.get('command'), item.get('args')))
+        except CommandValidationError as ex:
+            errors.append({'index': index, 'command': item.get('command') if isinstance(item, dict) else None,
+                           'error': str(ex)})
+    return sdk_commands, errors
+
+
+def is_error_reply(reply):
+    """ Verifica se a resposta do drone indica falha (inclusive ausência de resposta). """
+    return reply is None or reply.strip().lower().startswith('error')
+
+
+def execute_batch(drone_manager, sdk_commands, stop_on_error=False):
+    """
+    Executa os comandos em ordem, aguardando a resposta de cada um.
+    Comandos sem resposta (ex: rc) são apenas enviados e reportados como 'sent'.
+    :return: lista de BatchResult.
+    """
+    results = []
+    for index, sdk in enumerate(sdk_commands):
+        start = time.perf_counter()
+        if sdk.split(' ', 1)[0] in NO_REPLY_COMMANDS:
+            drone_manager.send_datagram(sdk)
+            reply, status = None, 'sent'
+        else:
+            reply = drone_manager.request(sdk)
+            status = 'error' if is_error_reply(reply) else 'ok'
+        latency = time.perf_counter() - start
+        results.append(BatchResult(index, sdk, reply, status, round(latency, 4)))
+        if status == 'error' and stop_on_error:
+            results.extend(BatchResult(i, s, None, 'skipped', 0.0)
+                           for i, s in enumerate(sdk_commands[index + 1:], index + 1))
+            break
+    return results
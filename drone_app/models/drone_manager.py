@@ -2,12 +2,13 @@
 """
 Módulo de conexão com o Tello Drone.
 """
-import time
 from enum import Enum
 
+from config import VISION_WORKERS, MOTION_GATE_THRESHOLD
 from drone_app.core.abstract_drone import AbstractPatrolMiddleware, AbstractDroneManager
 from drone_app.core.abstract_video_drone import AbstractDroneVideoManager, VideoSetupFFmpeg
-from drone_app.models.video_capture import DroneFaceDetectMiddleware, DroneSnapshotMiddleware
+from drone_app.models.video_capture import DroneFaceDetectMiddleware, DroneSnapshotMiddleware, \
+    PoolFaceDetectMiddleware, MotionGateMiddleware
 
 
 # COMMAND_PORT = 8889
@@ -108,12 +109,12 @@ class TelloDrone(AbstractDroneManager):
         """
         self.send_command(f'ap {ssid} {password}')
 
-    def jump(self, x, y, z, mid1, mid2, speed=DEFAULT_SPEED, blocking=True):
+    def jump(self, x, y, z, mid1, mid2, speed=DEFAULT_SPEED, blocking=True, yaw=0):
         """
         Voe para as coordenadas x, y e z da missão Pad ID1 e reconheça as
         coordenadas 0, 0, z da missão pad ID2 e gire para o valor de guinada.
         """
-        self.send_command(f'jump {x} {y} {z} {speed} yaw {mid1} {mid2}', blocking)
+        self.send_command(f'jump {x} {y} {z} {speed} {yaw} {mid1} {mid2}', blocking)
         return self
 
     def _move(self, direction, distance):
@@ -157,6 +158,11 @@ class TelloDrone(AbstractDroneManager):
         self.send_command(f'speed {speed}')
         return self
 
+    def rc(self, left_right, forward_back, up_down, yaw):
+        """ Envia as velocidades (-100 a 100) dos quatro canais do controle remoto. """
+        self.send_datagram(f'rc {left_right} {forward_back} {up_down} {yaw}')
+        return self
+
     def clockwise(self, degree=DEFAULT_DEGREE):
         """ Girar no sentido horário. """
         self.send_command(f'cw {degree}')
@@ -197,42 +203,42 @@ class TelloDrone(AbstractDroneManager):
         Obtem a velocidade corrente.
         :return: Int
         """
-        return int(self.send_command('speed?'))
+        return int(self.request('speed?'))
 
     def get_battery(self):
         """
         Obtem o percentual de carga da bateria.
         :return: Int
         """
-        return int(self.send_command('battery?'))
+        return int(self.request('battery?'))
 
     def get_time(self):
         """
         Obtem o tempo de vôo.
         :return: string
         """
-        return self.send_command('time?')
+        return self.request('time?')
 
     def get_wifi_snr(self):
         """
         Obtem o SNR da rede Wi-fi.
         :return: string
         """
-        return self.send_command('wifi?')
+        return self.request('wifi?')
 
     def get_sdk(self):
         """
         Obtem a versão do SDK Tello.
         :return: string
         """
-        return self.send_command('sdk?')
+        return self.request('sdk?')
 
     def get_sn(self):
         """
         Obtem o número do serial Tello.
         :return: string
         """
-        return self.send_command('sn?')
+        return self.request('sn?')
 
     def snapshot(self):
         """
@@ -245,14 +251,22 @@ class TelloDrone(AbstractDroneManager):
 class StreamTelloDrone(AbstractDroneVideoManager):
     def __init__(self, host_ip='192.168.10.2', host_port=8889, drone_ip='192.168.10.1', drone_port=8889,
                  is_imperial=False, speed=DEFAULT_SPEED, patrol_middleware=None, video_setup=None,
-                 face_detect_middleware=None):
+                 face_detect_middleware=None, vision_workers=VISION_WORKERS, governor=None):
         # Utiliza as configurações de vídeo.
         vs = video_setup if video_setup else VideoSetupFFmpeg()
         # Utiliza a detecção de face e snapshot.
-        fd = face_detect_middleware if face_detect_middleware else DroneFaceDetectMiddleware(drone_manager=self)
-        self._snapshot = DroneSnapshotMiddleware(drone_manager=self, next_middleware=fd)
+        fd = face_detect_middleware
+        if not fd:
+            if vision_workers:
+                fd = PoolFaceDetectMiddleware(drone_manager=self, workers=vision_workers)
+            else:
+                fd = DroneFaceDetectMiddleware(drone_manager=self)
+            if MOTION_GATE_THRESHOLD:
+                fd = MotionGateMiddleware(next_middleware=fd, threshold=MOTION_GATE_THRESHOLD)
+        self._snapshot = DroneSnapshotMiddleware(drone_manager=self)
         super().__init__(
-            host_ip, host_port, drone_ip, drone_port, is_imperial, speed, patrol_middleware, vs, self._snapshot
+            host_ip, host_port, drone_ip, drone_port, is_imperial, speed, patrol_middleware, vs, fd, self._snapshot,
+            governor
         )
         # Informa a regra de patrulhamento.
         if patrol_middleware:
@@ -327,12 +341,12 @@ class StreamTelloDrone(AbstractDroneVideoManager):
         """
         self.send_command(f'ap {ssid} {password}')
 
-    def jump(self, x, y, z, mid1, mid2, speed=DEFAULT_SPEED, blocking=True):
+    def jump(self, x, y, z, mid1, mid2, speed=DEFAULT_SPEED, blocking=True, yaw=0):
         """
         Voe para as coordenadas x, y e z da missão Pad ID1 e reconheça as
         coordenadas 0, 0, z da missão pad ID2 e gire para o valor de guinada.
         """
-        self.send_command(f'jump {x} {y} {z} {speed} yaw {mid1} {mid2}', blocking)
+        self.send_command(f'jump {x} {y} {z} {speed} {yaw} {mid1} {mid2}', blocking)
         return self
 
     def _move(self, direction, distance):
@@ -376,6 +390,11 @@ class StreamTelloDrone(AbstractDroneVideoManager):
         self.send_command(f'speed {speed}')
         return self
 
+    def rc(self, left_right, forward_back, up_down, yaw):
+        """ Envia as velocidades (-100 a 100) dos quatro canais do controle remoto. """
+        self.send_datagram(f'rc {left_right} {forward_back} {up_down} {yaw}')
+        return self
+
     def clockwise(self, degree=DEFAULT_DEGREE):
         """ Girar no sentido horário. """
         self.send_command(f'cw {degree}')
@@ -416,50 +435,57 @@ class StreamTelloDrone(AbstractDroneVideoManager):
         Obtem a velocidade corrente.
         :return: Int
         """
-        return int(self.send_command('speed?'))
+        return int(self.request('speed?'))
 
     def get_battery(self):
         """
         Obtem o percentual de carga da bateria.
         :return: Int
         """
-        return int(self.send_command('battery?'))
+        return int(self.request('battery?'))
 
     def get_time(self):
         """
         Obtem o tempo de vôo.
         :return: string
         """
-        return self.send_command('time?')
+        return self.request('time?')
 
     def get_wifi_snr(self):
         """
         Obtem o SNR da rede Wi-fi.
         :return: string
         """
-        return self.send_command('wifi?')
+        return self.request('wifi?')
 
     def get_sdk(self):
         """
         Obtem a versão do SDK Tello.
         :return: string
         """
-        return self.send_command('sdk?')
+        return self.request('sdk?')
 
     def get_sn(self):
         """
         Obtem o número do serial Tello.
         :return: string
         """
-        return self.send_command('sn?')
+        return self.request('sn?')
 
     def snapshot(self):
         """
         Faz uma captura de foto e apresenta na tela.
-        :return:
+        :return: Future que resolve com SnapshotResult.
         """
         return self._snapshot.snapshot()
 
+    def burst(self, count, interval=0.0, pre_trigger=0):
+        """
+        Faz uma captura em rajada.
+        :return: Future que resolve com a lista de SnapshotResult.
+        """
+        return self._snapshot.burst(count, interval, pre_trigger)
+
 
 class BasicPatrolMiddleware(AbstractPatrolMiddleware):
     """ Faz o patrulhamento básico. """
@@ -474,5 +500,4 @@ class BasicPatrolMiddleware(AbstractPatrolMiddleware):
             self._drone_manager.down()
         elif process_id > 3:
             process_id = 0
-        time.sleep(3)
         return process_id
@@ -0,0 +1,515 @@
+# coding=utf-8
+"""
+Módulo de Missões.
+
+Uma missão descreve o patrulhamento de forma declarativa (JSON ou YAML):
+
+    {
+        "name": "galpao",
+        "speed": 50,
+        "face_forward": false,
+        "pads": {"1": [0, 0], "2": [300, 0]},
+        "waypoints": [
+            {"name": "porta", "x": 200, "y": 100, "z": 100, "dwell": 2, "actions": ["snapshot"]},
+            {"name": "janela", "x": 50, "y": 250, "z": 120},
+            {"name": "base", "mid": 1, "x": 0, "y": 0, "z": 80},
+            {"name": "salto", "jump": [1, 2], "x": 0, "y": 0, "z": 80, "yaw": 0}
+        ]
+    }
+
+As coordenadas são em centímetros no referencial da decolagem (x para a frente,
+y para a esquerda, z para cima); waypoints com ``mid`` são relativos ao mission
+pad, cujos centros são informados em ``pads`` (pads alinhados ao referencial).
+Waypoints livres são reordenados pelo planejador (vizinho mais próximo +
+2-opt) entre os waypoints fixos (``fixed``, ``mid`` e ``jump``), pernas
+consecutivas são fundidas em ``curve`` quando o raio está nos limites do SDK e
+o tempo de voo e a bateria são estimados antes da decolagem.
+
+Execução (planejamento sem voar):
+    python -m drone_app.models.mission missao.json
+"""
+import json
+import logging
+import math
+import os
+import sys
+from collections import namedtuple
+from threading import Event
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+logger = logging.getLogger(__name__)
+
+MIN_GO = 20
+MAX_GO = 500
+MIN_CURVE_RADIUS = 50
+MAX_CURVE_RADIUS = 1000
+MAX_CURVE_SPEED = 60
+# Velocidade aproximada de giro (graus/s) e tempo fixo de cada comando (s).
+YAW_SPEED = 60.0
+COMMAND_OVERHEAD = 1.0
+TAKEOFF_TIME = 6.0
+# Altura (cm) em que o drone fica após a decolagem.
+TAKEOFF_HEIGHT = 80
+LAND_TIME = 5.0
+SNAPSHOT_TIME = 0.5
+# Tempo de voo com a bateria cheia (s) e reserva mínima (%) exigida ao final da missão.
+FLIGHT_TIME_FULL_BATTERY = 12 * 60
+BATTERY_RESERVE = 20
+
+Waypoint = namedtuple('Waypoint', 'name x y z mid jump yaw dwell actions fixed')
+Waypoint.__new__.__defaults__ = (None, None, None, 0.0, (), False)
+Waypoint.__doc__ = """ Ponto da missão (cm). """
+
+MissionStep = namedtuple('MissionStep', 'method args duration distance rotation description')
+MissionStep.__doc__ = """ Passo do plano: método do drone, argumentos e custo estimado. """
+
+MissionEstimate = namedtuple('MissionEstimate', 'distance rotation duration battery steps')
+MissionEstimate.__doc__ = """ Estimativa da missão: cm, graus, segundos e % de bateria. """
+
+
+class MissionError(ValueError):
+    """ Classe para exceção de missão inválida ou inviável. """
+
+
+def _normalize_angle(angle):
+    """ Ângulo equivalente no intervalo (-180, 180]. """
+    angle = (angle + 180.0) % 360.0 - 180.0
+    return 180.0 if angle == -180.0 else angle
+
+
+def _sub(a, b):
+    return a[0] - b[0], a[1] - b[1], a[2] - b[2]
+
+
+def _norm(v):
+    return math.sqrt(v[0] * v[0] + v[1] * v[1] + v[2] * v[2])
+
+
+def _cross(a, b):
+    return a[1] * b[2] - a[2] * b[1], a[2] * b[0] - a[0] * b[2], a[0] * b[1] - a[1] * b[0]
+
+
+def _dot(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+
+def _heading(a, b):
+    """ Direção horizontal (graus, anti-horário a partir de x) de a para b, ou None. """
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    if abs(dx) < 1e-6 and abs(dy) < 1e-6:
+        return None
+    return math.degrees(math.atan2(dy, dx))
+
+
+def _to_body(delta, yaw):
+    """ Converte um deslocamento do referencial da missão para o do drone. """
+    rad = math.radians(yaw)
+    cos, sin = math.cos(rad), math.sin(rad)
+    return delta[0] * cos + delta[1] * sin, -delta[0] * sin + delta[1] * cos, delta[2]
+
+
+def arc(a, b, c):
+    """
+    Arco que passa por a, b e c.
+    :return: tupla (raio, comprimento) ou None para pontos colineares.
+    """
+    u, v = _sub(b, a), _sub(c, a)
+    w = _cross(u, v)
+    w2 = _dot(w, w)
+    if w2 < 1e-9:
+        return None
+    t = _cross(w, u)
+    s = _cross(v, w)
+    uu, vv = _dot(u, u), _dot(v, v)
+    center = tuple(a[i] + (uu * s[i] + vv * t[i]) / (2 * w2) for i in range(3))
+    radius = _norm(_sub(a, center))
+
+    def angle(p, q):
+        rp, rq = _sub(p, center), _sub(q, center)
+        return math.acos(max(-1.0, min(1.0, _dot(rp, rq) / (radius * radius))))
+    return radius, radius * (angle(a, b) + angle(b, c))
+
+
+class Mission:
+    """ Classe para a descrição de uma missão. """
+
+    def __init__(self, name, waypoints, pads=None, speed=50, face_forward=False, fuse_curves=True,
+                 rotation_weight=1.0, optimize=True, takeoff=True, land=True):
+        self.name = name
+        self.waypoints = list(waypoints)
+        self.pads = {int(k): tuple(v) for k, v in (pads or {}).items()}
+        self.speed = int(speed)
+        self.face_forward = face_forward
+        self.fuse_curves = fuse_curves
+        self.rotation_weight = rotation_weight
+        self.optimize = optimize
+        self.takeoff = takeoff
+        self.land = land
+        self._validate()
+
+    def _validate(self):
+        if not 10 <= self.speed <= 100:
+            raise MissionError('speed deve estar entre 10 e 100.')
+        for wp in self.waypoints:
+            for mid in ([wp.mid] if wp.mid is not None else []) + list(wp.jump or ()):
+                if not 1 <= mid <= 8:
+                    raise MissionError(f'{wp.name}: mission pad deve estar entre 1 e 8.')
+                if mid not in self.pads:
+                    raise MissionError(f'{wp.name}: posição do mission pad {mid} não informada em "pads".')
+            if wp.jump is not None and len(wp.jump) != 2:
+                raise MissionError(f'{wp.name}: jump espera [pad de origem, pad de destino].')
+            for action in wp.actions:
+                if action != 'snapshot':
+                    raise MissionError(f'{wp.name}: ação desconhecida "{action}".')
+
+    @property
+    def uses_pads(self):
+        """ Indica se a missão utiliza mission pads. """
+        return any(wp.mid is not None or wp.jump for wp in self.waypoints)
+
+    @classmethod
+    def from_dict(cls, data):
+        """ Cria a missão a partir do conteúdo do arquivo. """
+        try:
+            waypoints = []
+            for i, item in enumerate(data['waypoints']):
+                waypoints.append(Waypoint(
+                    name=str(item.get('name', i + 1)), x=float(item['x']), y=float(item['y']), z=float(item['z']),
+                    mid=None if item.get('mid') is None else int(item['mid']),
+                    jump=None if item.get('jump') is None else tuple(int(m) for m in item['jump']),
+                    yaw=None if item.get('yaw') is None else float(item['yaw']),
+                    dwell=float(item.get('dwell', 0)), actions=tuple(item.get('actions', ())),
+                    fixed=bool(item.get('fixed', False))))
+            options = {k: data[k] for k in ('pads', 'speed', 'face_forward', 'fuse_curves', 'rotation_weight',
+                                            'optimize', 'takeoff', 'land') if k in data}
+            return cls(data.get('name', 'mission'), waypoints, **options)
+        except (KeyError, TypeError, ValueError) as ex:
+            if isinstance(ex, MissionError):
+                raise
+            raise MissionError(f'Missão inválida: {ex!r}')
+
+    @classmethod
+    def load(cls, file_path):
+        """ Carrega a missão de um arquivo JSON ou YAML. """
+        with open(file_path, encoding='utf-8') as f:
+            if os.path.splitext(file_path)[1].lower() in ('.yaml', '.yml'):
+                if yaml is None:
+                    raise MissionError('Instale o PyYAML para carregar missões em YAML.')
+                data = yaml.safe_load(f)
+            else:
+                data = json.load(f)
+        return cls.from_dict(data)
+
+    def position(self, wp):
+        """ Posição do waypoint no referencial da missão. """
+        if wp.jump:
+            pad = self.pads[wp.jump[1]]
+            return pad[0], pad[1], wp.z
+        if wp.mid is not None:
+            pad = self.pads[wp.mid]
+            return pad[0] + wp.x, pad[1] + wp.y, wp.z
+        return wp.x, wp.y, wp.z
+
+    @staticmethod
+    def is_anchor(wp):
+        """ Waypoints fixos não são reordenados. """
+        return wp.fixed or wp.mid is not None or bool(wp.jump)
+
+
+class MissionPlanner:
+    """ Classe para ordenar os waypoints e gerar os passos da missão. """
+
+    def __init__(self, mission, home=None, durations=None):
+        self._mission = mission
+        # Modelo de duração dos comandos (DurationModel); sem ele usa as constantes do módulo.
+        self._durations = durations
+        self._home = tuple(home) if home else (0.0, 0.0, TAKEOFF_HEIGHT if mission.takeoff else 0.0)
+
+    def _route_cost(self, start, points, end=None, yaw=0.0):
+        """ Custo de um trajeto: distância + peso * rotação necessária. """
+        mission = self._mission
+        cost, position = 0.0, start
+        path = list(points) + ([end] if end is not None else [])
+        for wp in path:
+            target = mission.position(wp)
+            cost += _norm(_sub(target, position))
+            if mission.face_forward:
+                heading = _heading(position, target)
+                if heading is not None:
+                    cost += mission.rotation_weight * abs(_normalize_angle(heading - yaw))
+                    yaw = heading
+            if wp.yaw is not None:
+                cost += mission.rotation_weight * abs(_normalize_angle(wp.yaw - yaw))
+                yaw = wp.yaw
+            position = target
+        return cost
+
+    def _nearest_neighbour(self, start, points):
+        remaining, route, position = list(points), [], start
+        while remaining:
+            wp = min(remaining, key=lambda p: _norm(_sub(self._mission.position(p), position)))
+            remaining.remove(wp)
+            route.append(wp)
+            position = self._mission.position(wp)
+        return route
+
+    def _two_opt(self, start, route, end=None):
+        """ Inverte trechos da rota enquanto houver melhora. """
+        best = self._route_cost(start, route, end)
+        improved = True
+        while improved:
+            improved = False
+            for i in range(len(route) - 1):
+                for j in range(i + 1, len(route)):
+                    candidate = route[:i] + route[i:j + 1][::-1] + route[j + 1:]
+                    cost = self._route_cost(start, candidate, end)
+                    if cost < best - 1e-6:
+                        route, best, improved = candidate, cost, True
+        return route
+
+    def order(self):
+        """
+        Ordena os waypoints livres entre os fixos.
+        :return: lista de Waypoint.
+        """
+        mission = self._mission
+        if not mission.optimize:
+            return list(mission.waypoints)
+        ordered, free, start = [], [], self._home
+        for wp in mission.waypoints + [None]:
+            if wp is not None and not mission.is_anchor(wp):
+                free.append(wp)
+                continue
+            if free:
+                route = self._two_opt(start, self._nearest_neighbour(start, free), wp)
+                ordered.extend(route)
+                free = []
+            if wp is not None:
+                ordered.append(wp)
+                start = mission.position(wp)
+        return ordered
+
+    def _duration(self, sdk, default):
+        """ Duração prevista pelo modelo, quando informado, ou a estimativa padrão. """
+        if self._durations is None:
+            return default
+        return self._durations.predict(sdk, self._mission.speed)
+
+    def _rotate(self, steps, yaw, target, description):
+        delta = _normalize_angle(target - yaw)
+        degree = int(round(abs(delta)))
+        if degree >= 1:
+            method = 'count_clockwise' if delta > 0 else 'clockwise'
+            sdk = f'{"ccw" if delta > 0 else "cw"} {degree}'
+            steps.append(MissionStep(method, (degree,), self._duration(sdk, degree / YAW_SPEED + COMMAND_OVERHEAD),
+                                     0.0, degree,
+                                     description))
+            return _normalize_angle(yaw + (degree if delta > 0 else -degree))
+        return yaw
+
+    def _go(self, steps, position, target, yaw, description):
+        """ Deslocamento livre, dividido em pernas dentro do limite do SDK. """
+        body = _to_body(_sub(target, position), yaw)
+        distance = _norm(body)
+        legs = max(1, math.ceil(max(abs(c) for c in body) / MAX_GO))
+        leg = tuple(int(round(c / legs)) for c in body)
+        if max(abs(c) for c in leg) < MIN_GO:
+            # Deslocamento abaixo do mínimo do SDK: o drone já está no ponto.
+            return position
+        speed = self._mission.speed
+        for _ in range(legs):
+            duration = self._duration(f'go {leg[0]} {leg[1]} {leg[2]} {speed}', _norm(leg) / speed + COMMAND_OVERHEAD)
+            steps.append(MissionStep('go', leg + (speed,), duration, _norm(leg), 0.0, description))
+        return target if distance else position
+
+    def _curve(self, steps, position, yaw, wp, next_wp):
+        """
+        Tenta fundir as pernas até wp e next_wp em uma curva.
+        :return: nova posição ou None se a curva não é possível.
+        """
+        mission = self._mission
+        if not mission.fuse_curves or mission.face_forward or next_wp is None:
+            return None
+        if wp.dwell or wp.actions or wp.yaw is not None or wp.jump or next_wp.jump:
+            return None
+        if (wp.mid is None) != (next_wp.mid is None) or (wp.mid is not None and wp.mid != next_wp.mid):
+            return None
+        b, c = mission.position(wp), mission.position(next_wp)
+        result = arc(position, b, c)
+        if result is None or not MIN_CURVE_RADIUS <= result[0] <= MAX_CURVE_RADIUS:
+            return None
+        speed = min(mission.speed, MAX_CURVE_SPEED)
+        if wp.mid is not None:
+            coordinates = (wp.x, wp.y, wp.z, next_wp.x, next_wp.y, next_wp.z)
+            method, extra = 'curve_mid', (f'm{wp.mid}', speed)
+        else:
+            coordinates = _to_body(_sub(b, position), yaw) + _to_body(_sub(c, position), yaw)
+            method, extra = 'curve', (speed,)
+        coordinates = tuple(int(round(v)) for v in coordinates)
+        if any(abs(v) > MAX_GO for v in coordinates):
+            return None
+        duration = self._duration(f'curve {" ".join(str(v) for v in coordinates)} {speed}',
+                                  result[1] / speed + COMMAND_OVERHEAD)
+        steps.append(MissionStep(method, coordinates + extra, duration, result[1], 0.0, f'{wp.name} -> {next_wp.name}'))
+        return c
+
+    def plan(self):
+        """
+        Gera os passos da missão.
+        :return: lista de MissionStep.
+        """
+        mission = self._mission
+        route = self.order()
+        steps = []
+        if mission.uses_pads:
+            steps.append(MissionStep('request', ('mon',), COMMAND_OVERHEAD, 0.0, 0.0, 'ativa os mission pads'))
+        if mission.takeoff:
+            steps.append(MissionStep('takeoff', (), self._duration('takeoff', TAKEOFF_TIME), 0.0, 0.0, 'decolagem'))
+        position, yaw = self._home, 0.0
+        i = 0
+        while i < len(route):
+            wp = route[i]
+            target = mission.position(wp)
+            if mission.face_forward and not wp.jump:
+                heading = _heading(position, target)
+                if heading is not None:
+                    yaw = self._rotate(steps, yaw, heading, f'{wp.name}: direção')
+            curve_end = self._curve(steps, position, yaw, wp, route[i + 1] if i + 1 < len(route) else None)
+            if curve_end is not None:
+                position = curve_end
+                i += 1
+                wp = route[i]
+            elif wp.jump:
+                distance = _norm(_sub(target, position))
+                jump_yaw = int(round(wp.yaw or 0))
+                steps.append(MissionStep(
+                    'jump', (int(wp.x), int(wp.y), int(wp.z), f'm{wp.jump[0]}', f'm{wp.jump[1]}', mission.speed, True,
+                             jump_yaw), distance / mission.speed + COMMAND_OVERHEAD, distance, 0.0, wp.name))
+                position, yaw = target, float(jump_yaw)
+            elif wp.mid is not None:
+                distance = _norm(_sub(target, position))
+                steps.append(MissionStep('go_mid', (int(wp.x), int(wp.y), int(wp.z), f'm{wp.mid}', mission.speed),
+                                         distance / mission.speed + COMMAND_OVERHEAD, distance, 0.0, wp.name))
+                position = target
+            else:
+                position = self._go(steps, position, target, yaw, wp.name)
+            if wp.yaw is not None and not wp.jump:
+                yaw = self._rotate(steps, yaw, wp.yaw, f'{wp.name}: guinada')
+            for action in wp.actions:
+                steps.append(MissionStep(action, (), SNAPSHOT_TIME, 0.0, 0.0, wp.name))
+            if wp.dwell:
+                steps.append(MissionStep('wait', (wp.dwell,), wp.dwell, 0.0, 0.0, wp.name))
+            i += 1
+        if mission.land:
+            steps.append(MissionStep('land', (), self._duration('land', LAND_TIME), 0.0, 0.0, 'pouso'))
+        return steps
+
+    @staticmethod
+    def estimate(steps):
+        """ Estima distância, rotação, tempo de voo e consumo de bateria. """
+        duration = sum(step.duration for step in steps)
+        return MissionEstimate(
+            distance=sum(step.distance for step in steps),
+            rotation=sum(step.rotation for step in steps),
+            duration=duration,
+            battery=duration / FLIGHT_TIME_FULL_BATTERY * 100.0,
+            steps=len(steps))
+
+
+def check_battery(estimate, battery, reserve=BATTERY_RESERVE):
+    """ Verifica se a bateria atual é suficiente para a missão. """
+    if battery is not None and battery - estimate.battery < reserve:
+        raise MissionError(
+            f'Bateria insuficiente: {battery}% disponível, {estimate.battery:.0f}% estimado + {reserve}% de reserva.')
+    return True
+
+
+class MissionRunner:
+    """ Classe para executar o plano da missão no drone, um passo após a resposta do anterior. """
+
+    def __init__(self, drone_manager, steps, reply_timeout=10.0):
+        self._drone_manager = drone_manager
+        self._steps = steps
+        self._reply_timeout = reply_timeout
+        self._stop_event = Event()
+        self._reply_event = Event()
+        self._current = 0
+
+    @property
+    def current(self):
+        """ Índice do passo em execução. """
+        return self._current
+
+    def stop(self):
+        """ Interrompe a missão após o passo corrente. """
+        self._stop_event.set()
+        self._reply_event.set()
+        return self
+
+    def _on_reply(self, command, response):
+        self._reply_event.set()
+
+    def _execute(self, step):
+        if step.method == 'wait':
+            self._stop_event.wait(step.args[0])
+            return
+        if step.method == 'snapshot':
+            result = self._drone_manager.snapshot()
+            if hasattr(result, 'result'):
+                result.result(timeout=self._reply_timeout)
+            return
+        if step.method == 'request':
+            self._drone_manager.request(*step.args)
+            return
+        self._reply_event.clear()
+        getattr(self._drone_manager, step.method)(*step.args)
+        if not self._reply_event.wait(step.duration + self._reply_timeout):
+            logger.warning({'action': 'mission_runner', 'step': step.description, 'reply': 'timeout'})
+
+    def run(self, check=True):
+        """
+        Executa a missão na thread corrente.
+        :param check: verifica a bateria (telemetria) antes da decolagem.
+        :return: quantidade de passos executados.
+        """
+        if check:
+            estimate = MissionPlanner.estimate(self._steps)
+            check_battery(estimate, self._drone_manager.telemetry.snapshot().get('bat'))
+        self._drone_manager.add_reply_listener(self._on_reply)
+        try:
+            for self._current, step in enumerate(self._steps):
+                if self._stop_event.is_set():
+                    logger.info({'action': 'mission_runner', 'status': 'stopped', 'step': self._current})
+                    return self._current
+                logger.info({'action': 'mission_runner', 'step': self._current, 'method': step.method,
+                             'description': step.description})
+                self._execute(step)
+        finally:
+            self._drone_manager.remove_reply_listener(self._on_reply)
+        return len(self._steps)
+
+
+def main(argv=None):
+    """ Planeja a missão e apresenta os passos e a estimativa, sem voar. """
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print('Uso: python -m drone_app.models.mission <missao.json|missao.yaml>')
+        return 2
+    mission = Mission.load(argv[0])
+    planner = MissionPlanner(mission)
+    steps = planner.plan()
+    for i, step in enumerate(steps):
+        print(f'{i:3d} {step.method:16s} {" ".join(str(a) for a in step.args):40s} {step.duration:6.1f}s '
+              f'{step.description}')
+    estimate = planner.estimate(steps)
+    print(f'Distância: {estimate.distance:.0f} cm | Rotação: {estimate.rotation:.0f}° | '
+          f'Tempo: {estimate.duration:.0f} s | Bateria: {estimate.battery:.0f}%')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,232 @@
+# coding=utf-8
+"""
+Módulo do Simulador do Tello.
+
+Substituto local do drone via UDP: responde aos comandos do SDK com o mesmo
+protocolo texto ("ok", "error", valores das consultas), mantém um estado
+determinístico (posição, guinada, velocidade e bateria) e pode enviar o estado
+no formato da porta 8890. As respostas dos movimentos chegam após a duração
+estimada do comando, multiplicada por ``time_scale`` (0 responde na hora).
+
+Execução:
+    python -m drone_app.models.simulator --port 8889
+"""
+import argparse
+import logging
+import math
+import socket
+import time
+from threading import Event, Lock, Thread, Timer
+
+from drone_app.core.duration_model import PRIORS, command_kind, features
+
+logger = logging.getLogger(__name__)
+
+MOVES = {'up': (0, 0, 1), 'down': (0, 0, -1), 'left': (0, 1, 0), 'right': (0, -1, 0), 'forward': (1, 0, 0),
+         'back': (-1, 0, 0)}
+QUERIES = ('speed?', 'battery?', 'time?', 'height?', 'temp?', 'attitude?', 'baro?', 'tof?', 'wifi?', 'sdk?', 'sn?',
+           'acceleration?')
+# Bateria consumida por segundo de voo (%).
+BATTERY_DRAIN = 100.0 / (12 * 60)
+
+
+class TelloSimulator:
+    """ Classe do drone simulado. """
+
+    def __init__(self, host='127.0.0.1', port=8889, state_address=None, time_scale=1.0, battery=100.0,
+                 state_interval=0.1):
+        self._address = (host, port)
+        self._state_address = state_address
+        self._time_scale = time_scale
+        self._state_interval = state_interval
+        self._socket = None
+        self._stop_event = Event()
+        self._lock = Lock()
+        self._busy_until = 0.0
+        self._threads = []
+        self.sdk_mode = False
+        self.flying = False
+        self.position = [0.0, 0.0, 0.0]
+        self.yaw = 0.0
+        self.speed = 10
+        self.battery = battery
+        self.flight_time = 0.0
+        self.received = []
+
+    @property
+    def address(self):
+        """ Endereço (host, porta) efetivamente utilizado. """
+        return self._socket.getsockname() if self._socket else self._address
+
+    def start(self):
+        """ Inicia o simulador em threads próprias. """
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(self._address)
+        self._socket.settimeout(0.2)
+        self._threads = [Thread(target=self._serve, daemon=True)]
+        if self._state_address:
+            self._threads.append(Thread(target=self._send_state, daemon=True))
+        for thread in self._threads:
+            thread.start()
+        logger.info({'action': 'tello_simulator', 'address': self.address})
+        return self
+
+    def stop(self):
+        """ Encerra o simulador. """
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(1)
+        if self._socket:
+            self._socket.close()
+        return self
+
+    def _serve(self):
+        while not self._stop_event.is_set():
+            try:
+                data, address = self._socket.recvfrom(1024)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            command = data.decode('utf-8', 'replace').strip()
+            self.received.append(command)
+            reply, duration = self.handle(command)
+            if reply is None:
+                continue
+            delay = self._schedule(duration)
+            if delay <= 0:
+                self._reply(reply, address)
+            else:
+                Timer(delay, self._reply, args=(reply, address)).start()
+
+    def _schedule(self, duration):
+        """ Comandos são executados em sequência: a resposta sai ao final do comando corrente. """
+        with self._lock:
+            now = time.monotonic()
+            self._busy_until = max(now, self._busy_until) + duration * self._time_scale
+            return self._busy_until - now
+
+    def _reply(self, reply, address):
+        try:
+            self._socket.sendto(reply.encode('utf-8'), address)
+        except OSError as ex:
+            logger.warning({'action': 'tello_simulator', 'reply': reply, 'ex': ex})
+
+    def _fly(self, duration):
+        self.flight_time += duration
+        self.battery = max(0.0, self.battery - duration * BATTERY_DRAIN)
+
+    def _move(self, dx, dy, dz):
+        """ Desloca no referencial do drone (guinada positiva no sentido horário, como na telemetria). """
+        rad = math.radians(-self.yaw)
+        self.position[0] += dx * math.cos(rad) - dy * math.sin(rad)
+        self.position[1] += dx * math.sin(rad) + dy * math.cos(rad)
+        self.position[2] = max(0.0, self.position[2] + dz)
+
+    def state(self):
+        """ Estado no formato da porta 8890. """
+        return (f'mid:-1;x:0;y:0;z:0;mpry:0,0,0;pitch:0;roll:0;yaw:{int(self.yaw)};vgx:0;vgy:0;vgz:0;templ:60;'
+                f'temph:63;tof:{int(self.position[2]) + 10};h:{int(self.position[2])};bat:{int(self.battery)};'
+                f'baro:0.00;time:{int(self.flight_time)};agx:0.00;agy:0.00;agz:-1000.00;\r\n')
+
+    def _send_state(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock_state:
+            while not self._stop_event.wait(self._state_interval):
+                try:
+                    sock_state.sendto(self.state().encode('utf-8'), self._state_address)
+                except OSError:
+                    pass
+
+    def _query(self, command):
+        return {
+            'speed?': str(self.speed), 'battery?': str(int(self.battery)), 'time?': f'{int(self.flight_time)}s',
+            'height?': f'{int(self.position[2] / 10)}dm', 'temp?': '60~63C',
+            'attitude?': f'pitch:0;roll:0;yaw:{int(self.yaw)};', 'baro?': '0.0',
+            'tof?': f'{int(self.position[2]) + 10}mm', 'wifi?': '90', 'sdk?': '20', 'sn?': 'SIMULATOR',
+            'acceleration?': 'agx:0.00;agy:0.00;agz:-1000.00;',
+        }[command]
+
+    def handle(self, command):
+        """
+        Executa o comando no estado simulado.
+        :return: tupla (resposta ou None, duração em segundos).
+        """
+        parts = command.split()
+        if not parts:
+            return 'error', 0.0
+        name, args = parts[0], parts[1:]
+        if name == 'command':
+            self.sdk_mode = True
+            return 'ok', 0.0
+        if not self.sdk_mode:
+            return None, 0.0
+        if command in QUERIES:
+            return self._query(command), 0.0
+        if name == 'rc':
+            return None, 0.0
+        duration = sum(c * v for c, v in zip(PRIORS[command_kind(name)], features(command, self.speed)[1]))
+        try:
+            if name in ('streamon', 'streamoff', 'mon', 'moff', 'mdirection', 'wifi', 'ap', 'stop'):
+                return 'ok', 0.0
+            if name == 'speed':
+                self.speed = int(args[0])
+                return 'ok', 0.0
+            if name == 'emergency':
+                self.flying = False
+                self.position[2] = 0.0
+                return 'ok', 0.0
+            if name == 'takeoff':
+                if self.flying:
+                    return 'error', 0.0
+                self.flying = True
+                self.position[2] = 80.0
+            elif not self.flying:
+                return 'error Motor stop', 0.0
+            elif name == 'land':
+                self.flying = False
+                self.position[2] = 0.0
+            elif name in MOVES:
+                distance = int(args[0])
+                if not 20 <= distance <= 500:
+                    return 'error', 0.0
+                self._move(*(c * distance for c in MOVES[name]))
+            elif name in ('cw', 'ccw'):
+                degree = int(args[0])
+                self.yaw = (self.yaw + (degree if name == 'cw' else -degree) + 180) % 360 - 180
+            elif name == 'flip':
+                if args[0] not in ('l', 'r', 'f', 'b'):
+                    return 'error', 0.0
+            elif name == 'go':
+                self._move(int(args[0]), int(args[1]), int(args[2]))
+            elif name == 'curve':
+                self._move(int(args[3]), int(args[4]), int(args[5]))
+            elif name == 'jump':
+                self.position[2] = float(args[2])
+            else:
+                return f'unknown command: {name}', 0.0
+        except (IndexError, ValueError):
+            return 'error', 0.0
+        self._fly(duration)
+        return 'ok', duration
+
+
+def main():
+    """ Executa o simulador até Ctrl+C. """
+    parser = argparse.ArgumentParser(description='Simulador local do Tello (UDP).')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8889)
+    parser.add_argument('--state-port', type=int, default=None, help='porta local para enviar o estado.')
+    parser.add_argument('--time-scale', type=float, default=1.0, help='multiplicador da duração dos comandos.')
+    args = parser.parse_args()
+    state_address = (args.host, args.state_port) if args.state_port else None
+    simulator = TelloSimulator(args.host, args.port, state_address, args.time_scale).start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        simulator.stop()
+
+
+if __name__ == '__main__':
+    main()
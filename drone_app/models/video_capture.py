@@ -4,38 +4,136 @@ Módulo de OpenCvVideoCapture.
 """
 import os
 import time
+from threading import Lock, Thread
 
 import cv2 as cv
 
-from config import SNAPSHOT_IMAGE_FOLDER
+from config import SNAPSHOT_IMAGE_FOLDER, TRACKING_WATCHDOG_TIMEOUT
 from drone_app.core.exceptions import DroneSnapShotDirNotFound
 from drone_app.core.abstract_middleware import BaseMiddleware
-from drone_app.core.utils import Retry
+from drone_app.core.classifiers import FACE_CASCADE, EYE_CASCADE
+from drone_app.core.snapshot import FrameRing, SnapshotRequest, SnapshotWriter
+from drone_app.core.snapshot_store import SnapshotStore
+from drone_app.core.tracking import TrackingController
+from drone_app.core.vision_pool import DetectorSpec, VisionWorkerPool
 
 
-class OpenCvVideoCapture:
-    """ Classe para trabalhar com o OpenCvVideoCapture. """
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
 
-    def __init__(self, middleware, *args, **kwargs):
+class OpenCvVideoCapture:
+    """
+    Classe para trabalhar com o OpenCvVideoCapture.
+    A fonte pode ser a webcam (índice), um arquivo de vídeo, um dump H.264 bruto
+    gravado do drone ou um diretório de imagens. No modo headless nenhuma janela
+    é aberta, permitindo medir o custo dos middlewares em servidores.
+    """
+
+    def __init__(self, middleware, *args, source=0, headless=False, realtime=True, fps=30.0, frame_size=None,
+                 max_frames=None, **kwargs):
         self._args = args
         self._kwargs = kwargs
         self._middleware = middleware
-        self._cap = cv.VideoCapture(0)
+        self._source = source
+        self._headless = headless
+        self._realtime = realtime
+        self._fps = fps
+        self._frame_size = frame_size
+        self._max_frames = max_frames
+        self._cap = None
+        self._report = None
+
+    @property
+    def report(self):
+        """ Expõe o relatório da última execução. """
+        return self._report
+
+    def _image_dir_frames(self):
+        """ Gera os frames a partir de um diretório de imagens. """
+        for file_name in sorted(os.listdir(self._source)):
+            if os.path.splitext(file_name)[1].lower() in IMAGE_EXTENSIONS:
+                img = cv.imread(os.path.join(self._source, file_name))
+                if img is not None:
+                    yield img
+
+    def _capture_frames(self):
+        """ Gera os frames da webcam, de um arquivo de vídeo ou de um dump H.264. """
+        source = self._source
+        if isinstance(source, str) and source.isdigit():
+            source = int(source)
+        self._cap = cv.VideoCapture(source) if isinstance(source, int) else cv.VideoCapture(source, cv.CAP_FFMPEG)
+        fps = self._cap.get(cv.CAP_PROP_FPS)
+        if fps and fps > 0:
+            self._fps = fps
+        try:
+            while True:
+                ret, img = self._cap.read()
+                if not ret:
+                    break
+                yield img
+        finally:
+            self._cap.release()
+
+    def frames(self):
+        """ Gera os frames da fonte configurada, redimensionados se necessário. """
+        if isinstance(self._source, str) and os.path.isdir(self._source):
+            frames = self._image_dir_frames()
+        else:
+            frames = self._capture_frames()
+        for count, img in enumerate(frames):
+            if self._max_frames is not None and count >= self._max_frames:
+                break
+            if self._frame_size and (img.shape[1], img.shape[0]) != tuple(self._frame_size):
+                img = cv.resize(img, tuple(self._frame_size))
+            yield img
 
     def execute(self):
         """
         Método para executa o OpenCvVideoCapture
-        :return:
+        :return: relatório com frames por segundo e o custo de cada middleware.
         """
-        while True:
-            ret, img = self._cap.read()
+        self._middleware.enable_timings()
+        count = 0
+        start = time.perf_counter()
+        for img in self.frames():
+            frame_start = time.perf_counter()
             self._middleware.process(img)
-
-            cv.imshow('frame', img)
-            if cv.waitKey(1) & 0xFF == ord('q'):
-                break
-
-        cv.destroyAllWindows()
+            count += 1
+
+            if not self._headless:
+                cv.imshow('frame', img)
+                if cv.waitKey(1) & 0xFF == ord('q'):
+                    break
+            if self._realtime:
+                # Mantém o ritmo original da fonte.
+                wait = (1.0 / self._fps) - (time.perf_counter() - frame_start)
+                if wait > 0:
+                    time.sleep(wait)
+
+        elapsed = time.perf_counter() - start
+        if not self._headless:
+            cv.destroyAllWindows()
+        self._report = self._make_report(count, elapsed)
+        return self._report
+
+    def _make_report(self, count, elapsed):
+        """ Monta o relatório de desempenho. """
+        middlewares = []
+        for middleware in self._middleware.chain():
+            timings = sorted(middleware.timings or [0.0])
+            middlewares.append({
+                'middleware': type(middleware).__name__,
+                'mean_ms': round(1000 * sum(timings) / len(timings), 3),
+                'p95_ms': round(1000 * timings[int(0.95 * (len(timings) - 1))], 3),
+                'max_ms': round(1000 * timings[-1], 3),
+            })
+        return {
+            'source': str(self._source),
+            'frames': count,
+            'elapsed': round(elapsed, 3),
+            'fps': round(count / elapsed, 2) if elapsed else 0.0,
+            'middlewares': middlewares,
+        }
 
 
 class FaceEyesDetectMiddleware(BaseMiddleware):
@@ -43,8 +141,8 @@ class FaceEyesDetectMiddleware(BaseMiddleware):
 
     def __init__(self, next_middleware=None):
         super(FaceEyesDetectMiddleware, self).__init__(next_middleware)
-        self._face_cascade = self.get_cascade('haarcascade_frontalface_default.xml')
-        self._eye_cascade = self.get_cascade('haarcascade_eye.xml')
+        self.preload_cascades(FACE_CASCADE, EYE_CASCADE)
+        self._last_boxes = []
 
     def _process(self, frame):
         """
@@ -52,23 +150,27 @@ class FaceEyesDetectMiddleware(BaseMiddleware):
         :param frame:
         :return:
         """
-        if self._next:
-            frame = self._next.process(frame)
         gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
-        faces = self._face_cascade.detectMultiScale(gray, 1.3, 5)
+        faces = self.get_cascade(FACE_CASCADE).detectMultiScale(gray, self.scale_factor, self.min_neighbors)
         # print('Faces: ', len(faces))
 
+        self._last_boxes = []
         for (x, y, w, h) in faces:
-            cv.rectangle(frame, (x, y), (x + w, y + h), (255, 0, 0), 2)
+            self._last_boxes.append(((x, y), (x + w, y + h), (255, 0, 0)))
             eye_gray = gray[y: y + h, x: x + w]
-            eye_color = frame[y: y + h, x: x + w]
-            eyes = self._eye_cascade.detectMultiScale(eye_gray)
+            eyes = self.get_cascade(EYE_CASCADE).detectMultiScale(eye_gray)
             # print('Olhos: ', len(eyes))
             for (ex, ey, ew, eh) in eyes:
-                cv.rectangle(eye_color, (ex, ey), (ex + ew, ey + eh), (0, 255, 0), 2)
+                self._last_boxes.append(((x + ex, y + ey), (x + ex + ew, y + ey + eh), (0, 255, 0)))
                 break
             break
 
+        return self._replay(frame)
+
+    def _replay(self, frame):
+        """ Desenha a última face e olho encontrados. """
+        for start, end, color in self._last_boxes:
+            cv.rectangle(frame, start, end, color, 2)
         return frame
 
 
@@ -77,7 +179,8 @@ class FaceDetectMiddleware(BaseMiddleware):
 
     def __init__(self, next_middleware=None):
         super(FaceDetectMiddleware, self).__init__(next_middleware)
-        self._face_cascade = self.get_cascade('haarcascade_frontalface_default.xml')
+        self.preload_cascades(FACE_CASCADE)
+        self._last_faces = []
 
     def _process(self, frame):
         """
@@ -85,15 +188,15 @@ class FaceDetectMiddleware(BaseMiddleware):
         :param frame:
         :return:
         """
-        if self._next:
-            frame = self._next.process(frame)
         gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
-        faces = self._face_cascade.detectMultiScale(gray, 1.3, 5)
+        faces = self.get_cascade(FACE_CASCADE).detectMultiScale(gray, self.scale_factor, self.min_neighbors)
+        self._last_faces = list(faces)[:1]
+        return self._replay(frame)
 
-        for (x, y, w, h) in faces:
+    def _replay(self, frame):
+        """ Desenha a última face encontrada. """
+        for (x, y, w, h) in self._last_faces:
             cv.rectangle(frame, (x, y), (x + w, y + h), (255, 0, 0), 2)
-            break
-
         return frame
 
 
@@ -102,8 +205,44 @@ class DroneFaceDetectMiddleware(BaseMiddleware):
 
     def __init__(self, next_middleware=None, drone_manager=None):
         super().__init__(next_middleware)
+        self._init_tracking(drone_manager)
+        self.preload_cascades(FACE_CASCADE)
+
+    def _init_tracking(self, drone_manager):
+        """ Estados do rastreamento (o controlador e o watchdog são criados no primeiro uso). """
         self._drone_manager = drone_manager
-        self._face_cascade = self.get_cascade('haarcascade_frontalface_default.xml')
+        self._tracker = None
+        # O watchdog e a thread que desativa a detecção também usam o controlador.
+        self._tracker_lock = Lock()
+        self._watchdog = None
+        self._last_faces = []
+
+    @property
+    def tracker(self):
+        """ Recupera o controlador de rastreamento com os ganhos do AbstractVideoSetup. """
+        if self._tracker is None:
+            self._tracker = TrackingController(self._drone_manager.video_setup.tracking_gains,
+                                               watchdog_timeout=TRACKING_WATCHDOG_TIMEOUT)
+            if TRACKING_WATCHDOG_TIMEOUT:
+                self._watchdog = Thread(target=self._watch, daemon=True)
+                self._watchdog.start()
+        return self._tracker
+
+    def _watch(self):
+        """
+        Laço do watchdog: para o drone quando nenhum resultado da detecção chega dentro do timeout
+        (decodificador travado, detecção não executada); o rc anterior continuaria em vigor.
+        """
+        while True:
+            time.sleep(TRACKING_WATCHDOG_TIMEOUT / 2)
+            try:
+                with self._tracker_lock:
+                    velocities = self._tracker.watchdog()
+                    if velocities:
+                        self._drone_manager.recorder.event(tracking='watchdog', velocities=velocities)
+                        self._drone_manager.rc(*velocities)
+            except Exception as ex:
+                self._drone_manager.logger.error({'action': 'tracking_watchdog', 'ex': ex})
 
     def _process(self, frame):
         """
@@ -111,11 +250,12 @@ class DroneFaceDetectMiddleware(BaseMiddleware):
         :param frame:
         :return:
         """
-        if self._next:
-            frame = self._next.process(frame)
         gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
-        faces = self._face_cascade.detectMultiScale(gray, 1.3, 5)
+        faces = self.get_cascade(FACE_CASCADE).detectMultiScale(gray, self.scale_factor, self.min_neighbors)
+        if len(faces) == 0 and self._drone_manager:
+            self.execute_lost_rules()
 
+        self._last_faces = list(faces)[:1]
         for (x, y, w, h) in faces:
             cv.rectangle(frame, (x, y), (x + w, y + h), (255, 0, 0), 2)
             if self._drone_manager:
@@ -130,57 +270,211 @@ class DroneFaceDetectMiddleware(BaseMiddleware):
 
         return frame
 
+    def _replay(self, frame):
+        """ Desenha a última face encontrada sem gerar comandos para o drone. """
+        for (x, y, w, h) in self._last_faces:
+            cv.rectangle(frame, (x, y), (x + w, y + h), (255, 0, 0), 2)
+        return frame
+
     def execute_drone_rules(self, diff_x, diff_y, percent_face):
         """ Executa as Regras relacionadas à movimentação do drone. """
-        drone_x, drone_y, drone_z, speed = 0, 0, 0, self._drone_manager.speed
-        if diff_x < -30:
-            drone_y = -30
-        if diff_x > 30:
-            drone_y = 30
-        if diff_y < -15:
-            drone_z = -30
-        if diff_y > 15:
-            drone_z = 30
-        if percent_face > 0.3:
-            drone_x = -30
-        if percent_face < -0.02:
-            drone_x = 30
-        # Movimenta o drone.
-        self._drone_manager.go(drone_x, drone_y, drone_z, speed, blocking=False)
+        video_setup = self._drone_manager.video_setup
+        with self._tracker_lock:
+            velocities = self.tracker.update(
+                diff_x, diff_y, percent_face, video_setup.frame_center_x, video_setup.frame_center_y)
+            self._drone_manager.recorder.track(diff_x, diff_y, percent_face, velocities)
+            # Comandos redundantes ou acima da taxa máxima não são enviados.
+            if velocities:
+                self._drone_manager.rc(*velocities)
+        return self
+
+    def execute_lost_rules(self, reason='lost'):
+        """ Para o drone (uma única vez) quando a face é perdida. """
+        with self._tracker_lock:
+            velocities = self.tracker.lost()
+            if velocities:
+                self._drone_manager.recorder.event(tracking=reason, velocities=velocities)
+                self._drone_manager.rc(*velocities)
+        return self
+
+    def _stop_tracking(self):
+        """ Para o drone e reinicia o controlador quando a detecção é desativada. """
+        if self._drone_manager and self._tracker is not None:
+            self.execute_lost_rules(reason='disabled')
+
+
+class PoolFaceDetectMiddleware(DroneFaceDetectMiddleware):
+    """
+    Classe middleware que executa a detecção de faces em processos de trabalho.
+    Os frames são publicados em memória compartilhada e o resultado mais recente
+    (não atrasado) é desenhado no frame corrente.
+    """
+
+    def __init__(self, next_middleware=None, drone_manager=None, workers=None, max_lag=5):
+        BaseMiddleware.__init__(self, next_middleware)
+        self._init_tracking(drone_manager)
+        self._workers = workers
+        self._max_lag = max_lag
+        self._specs = [DetectorSpec('face', self.get_cascade_path(FACE_CASCADE))]
+        self._pool = None
+        self._last_seq = 0
+
+    @property
+    def pool(self):
+        """ Expõe o pool de processos. """
+        return self._pool
+
+    def _process(self, frame):
+        """
+        Publica o frame para os workers e aplica o último resultado disponível.
+        :param frame:
+        :return:
+        """
+        if self._pool is None or not self._pool.fits(frame.shape):
+            # O formato do frame só é conhecido no primeiro processamento; frames menores (escala da detecção
+            # reduzida pelo governador) usam os mesmos slots, somente um frame maior recria o pool.
+            self.close()
+            self._pool = VisionWorkerPool(frame.shape, self._specs, self._workers, max_lag=self._max_lag)
+        self._pool.submit(frame, self.scale_factor, self.min_neighbors)
+
+        result = self._pool.latest()
+        if result is None:
+            return frame
+
+        self._last_faces = result.boxes['face'][:1]
+        self._replay(frame)
+
+        # Cada resultado gera no máximo um comando de movimentação.
+        hints = result.hints['face']
+        if self._drone_manager and result.seq > self._last_seq:
+            self._last_seq = result.seq
+            if hints:
+                self.execute_drone_rules(hints['diff_x'], hints['diff_y'], hints['percent_face'])
+            else:
+                self.execute_lost_rules()
+
+        return frame
+
+    def close(self):
+        """ Encerra os processos de trabalho. """
+        if self._pool:
+            self._pool.close()
+            self._pool = None
         return self
 
 
+class MotionGateMiddleware(BaseMiddleware):
+    """
+    Classe middleware que evita a detecção em frames estáticos.
+    Compara uma versão reduzida em tons de cinza com o último frame analisado;
+    quando a diferença não passa do limite, a cadeia apenas reaplica os últimos
+    resultados (replay) em vez de executar os classificadores.
+    """
+
+    def __init__(self, next_middleware=None, threshold=0.02, size=(32, 24), max_skip=30):
+        super().__init__(next_middleware)
+        self._threshold = threshold
+        self._size = size
+        self._max_skip = max_skip
+        self._last = None
+        self._skipped = 0
+        self._is_changed = True
+        self._stats = {'analysed': 0, 'skipped': 0}
+
+    @property
+    def stats(self):
+        """ Expõe a quantidade de frames analisados e ignorados. """
+        return dict(self._stats)
+
+    def _process(self, frame):
+        """
+        Calcula a diferença média com o último frame analisado.
+        :param frame:
+        :return:
+        """
+        small = cv.resize(frame, self._size, interpolation=cv.INTER_AREA)
+        small = cv.cvtColor(small, cv.COLOR_BGR2GRAY)
+        if self._last is None or self._skipped >= self._max_skip:
+            self._is_changed = True
+        else:
+            self._is_changed = cv.mean(cv.absdiff(small, self._last))[0] / 255 > self._threshold
+
+        if self._is_changed:
+            self._last = small
+            self._skipped = 0
+            self._stats['analysed'] += 1
+        else:
+            self._skipped += 1
+            self._stats['skipped'] += 1
+        return frame
+
+    def _replay(self, frame):
+        return frame
+
+    def _forward(self, frame):
+        """ Frames sem mudança relevante apenas reaplicam os últimos resultados. """
+        if self._is_changed:
+            return self._next.process(frame)
+        return self._next.replay(frame)
+
+
 class DroneSnapshotMiddleware(BaseMiddleware):
-    """ Classe para processamento de snapshot no drone. """
-    
-    def __init__(self, next_middleware=None, drone_manager=None):
+    """
+    Classe para processamento de snapshot no drone.
+    Guarda os últimos frames processados em um anel e entrega a codificação e a
+    gravação para o SnapshotWriter, sem bloquear a thread de vídeo.
+    """
+
+    def __init__(self, next_middleware=None, drone_manager=None, ring_size=30, writer=None):
         super().__init__(next_middleware)
         self._drone_manager = drone_manager
         if not os.path.exists(SNAPSHOT_IMAGE_FOLDER):
             raise DroneSnapShotDirNotFound()
-        self._is_snapshot = False
+        self._ring = FrameRing(ring_size)
+        self._writer = writer if writer else SnapshotWriter(SnapshotStore(SNAPSHOT_IMAGE_FOLDER))
+        self._requests = []
+        self._lock = Lock()
 
     def _process(self, frame):
-        if self._is_snapshot:
-            if self._next:
-                frame = self._next.process(frame)
-            _, jpeg = cv.imencode('.jpg', frame)
-            jpeg_binary = jpeg.tobytes()
-
-            backup_file = f'{time.strftime("%Y%m%d-%H%M%S")}.jpg'
-            file = 'snapshot.jpg'
-            for file_name in (backup_file, file):
-                file_path = os.path.join(SNAPSHOT_IMAGE_FOLDER, file_name)
-                with open(file_path, 'wb') as f:
-                    f.write(jpeg_binary)
-            self._is_snapshot = False
+        self._ring.push(frame)
+        if self._requests:
+            now = time.time()
+            with self._lock:
+                for request in self._requests:
+                    request.offer(frame, now)
+                done = [r for r in self._requests if r.is_complete]
+                self._requests = [r for r in self._requests if not r.is_complete]
+            for request in done:
+                self._writer.submit(request)
 
         return frame
 
+    def _request(self, request):
+        """ Entrega o pedido ao writer ou aguarda os próximos frames. """
+        request.drone = getattr(self._drone_manager, 'drone_ip', '')
+        if request.is_complete:
+            return self._writer.submit(request)
+        with self._lock:
+            self._requests.append(request)
+        return request.future
+
     def snapshot(self):
-        """ Aciona o snapshot. """
-        self._is_snapshot = True
-        return Retry(self._is_snapshot, 3, 0.1).go()
+        """
+        Aciona o snapshot com o último frame processado.
+        :return: Future que resolve com SnapshotResult.
+        """
+        return self._request(SnapshotRequest(frames=self._ring.latest(1)))
+
+    def burst(self, count, interval=0.0, pre_trigger=0):
+        """
+        Aciona uma captura em rajada.
+        :param count: quantidade de frames capturados a partir do acionamento.
+        :param interval: intervalo mínimo em segundos entre os frames da rajada.
+        :param pre_trigger: quantidade de frames anteriores ao acionamento (do anel).
+        :return: Future que resolve com a lista de SnapshotResult.
+        """
+        frames = self._ring.latest(pre_trigger) if pre_trigger else []
+        return self._request(SnapshotRequest(count + len(frames), interval, frames, single=False))
 
 
 if __name__ == '__main__':
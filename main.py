@@ -7,17 +7,16 @@ import sys
 
 import config
 import drone_app.controllers.server
+from drone_app.core.logs import setup_logging
 
 
 def get_log_stream(is_log_in_file=False):
-    """ Recupera o ambiente do log. """
-    stream = sys.stdout
+    """ Recupera o destino do log (arquivo ou saída padrão). """
     if is_log_in_file:
-        stream = config.LOG_FILE
-    return stream
+        return logging.FileHandler(config.LOG_FILE, encoding='utf-8')
+    return logging.StreamHandler(sys.stdout)
 
 
-logging.basicConfig(level=logging.INFO, stream=get_log_stream())
-
 if __name__ == '__main__':
+    setup_logging(get_log_stream(config.LOG_IN_FILE))
     drone_app.controllers.server.run()
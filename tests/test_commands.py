@@ -0,0 +1,58 @@
+# coding=utf-8
+"""
+Testes da validação e execução de lotes de comandos.
+"""
+from drone_app.models.commands import execute_batch, validate_batch
+
+
+class FakeDrone:
+    """ Drone falso: registra os envios e responde 'ok' aos comandos com resposta. """
+
+    def __init__(self, replies=None):
+        self.requests = []
+        self.datagrams = []
+        self._replies = replies or {}
+
+    def request(self, command):
+        self.requests.append(command)
+        return self._replies.get(command, 'ok')
+
+    def send_datagram(self, command):
+        self.datagrams.append(command)
+        return self
+
+
+def test_batch_with_rc_is_sent_without_waiting_for_reply():
+    sdk_commands, errors = validate_batch([
+        {'command': 'takeoff'},
+        {'command': 'rc', 'args': [0, 20, 0, 0]},
+        {'command': 'land'},
+    ])
+    assert not errors
+    drone = FakeDrone()
+    results = execute_batch(drone, sdk_commands, stop_on_error=True)
+    assert drone.requests == ['takeoff', 'land']
+    assert drone.datagrams == ['rc 0 20 0 0']
+    assert [r.status for r in results] == ['ok', 'sent', 'ok']
+    assert results[1].reply is None
+
+
+def test_batch_stops_on_error():
+    sdk_commands, _ = validate_batch([{'command': 'takeoff'}, {'command': 'up', 'args': [50]}, {'command': 'land'}])
+    drone = FakeDrone(replies={'takeoff': None})
+    results = execute_batch(drone, sdk_commands, stop_on_error=True)
+    assert [r.status for r in results] == ['error', 'skipped', 'skipped']
+    assert drone.requests == ['takeoff']
+
+
+def test_batch_rejects_invalid_types():
+    sdk_commands, errors = validate_batch([
+        {'command': ['up']},
+        {'command': 'up', 'args': 5},
+        {'command': 'up', 'args': '30'},
+        {'command': 'up', 'args': [True]},
+        {'command': 'speed', 'args': {'speed': False}},
+    ])
+
+    assert sdk_commands == []
+    assert [error['index'] for error in errors] == [0, 1, 2, 3, 4]
@@ -0,0 +1,17 @@
+# coding=utf-8
+"""
+Testes do controlador de rastreamento.
+"""
+from drone_app.core.tracking import TrackingController
+
+
+def test_watchdog_stops_drone_once_when_results_stop():
+    tracker = TrackingController(watchdog_timeout=1.0)
+    assert tracker.update(200, 0, 0.05, 320, 240, now=10.0) != (0, 0, 0, 0)
+    assert tracker.watchdog(now=10.5) is None
+    assert tracker.watchdog(now=11.2) == (0, 0, 0, 0)
+    assert tracker.watchdog(now=13.0) is None
+
+
+def test_watchdog_is_idle_before_tracking():
+    assert TrackingController().watchdog(now=100.0) is None
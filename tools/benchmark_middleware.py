@@ -0,0 +1,86 @@
+# coding=utf-8
+"""
+Módulo de Benchmark dos Middlewares de Vídeo.
+
+Executa os middlewares de detecção sobre uma fonte gravada (arquivo de vídeo,
+dump H.264 ou diretório de imagens), sem drone, câmera ou janela, e apresenta
+os frames por segundo e o custo de cada middleware.
+
+Exemplo:
+    python -m tools.benchmark_middleware voo.h264 --middleware drone --unthrottled
+"""
+import argparse
+import json
+
+from drone_app.core.abstract_video_drone import VideoSetupFFmpeg
+from drone_app.core.flight_recorder import FlightRecorder
+from drone_app.models.video_capture import OpenCvVideoCapture, FaceDetectMiddleware, FaceEyesDetectMiddleware, \
+    DroneFaceDetectMiddleware, MotionGateMiddleware
+
+
+class BenchmarkDroneManager:
+    """ Substituto do gerenciador do drone que apenas conta os comandos de movimentação. """
+
+    def __init__(self, video_setup, speed=10):
+        self.video_setup = video_setup
+        self.speed = speed
+        self.commands = 0
+        self.recorder = FlightRecorder(enabled=False)
+
+    def rc(self, left_right, forward_back, up_down, yaw):
+        """ Registra o comando sem enviá-lo. """
+        self.commands += 1
+        return self
+
+
+def get_middleware(name, drone_manager):
+    """ Cria o middleware pelo nome. """
+    return {
+        'face': lambda: FaceDetectMiddleware(),
+        'eyes': lambda: FaceEyesDetectMiddleware(),
+        'drone': lambda: DroneFaceDetectMiddleware(drone_manager=drone_manager),
+    }[name]()
+
+
+def run_benchmark(source, middleware='face', divider=3, realtime=False, max_frames=None, gate_threshold=0.0):
+    """
+    Executa o benchmark.
+    :return: relatório do OpenCvVideoCapture.
+    """
+    video_setup = VideoSetupFFmpeg(divider=divider)
+    drone_manager = BenchmarkDroneManager(video_setup)
+    chain = get_middleware(middleware, drone_manager)
+    if gate_threshold:
+        chain = MotionGateMiddleware(next_middleware=chain, threshold=gate_threshold)
+    capture = OpenCvVideoCapture(
+        chain,
+        source=source,
+        headless=True,
+        realtime=realtime,
+        frame_size=(video_setup.frame_x, video_setup.frame_y),
+        max_frames=max_frames,
+    )
+    report = capture.execute()
+    report['drone_commands'] = drone_manager.commands
+    if gate_threshold:
+        report['gate'] = chain.stats
+    return report
+
+
+def main():
+    """ Ponto de entrada da linha de comando. """
+    parser = argparse.ArgumentParser(description='Benchmark dos middlewares de vídeo.')
+    parser.add_argument('source', help='Arquivo de vídeo, dump H.264, diretório de imagens ou índice da câmera.')
+    parser.add_argument('--middleware', choices=('face', 'eyes', 'drone'), default='face')
+    parser.add_argument('--divider', type=int, default=3)
+    parser.add_argument('--max-frames', type=int, default=None)
+    parser.add_argument('--unthrottled', action='store_true', help='Não respeita o ritmo original da fonte.')
+    parser.add_argument('--gate', type=float, default=0.0, help='Limite do MotionGateMiddleware (0 desativa).')
+    args = parser.parse_args()
+    report = run_benchmark(args.source, args.middleware, args.divider, not args.unthrottled, args.max_frames,
+                           args.gate)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
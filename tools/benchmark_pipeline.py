@@ -0,0 +1,348 @@
+# coding=utf-8
+"""
+Módulo de Benchmark do Pipeline de Vídeo.
+
+Gera localmente um vídeo H.264 sintético (960x720, formas em movimento e faces
+sintéticas), envia os access units em pacotes UDP para ``receive_video`` do
+StreamTelloDrone (com o simulador no lugar do drone) e mede, para cada
+configuração (divisor, detecção de faces, clientes de streaming):
+
+- FPS decodificado sustentado e frames perdidos;
+- custo dos middlewares e da codificação JPEG por frame;
+- latência fim a fim (envio do primeiro pacote do frame -> JPEG entregue ao cliente);
+- FPS recebido por cliente.
+
+O índice de cada frame é gravado como um código de barras na faixa superior
+da imagem, o que permite medir a latência após a decodificação e a escala.
+Cada configuração roda em um processo próprio (o gerenciador do drone é Singleton).
+O resultado pode ser salvo como referência e comparado nas execuções seguintes.
+
+Exemplo:
+    python -m tools.benchmark_pipeline --dividers 2,3,4 --faces off,on --clients 1,4 --duration 10
+    python -m tools.benchmark_pipeline --save-baseline
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+from itertools import product
+from threading import Thread, Event
+
+import cv2 as cv
+import numpy as np
+
+WIDTH, HEIGHT, FPS = 960, 720, 30
+PACKET_SIZE = 1460
+VIDEO_PORT = 11111
+BARCODE_BITS = 16
+BARCODE_HEIGHT = 48
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pipeline_baseline.json')
+# Variação tolerada em relação à referência antes de apontar regressão.
+TOLERANCE = 0.10
+
+
+def stamp(frame, index):
+    """ Grava o índice do frame como código de barras na faixa superior. """
+    block = frame.shape[1] // BARCODE_BITS
+    for bit in range(BARCODE_BITS):
+        value = 255 if index >> bit & 1 else 0
+        frame[:BARCODE_HEIGHT, bit * block:(bit + 1) * block] = value
+    return frame
+
+
+def read_stamp(frame):
+    """ Lê o índice gravado por stamp (frame em qualquer escala). """
+    height, width = frame.shape[:2]
+    block = width / BARCODE_BITS
+    row = int(BARCODE_HEIGHT * height / HEIGHT / 2)
+    index = 0
+    for bit in range(BARCODE_BITS):
+        if frame[row, int((bit + 0.5) * block)].mean() > 127:
+            index |= 1 << bit
+    return index
+
+
+def synthetic_frames(count, faces=2, shapes=6, seed=0):
+    """ Gera frames BGR com formas em movimento e faces sintéticas. """
+    rng = np.random.default_rng(seed)
+    background = rng.integers(40, 90, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+    objects = [(rng.uniform(80, WIDTH - 80), rng.uniform(120, HEIGHT - 80), rng.uniform(-6, 6), rng.uniform(-4, 4),
+                tuple(int(c) for c in rng.integers(0, 255, 3))) for _ in range(shapes + faces)]
+    for index in range(count):
+        frame = background.copy()
+        for i, (x, y, vx, vy, color) in enumerate(objects):
+            cx = int(80 + (x + vx * index - 80) % (WIDTH - 160))
+            cy = int(120 + (y + vy * index - 120) % (HEIGHT - 200))
+            if i < shapes:
+                cv.rectangle(frame, (cx - 30, cy - 20), (cx + 30, cy + 20), color, -1)
+            else:
+                # Face sintética: rosto, olhos e boca.
+                cv.ellipse(frame, (cx, cy), (45, 60), 0, 0, 360, (150, 180, 225), -1)
+                cv.circle(frame, (cx - 17, cy - 15), 7, (40, 30, 30), -1)
+                cv.circle(frame, (cx + 17, cy - 15), 7, (40, 30, 30), -1)
+                cv.ellipse(frame, (cx, cy + 25), (18, 8), 0, 0, 180, (60, 60, 150), -1)
+        yield stamp(frame, index)
+
+
+def encode_h264(frames, ffmpeg='ffmpeg', fps=FPS):
+    """ Codifica os frames em H.264 Annex-B (perfil de baixa latência, uma fatia por frame). """
+    command = [ffmpeg, '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{WIDTH}x{HEIGHT}',
+               '-r', str(fps), '-i', 'pipe:0', '-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'zerolatency',
+               '-x264-params', 'slices=1', '-g', str(fps), '-pix_fmt', 'yuv420p', '-f', 'h264', 'pipe:1']
+    proc = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    output = []
+    reader = Thread(target=lambda: output.append(proc.stdout.read()))
+    reader.start()
+    for frame in frames:
+        proc.stdin.write(frame.tobytes())
+    proc.stdin.close()
+    reader.join()
+    proc.wait()
+    return output[0]
+
+
+def access_units(stream):
+    """ Separa o fluxo Annex-B em access units (SPS/PPS/SEI acompanham o frame seguinte). """
+    positions = []
+    i = stream.find(b'\x00\x00\x01')
+    while i >= 0:
+        start = i - 1 if i > 0 and stream[i - 1] == 0 else i
+        positions.append((start, i + 3))
+        i = stream.find(b'\x00\x00\x01', i + 3)
+    units, current = [], b''
+    for n, (start, header) in enumerate(positions):
+        end = positions[n + 1][0] if n + 1 < len(positions) else len(stream)
+        nal = stream[start:end]
+        current += nal
+        if stream[header] & 0x1F in (1, 5):
+            units.append(current)
+            current = b''
+    return units
+
+
+class StreamSender(Thread):
+    """ Classe para enviar os access units em pacotes UDP no ritmo do vídeo. """
+
+    def __init__(self, units, address=('127.0.0.1', VIDEO_PORT), fps=FPS):
+        super().__init__(daemon=True)
+        self._units = units
+        self._address = address
+        self._interval = 1.0 / fps
+        self._stop_event = Event()
+        self.sent_at = {}
+        self.sent = 0
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            start = time.perf_counter()
+            while not self._stop_event.is_set():
+                index = self.sent % len(self._units)
+                delay = start + self.sent * self._interval - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                unit = self._units[index]
+                self.sent_at[index] = time.perf_counter()
+                for offset in range(0, len(unit), PACKET_SIZE):
+                    sock.sendto(unit[offset:offset + PACKET_SIZE], self._address)
+                self.sent += 1
+
+
+def _percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+
+def run_configuration(config, units, ffmpeg, duration, warmup, results):
+    """ Executa uma configuração (processo filho) e publica o relatório em results. """
+    from drone_app.core.abstract_video_drone import VideoSetupFFmpeg
+    from drone_app.core.broadcaster import FrameBroadcaster
+    from drone_app.core.governor import FrameBudgetGovernor, DEFAULT_LADDER
+    from drone_app.models.drone_manager import StreamTelloDrone
+    from drone_app.models.simulator import TelloSimulator
+
+    simulator = TelloSimulator(port=0, time_scale=0).start()
+    video_setup = VideoSetupFFmpeg(divider=config['divider'], executable=ffmpeg, hwaccel=False)
+    # Ponto de operação fixo: a configuração medida não pode ser alterada pelo governador.
+    drone = StreamTelloDrone(host_ip='127.0.0.1', host_port=0, drone_ip='127.0.0.1',
+                             drone_port=simulator.address[1], video_setup=video_setup, vision_workers=0,
+                             governor=FrameBudgetGovernor(ladder=DEFAULT_LADDER[:1]))
+    if config['faces']:
+        drone.enable_face_detect()
+    drone.face_detect_middleware.enable_timings()
+
+    decoded, processed = [], {}
+    current = {}
+    binary_generator = drone.video_binary_generator
+
+    def instrumented_binary():
+        for frame in binary_generator():
+            current['index'], current['decoded'] = read_stamp(frame), time.perf_counter()
+            decoded.append(current['index'])
+            yield frame
+
+    def instrumented_jpeg():
+        for jpeg in drone.video_jpeg_generator():
+            processed[id(jpeg)] = (current['index'], current['decoded'], time.perf_counter())
+            if len(processed) > 256:
+                processed.pop(next(iter(processed)))
+            yield jpeg
+
+    drone.video_binary_generator = instrumented_binary
+    broadcaster = FrameBroadcaster(instrumented_jpeg)
+    sender = StreamSender(units)
+    stop_event = Event()
+    client_stats = [{'frames': 0, 'latencies': []} for _ in range(config['clients'])]
+    measuring = Event()
+
+    def client(stats):
+        seq = 0
+        while not stop_event.is_set():
+            seq, jpeg = broadcaster.wait(seq, timeout=0.5)
+            if jpeg is None or not measuring.is_set():
+                continue
+            received = time.perf_counter()
+            info = processed.get(id(jpeg))
+            stats['frames'] += 1
+            if info and info[0] in sender.sent_at:
+                stats['latencies'].append(received - sender.sent_at[info[0]])
+
+    threads = [Thread(target=client, args=(stats,), daemon=True) for stats in client_stats]
+    sender.start()
+    broadcaster.start()
+    for thread in threads:
+        thread.start()
+    time.sleep(warmup)
+    for middleware in drone.face_detect_middleware.chain():
+        if middleware.timings is not None:
+            middleware.timings.clear()
+    decoded.clear()
+    processing = []
+    sent_before = sender.sent
+    measuring.set()
+    start = time.perf_counter()
+    time.sleep(duration)
+    elapsed = time.perf_counter() - start
+    measuring.clear()
+    stop_event.set()
+    sender.stop()
+    for _, decoded_at, done_at in processed.copy().values():
+        if decoded_at >= start:
+            processing.append(done_at - decoded_at)
+
+    frames = len(decoded)
+    middleware_total = sum(sum(m.timings) for m in drone.face_detect_middleware.chain() if m.timings)
+    middleware_ms = middleware_total / frames * 1000 if frames else None
+    processing_ms = float(np.mean(processing)) * 1000 if processing else None
+    latencies = [v for stats in client_stats for v in stats['latencies']]
+    report = dict(config)
+    report.update({
+        'sent_fps': round((sender.sent - sent_before) / elapsed, 2),
+        'decoded_fps': round(frames / elapsed, 2),
+        'dropped': max(0, (sender.sent - sent_before) - len(set(decoded))),
+        'middleware_ms': None if middleware_ms is None else round(middleware_ms, 3),
+        'jpeg_ms': None if processing_ms is None or middleware_ms is None else round(
+            max(0.0, processing_ms - middleware_ms), 3),
+        'latency_p50_ms': None if not latencies else round(_percentile(latencies, 50) * 1000, 2),
+        'latency_p95_ms': None if not latencies else round(_percentile(latencies, 95) * 1000, 2),
+        'client_fps_min': round(min(s['frames'] for s in client_stats) / elapsed, 2),
+        'client_fps_mean': round(sum(s['frames'] for s in client_stats) / len(client_stats) / elapsed, 2),
+    })
+    results.put(report)
+    results.close()
+    results.join_thread()
+    drone.proc.kill()
+    simulator.stop()
+    # Threads do gerenciador do drone não são daemon: encerra o processo filho diretamente.
+    os._exit(0)
+
+
+def config_key(config):
+    """ Identificação da configuração no arquivo de referência. """
+    return f"divider={config['divider']},faces={'on' if config['faces'] else 'off'},clients={config['clients']}"
+
+
+def compare(reports, baseline, tolerance=TOLERANCE):
+    """
+    Compara com a referência.
+    :return: lista de regressões (texto).
+    """
+    regressions = []
+    higher_is_better = ('decoded_fps', 'client_fps_min', 'client_fps_mean')
+    lower_is_better = ('dropped', 'middleware_ms', 'jpeg_ms', 'latency_p50_ms', 'latency_p95_ms')
+    for report in reports:
+        reference = baseline.get(config_key(report))
+        if not reference:
+            continue
+        for metric in higher_is_better + lower_is_better:
+            value, expected = report.get(metric), reference.get(metric)
+            if value is None or not expected:
+                continue
+            change = (value - expected) / expected
+            if (metric in higher_is_better and change < -tolerance) or (metric in lower_is_better and change > tolerance):
+                regressions.append(f'{config_key(report)} {metric}: {expected} -> {value} ({change:+.0%})')
+    return regressions
+
+
+def _flags(value):
+    return [item.strip().lower() in ('on', '1', 'true', 'yes') for item in value.split(',')]
+
+
+def main(argv=None):
+    """ Ponto de entrada da linha de comando. """
+    parser = argparse.ArgumentParser(description='Benchmark fim a fim do pipeline de vídeo com H.264 sintético.')
+    parser.add_argument('--dividers', default='2,3,4')
+    parser.add_argument('--faces', default='off,on', help='detecção de faces (off,on).')
+    parser.add_argument('--clients', default='1,4', help='quantidade de clientes de streaming.')
+    parser.add_argument('--duration', type=float, default=10.0, help='segundos medidos por configuração.')
+    parser.add_argument('--warmup', type=float, default=3.0)
+    parser.add_argument('--clip-seconds', type=int, default=10, help='duração do vídeo sintético (repetido).')
+    parser.add_argument('--ffmpeg', default='ffmpeg')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    args = parser.parse_args(argv)
+
+    units = access_units(encode_h264(synthetic_frames(args.clip_seconds * FPS), args.ffmpeg))
+    configs = [{'divider': d, 'faces': f, 'clients': c} for d, f, c in product(
+        [int(v) for v in args.dividers.split(',')], _flags(args.faces), [int(v) for v in args.clients.split(',')])]
+
+    context = multiprocessing.get_context('spawn')
+    reports = []
+    for config in configs:
+        results = context.Queue()
+        process = context.Process(target=run_configuration,
+                                  args=(config, units, args.ffmpeg, args.duration, args.warmup, results))
+        process.start()
+        try:
+            report = results.get(timeout=args.duration + args.warmup + 60)
+        except Exception as ex:
+            report = dict(config, error=repr(ex))
+        process.join(10)
+        if process.is_alive():
+            process.kill()
+        reports.append(report)
+        print(json.dumps(report), flush=True)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({config_key(r): r for r in reports if 'error' not in r}, f, indent=2)
+        print(f'Referência salva em {args.baseline}')
+        return 0
+    if not os.path.isfile(args.baseline):
+        print(f'Sem referência em {args.baseline}: execute com --save-baseline para criá-la.')
+        return 0
+    with open(args.baseline, encoding='utf-8') as f:
+        regressions = compare(reports, json.load(f), args.tolerance)
+    for regression in regressions:
+        print(f'REGRESSÃO {regression}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
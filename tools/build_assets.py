@@ -0,0 +1,220 @@
+# coding=utf-8
+"""
+Ferramenta de Compilação dos Assets Estáticos.
+
+Copia os arquivos de ``drone_app/static`` para ``config.ASSET_BUILD_FOLDER``
+com o hash do conteúdo no nome (cache imutável), gera as versões
+pré-comprimidas (gzip e, com a biblioteca brotli instalada, brotli) e grava o
+manifesto lido por ``drone_app.core.assets.AssetManifest``.
+
+As referências internas também são reescritas: ``url(...)`` das folhas de
+estilo e ``sourceMappingURL`` dos scripts apontam para os arquivos com hash,
+e, com ``--inline-limit``, imagens pequenas são embutidas na folha de estilo
+como data URI. Os ícones do jQuery Mobile já vêm embutidos em SVG na folha de
+estilo; os PNG são apenas o fallback de navegadores sem SVG e, por padrão,
+ficam fora dela (embuti-los custa ~12 KB gzip a todos os clientes).
+
+Exemplo:
+    python -m tools.build_assets
+    python -m tools.build_assets --inline-limit 1024 --no-brotli
+"""
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import sys
+
+import config
+from drone_app.core.assets import MANIFEST, ASSETS_PATH, ENCODINGS
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Arquivos que podem referenciar outros assets (compilados por último).
+REFERENCING = ('.css', '.js')
+# Ganho mínimo para manter a versão comprimida (imagens já comprimidas ficam sem ela).
+MIN_RATIO = 0.9
+
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+SOURCE_MAP = re.compile(r'(//# sourceMappingURL=)(\S+)')
+
+
+def fingerprint(data):
+    """ Hash do conteúdo usado no nome do arquivo e no ETag. """
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def mimetype(name):
+    """ Tipo do conteúdo (com charset para texto). """
+    kind = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    if kind.startswith('text/') or kind in ('application/javascript', 'application/json'):
+        kind += '; charset=utf-8'
+    return kind
+
+
+def compress(data, use_brotli=True):
+    """ Versões pré-comprimidas que valem a pena: dict sufixo -> bytes. """
+    versions = {'.gz': gzip.compress(data, 9, mtime=0)}
+    if use_brotli and brotli is not None:
+        versions['.br'] = brotli.compress(data, quality=11)
+    return {suffix: body for suffix, body in versions.items() if len(body) < len(data) * MIN_RATIO}
+
+
+def sources(static_folder, build_folder):
+    """ Arquivos estáticos (nome relativo com '/'), sem a build e os snapshots. """
+    skip = {os.path.realpath(build_folder), os.path.realpath(config.SNAPSHOT_IMAGE_FOLDER)}
+    names = []
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = sorted(d for d in dirs if os.path.realpath(os.path.join(root, d)) not in skip)
+        for file in sorted(files):
+            names.append(os.path.relpath(os.path.join(root, file), static_folder).replace(os.sep, '/'))
+    # Referenciados primeiro, para que o hash dos arquivos que os referenciam já os inclua.
+    return sorted(names, key=lambda name: (posixpath.splitext(name)[1] in REFERENCING, name))
+
+
+class AssetBuilder:
+    """ Classe para compilar os assets e gerar o manifesto. """
+
+    def __init__(self, static_folder=config.STATIC_FOLDER, build_folder=config.ASSET_BUILD_FOLDER,
+                 inline_limit=0, use_brotli=True):
+        self._static = static_folder
+        self._build = build_folder
+        self._inline_limit = inline_limit
+        self._use_brotli = use_brotli
+        self._assets = {}
+        self._data = {}
+        self.inlined = 0
+
+    def _reference(self, name, ref, inline):
+        """ Nova referência (URL com hash ou data URI) para o caminho relativo ao arquivo ``name``. """
+        if ref.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+            return None
+        path = ref.split('#', 1)[0].split('?', 1)[0]
+        target = posixpath.normpath(posixpath.join(posixpath.dirname(name), path))
+        entry = self._assets.get(target)
+        if entry is None:
+            return None
+        data = self._data[target]
+        if inline and entry['mimetype'].startswith('image/') and len(data) <= self._inline_limit:
+            self.inlined += 1
+            return f'data:{entry["mimetype"]};base64,{base64.b64encode(data).decode("ascii")}'
+        return ASSETS_PATH + entry['file']
+
+    def _rewrite(self, name, data):
+        """ Reescreve as referências de folhas de estilo e scripts. """
+        ext = posixpath.splitext(name)[1]
+        if ext not in REFERENCING:
+            return data
+        text = data.decode('utf-8')
+        if ext == '.css':
+            def replace_url(match):
+                url = self._reference(name, match.group(2).strip(), inline=True)
+                return match.group(0) if url is None else f'url({url})'
+            text = CSS_URL.sub(replace_url, text)
+        else:
+            def replace_map(match):
+                url = self._reference(name, match.group(2), inline=False)
+                return match.group(0) if url is None else match.group(1) + url
+            text = SOURCE_MAP.sub(replace_map, text)
+        return text.encode('utf-8')
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def build(self):
+        """
+        Compila todos os assets.
+        :return: dict com o manifesto gravado.
+        """
+        written = {MANIFEST}
+        for name in sources(self._static, self._build):
+            with open(os.path.join(self._static, *name.split('/')), 'rb') as f:
+                data = self._rewrite(name, f.read())
+            digest = fingerprint(data)
+            stem, ext = posixpath.splitext(name)
+            file = f'{stem}.{digest}{ext}'
+            versions = compress(data, self._use_brotli)
+            self._write(os.path.join(self._build, *file.split('/')), data)
+            written.add(file)
+            for suffix, body in versions.items():
+                self._write(os.path.join(self._build, *(file + suffix).split('/')), body)
+                written.add(file + suffix)
+            self._data[name] = data
+            self._assets[name] = {
+                'file': file,
+                'etag': digest,
+                'size': len(data),
+                'mimetype': mimetype(name),
+                'encodings': [encoding for encoding, suffix in ENCODINGS if suffix in versions],
+                'sizes': {suffix: len(body) for suffix, body in versions.items()},
+            }
+        manifest = {'assets': {name: {k: v for k, v in entry.items() if k != 'sizes'}
+                               for name, entry in self._assets.items()}}
+        # O manifesto é substituído de uma vez: o servidor nunca lê um manifesto parcial.
+        temp = os.path.join(self._build, MANIFEST + '.tmp')
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(temp, os.path.join(self._build, MANIFEST))
+        self._remove_stale(written)
+        return manifest
+
+    def _remove_stale(self, written):
+        """ Remove arquivos de builds anteriores. """
+        for root, _, files in os.walk(self._build):
+            for file in files:
+                path = os.path.join(root, file)
+                if os.path.relpath(path, self._build).replace(os.sep, '/') not in written:
+                    os.remove(path)
+
+    def report(self, names=None):
+        """ Tamanhos original, gzip e brotli dos assets (todos ou os informados). """
+        rows = []
+        for name in names or sorted(self._assets):
+            entry = self._assets[name]
+            rows.append({'name': name, 'file': entry['file'], 'size': entry['size'],
+                         'gzip': entry['sizes'].get('.gz'), 'br': entry['sizes'].get('.br')})
+        return rows
+
+
+# Arquivos carregados pelo layout das páginas (primeiro acesso do tablet).
+PAGE_ASSETS = ('css/jquery.mobile-1.4.5.min.css', 'js/jquery-1.11.1.min.js', 'js/jquery.mobile-1.4.5.min.js')
+
+
+def main(argv=None):
+    """ Ponto de entrada da linha de comando. """
+    parser = argparse.ArgumentParser(description='Compila os assets estáticos (hash, gzip/brotli, manifesto).')
+    parser.add_argument('--static', default=config.STATIC_FOLDER)
+    parser.add_argument('--output', default=config.ASSET_BUILD_FOLDER)
+    parser.add_argument('--inline-limit', type=int, default=0,
+                        help='tamanho máximo (bytes) das imagens embutidas nas folhas de estilo (0 desativa).')
+    parser.add_argument('--no-brotli', action='store_true')
+    args = parser.parse_args(argv)
+    if brotli is None and not args.no_brotli:
+        print('brotli não instalado: somente gzip.', file=sys.stderr)
+    builder = AssetBuilder(args.static, args.output, args.inline_limit, not args.no_brotli)
+    manifest = builder.build()
+    page = builder.report(PAGE_ASSETS)
+    print(json.dumps({
+        'assets': len(manifest['assets']),
+        'inlined': builder.inlined,
+        'page': page,
+        'page_bytes': {
+            'original': sum(row['size'] for row in page),
+            'gzip': sum(row['gzip'] or row['size'] for row in page),
+            'br': sum(row['br'] or row['gzip'] or row['size'] for row in page),
+        },
+    }, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+# coding=utf-8
+"""
+Ferramenta de Análise e Reprodução de Voos.
+
+Lê os arquivos do gravador de voo sem decodificar o arquivo inteiro para
+consultas por intervalo de tempo e reproduz os comandos gravados em um
+simulador local (UDP), no tempo original ou acelerado, comparando as respostas.
+
+Exemplos:
+    python -m tools.replay_flight data/flights/flight-20210101-120000-000.bin --index
+    python -m tools.replay_flight voo.bin --start 30 --end 45 --kinds command,reply
+    python -m tools.replay_flight voo.bin --replay --speed 10
+"""
+import argparse
+import json
+import socket
+import sys
+import time
+
+from drone_app.core.flight_recorder import FlightLog, RECORD_NAMES, COMMAND, DATAGRAM, REPLY
+from drone_app.models.simulator import TelloSimulator
+
+KINDS = {name: kind for kind, name in RECORD_NAMES.items()}
+
+
+def print_records(log, start=None, end=None, kinds=None):
+    """ Apresenta os registros do intervalo. """
+    count = 0
+    for record in log.records(start, end, kinds):
+        data = record.data
+        if isinstance(data, bytes):
+            data = data.decode('utf-8', 'replace')
+        print(f'{record.t:10.3f} {RECORD_NAMES[record.kind]:9s} {data}')
+        count += 1
+    return count
+
+
+def commands_with_replies(log, start=None, end=None):
+    """
+    Pares (t, tipo, comando, resposta gravada) na ordem do voo.
+    A resposta de um comando é a primeira recebida antes do próximo comando com resposta.
+    """
+    pairs, pending = [], None
+    for record in log.records(start, end, (COMMAND, DATAGRAM, REPLY)):
+        if record.kind == REPLY:
+            if pending is not None and pending[3] is None:
+                pending[3] = record.data.decode('utf-8', 'replace').strip()
+            continue
+        item = [record.t, record.kind, record.data, None]
+        pairs.append(item)
+        if record.kind == COMMAND:
+            pending = item
+    return pairs
+
+
+def replay(log, speed=1.0, start=None, end=None, port=0, reply_timeout=10.0):
+    """
+    Reproduz os comandos no simulador.
+    :param speed: fator de aceleração (2 = duas vezes mais rápido).
+    :return: dict com o relatório.
+    """
+    simulator = TelloSimulator(port=port, time_scale=1.0 / speed).start()
+    report = {'commands': 0, 'datagrams': 0, 'matches': 0, 'mismatches': [], 'timeouts': 0}
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.bind(('127.0.0.1', 0))
+            pairs = commands_with_replies(log, start, end)
+            origin, began = (pairs[0][0] if pairs else 0.0), time.monotonic()
+            for t, kind, command, recorded in pairs:
+                wait = (t - origin) / speed - (time.monotonic() - began)
+                if wait > 0:
+                    time.sleep(wait)
+                sock.sendto(command.encode('utf-8'), simulator.address)
+                if kind == DATAGRAM:
+                    report['datagrams'] += 1
+                    continue
+                report['commands'] += 1
+                sock.settimeout(reply_timeout / speed)
+                try:
+                    reply = sock.recv(1024).decode('utf-8', 'replace').strip()
+                except socket.timeout:
+                    report['timeouts'] += 1
+                    continue
+                if recorded is None or reply == recorded:
+                    report['matches'] += 1
+                else:
+                    report['mismatches'].append({'t': round(t, 3), 'command': command, 'recorded': recorded,
+                                                 'replayed': reply})
+        report['elapsed'] = round(time.monotonic() - began, 3)
+        report['position'] = [round(v, 1) for v in simulator.position]
+        report['battery'] = round(simulator.battery, 1)
+    finally:
+        simulator.stop()
+    return report
+
+
+def main(argv=None):
+    """ Ponto de entrada da ferramenta. """
+    parser = argparse.ArgumentParser(description='Consulta e reprodução de voos gravados.')
+    parser.add_argument('path', help='arquivo do gravador de voo.')
+    parser.add_argument('--start', type=float, default=None, help='início do intervalo (s desde a decolagem).')
+    parser.add_argument('--end', type=float, default=None, help='fim do intervalo (s).')
+    parser.add_argument('--kinds', default=None, help=f'tipos separados por vírgula ({", ".join(KINDS)}).')
+    parser.add_argument('--index', action='store_true', help='apresenta somente os blocos de índice.')
+    parser.add_argument('--replay', action='store_true', help='reproduz os comandos no simulador local.')
+    parser.add_argument('--speed', type=float, default=1.0, help='aceleração da reprodução.')
+    parser.add_argument('--port', type=int, default=0, help='porta UDP do simulador (0 escolhe uma livre).')
+    args = parser.parse_args(argv)
+
+    log = FlightLog(args.path)
+    if args.index:
+        for block in log.index():
+            print(f'{block.first_t:10.3f} {block.last_t:10.3f} offset={block.offset} registros={block.count}')
+        return 0
+    if args.replay:
+        report = replay(log, args.speed, args.start, args.end, args.port)
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return 1 if report['mismatches'] or report['timeouts'] else 0
+    kinds = [KINDS[k.strip()] for k in args.kinds.split(',')] if args.kinds else None
+    print_records(log, args.start, args.end, kinds)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,223 @@
+# coding=utf-8
+"""
+Módulo de Teste de Resistência (Soak) com Drones Simulados.
+
+Inicia N simuladores UDP (TelloSimulator) em portas distintas e um gerenciador
+TelloDrone para cada um (uma subclasse por índice, pois o gerenciador é
+Singleton por classe), e executa em paralelo as cadeias de decorators de
+decorators.py em ciclos (decolagem, cadeia, pouso) até o fim do tempo pedido.
+A duração dos comandos no simulador é comprimida por ``time_scale``.
+
+O relatório traz vazão, distribuição da latência dos comandos (chamada ->
+resposta), comandos sem resposta, com erro ou que não chegaram ao simulador,
+os estimadores de RTT e a evolução da quantidade de threads e da memória.
+
+Exemplo:
+    python -m tools.soak_drones --drones 8 --duration 600 --time-scale 0.02 --chain clockwise,sides,updown,flip,patrol
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+from decorators import TestClockwiseDecorator, TestSidesDecorator, TestUpDownDecorator, TestFlipDecorator, \
+    TestPatrolDecorator
+from drone_app.core.duration_model import DurationModel
+from drone_app.core.flight_recorder import FlightRecorder
+from drone_app.core.utils import rss_kb
+from drone_app.models.drone_manager import TelloDrone, BasicPatrolMiddleware
+from drone_app.models.simulator import TelloSimulator
+
+DECORATORS = {
+    'clockwise': TestClockwiseDecorator,
+    'sides': TestSidesDecorator,
+    'updown': TestUpDownDecorator,
+    'flip': TestFlipDecorator,
+    'patrol': TestPatrolDecorator,
+}
+
+
+class SoakTelloDrone(TelloDrone):
+    """ Classe do drone do soak: registra a latência e o resultado de cada comando. """
+
+    def __init__(self, *args, **kwargs):
+        self.issued = 0
+        self.results = []
+        self._results_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    @property
+    def pending(self):
+        """ Comandos pedidos que ainda não terminaram (aguardando semáforo ou resposta). """
+        return self.issued - len(self.results)
+
+    def send_command(self, command, blocking=True):
+        with self._results_lock:
+            self.issued += 1
+        return super().send_command(command, blocking)
+
+    def request(self, command):
+        with self._results_lock:
+            self.issued += 1
+        return super().request(command)
+
+    def _send_command(self, command, blocking=True):
+        start = time.monotonic()
+        response = super()._send_command(command, blocking)
+        with self._results_lock:
+            self.results.append((command, time.monotonic() - start, response))
+        return response
+
+
+def drone_class(index):
+    """ Subclasse exclusiva do índice (cada drone simulado precisa da sua instância Singleton). """
+    return type(f'SoakTelloDrone{index}', (SoakTelloDrone,), {})
+
+
+def build_chain(drone, names):
+    """ Monta a cadeia de decorators na ordem informada. """
+    chain = None
+    for name in reversed(names):
+        chain = DECORATORS[name](drone, chain)
+    return chain
+
+
+def fly(drone, names, deadline, cycles):
+    """ Executa ciclos (decolagem, cadeia, pouso) até o prazo. """
+    while time.monotonic() < deadline:
+        drone.request('takeoff')
+        build_chain(drone, names).execute()
+        drone.stop_patrol()
+        # Comandos ainda nas threads de envio precisam sair antes do pouso.
+        while drone.pending and time.monotonic() < deadline + 30:
+            time.sleep(0.05)
+        drone.request('land')
+        cycles.append(1)
+
+
+def _percentiles(values):
+    if not values:
+        return {}
+    array = np.array(values) * 1000
+    result = {f'p{q}_ms': round(float(np.percentile(array, q)), 2) for q in (50, 90, 95, 99)}
+    result['max_ms'] = round(float(array.max()), 2)
+    return result
+
+
+def _growth(samples, index):
+    """ Inclinação (por minuto) do recurso amostrado. """
+    points = [(t, s[index]) for t, *s in samples if s[index] is not None]
+    if len(points) < 2:
+        return None
+    t, v = np.array(points, dtype=np.float64).T
+    return round(float(np.polyfit(t / 60.0, v, 1)[0]), 3)
+
+
+def run_soak(drones=4, duration=60.0, time_scale=0.05, chain=('clockwise', 'sides', 'updown', 'flip', 'patrol'),
+             base_port=0, sample_interval=1.0):
+    """
+    Executa o soak.
+    :return: dict com o relatório.
+    """
+    # Singletons compartilhados: nada é gravado em disco durante o soak.
+    FlightRecorder(enabled=False)
+    DurationModel(None)
+    simulators = [TelloSimulator(port=base_port + i if base_port else 0, time_scale=time_scale).start()
+                  for i in range(drones)]
+    threads_before, rss_before = threading.active_count(), rss_kb()
+    managers = []
+    for i, simulator in enumerate(simulators):
+        manager = drone_class(i)(host_ip='127.0.0.1', host_port=0, drone_ip='127.0.0.1',
+                                 drone_port=simulator.address[1], patrol_middleware=BasicPatrolMiddleware())
+        manager.time_scale = time_scale
+        managers.append(manager)
+
+    samples = []
+    stop_sampling = threading.Event()
+    start = time.monotonic()
+
+    def sample():
+        while not stop_sampling.is_set():
+            samples.append((time.monotonic() - start, threading.active_count(), rss_kb(),
+                            sum(len(m.results) for m in managers)))
+            stop_sampling.wait(sample_interval)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    deadline = start + duration
+    cycles = [[] for _ in managers]
+    workers = [threading.Thread(target=fly, args=(m, list(chain), deadline, c), daemon=True)
+               for m, c in zip(managers, cycles)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.monotonic() - start
+    stop_sampling.set()
+    sampler.join()
+
+    report = {'drones': drones, 'duration': round(elapsed, 2), 'time_scale': time_scale, 'chain': list(chain),
+              'per_drone': []}
+    latencies = []
+    totals = {'issued': 0, 'ok': 0, 'error': 0, 'no_reply': 0, 'received': 0, 'cycles': 0}
+    for manager, simulator, done in zip(managers, simulators, cycles):
+        results = list(manager.results)
+        values = [latency for _, latency, _ in results]
+        latencies += values
+        item = {
+            'port': simulator.address[1],
+            'cycles': len(done),
+            'issued': manager.issued,
+            'ok': sum(1 for _, _, r in results if r is not None and not r.startswith('error')),
+            'error': sum(1 for _, _, r in results if r and r.startswith('error')),
+            'no_reply': sum(1 for _, _, r in results if r is None),
+            # Comandos que chegaram ao simulador (a diferença para 'issued' foi perdida antes do envio).
+            'received': len([c for c in simulator.received if not c.startswith('rc ')]),
+            'rtt': manager.rtt_stats(),
+        }
+        item.update(_percentiles(values))
+        for key in totals:
+            totals[key] += item[key] if key != 'cycles' else len(done)
+        report['per_drone'].append(item)
+    totals['throughput'] = round(len(latencies) / elapsed, 2) if elapsed else 0.0
+    totals.update(_percentiles(latencies))
+    report['total'] = totals
+    report['resources'] = {
+        'threads_before': threads_before,
+        'threads_max': max((s[1] for s in samples), default=None),
+        'threads_end': threading.active_count(),
+        'threads_per_min': _growth(samples, 0),
+        'rss_kb_before': rss_before,
+        'rss_kb_max': max((s[2] for s in samples if s[2] is not None), default=None),
+        'rss_kb_end': rss_kb(),
+        'rss_kb_per_min': _growth(samples, 1),
+    }
+    for simulator in simulators:
+        simulator.stop()
+    return report
+
+
+def main(argv=None):
+    """ Ponto de entrada da linha de comando. """
+    parser = argparse.ArgumentParser(description='Soak das cadeias de decorators em drones simulados.')
+    parser.add_argument('--drones', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=60.0, help='segundos de execução.')
+    parser.add_argument('--time-scale', type=float, default=0.05, help='compressão da duração dos comandos.')
+    parser.add_argument('--chain', default=','.join(DECORATORS), help=f'decorators ({", ".join(DECORATORS)}).')
+    parser.add_argument('--base-port', type=int, default=0, help='primeira porta dos simuladores (0: livres).')
+    parser.add_argument('--sample', type=float, default=1.0, help='intervalo de amostragem de threads/memória.')
+    args = parser.parse_args(argv)
+    report = run_soak(args.drones, args.duration, args.time_scale, args.chain.split(','), args.base_port,
+                      args.sample)
+    print(json.dumps(report, indent=2))
+    sys.stdout.flush()
+    # As threads de recepção dos gerenciadores não são daemon.
+    os._exit(1 if report['total']['no_reply'] or report['total']['issued'] != report['total']['received'] else 0)
+
+
+if __name__ == '__main__':
+    main()
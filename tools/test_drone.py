@@ -14,7 +14,7 @@ def test_drone_manager():
     drone_manager = TelloDrone(patrol_middleware=BasicPatrolMiddleware())
     try:
         drone_manager.set_speed(100).takeoff()
-        time.sleep(7)
+        time.sleep(drone_manager.predict_duration('speed 100') + drone_manager.predict_duration('takeoff'))
 
         TestClockwiseDecorator(
             drone_manager, TestSidesDecorator(
@@ -0,0 +1,16 @@
+# coding=utf-8
+"""
+Ponto de entrada WSGI para servidores com vários workers.
+
+Os workers não abrem os sockets do drone: configure ``BROKER_ADDRESS`` e
+inicie o broker antes (``python -m drone_app.models.broker``).
+Exemplo:
+    gunicorn -w 4 --threads 8 wsgi:app
+"""
+import config
+import drone_app.controllers.server  # noqa: F401 (registra as rotas)
+from drone_app.core.logs import setup_logging
+
+setup_logging()
+
+app = config.app